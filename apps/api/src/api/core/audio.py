@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import io
+import threading
+import time
+import wave
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional
+
+from api.core import metrics
+from api.db.connection import ToolError
+from api.router.scheduler import submit_with_context
+from api.settings import AudioSettings, load_audio_settings
+
+if TYPE_CHECKING:
+    from api.router.provider import LLMProvider
+
+
+_chunk_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="audio-chunk")
+
+
+class AudioTranscriber:
+    """Transcribe uploads from memory, caching by content hash.
+
+    WAV recordings longer than chunk_seconds are split on frame boundaries and
+    the pieces are transcribed in parallel. Compressed containers (m4a, mp3,
+    webm) cannot be split without a decoder and are sent whole.
+    """
+
+    def __init__(self, settings: AudioSettings) -> None:
+        self._settings = settings
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[str, str] = OrderedDict()
+
+    def transcribe(self, provider: LLMProvider, audio_base64: str) -> str:
+        raw = _decode_base64(audio_base64)
+        digest = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            cached = self._cache.get(digest)
+            if cached is not None:
+                self._cache.move_to_end(digest)
+                metrics.incr("audio.cache_hits")
+                return cached
+
+        started = time.perf_counter()
+        filename = sniff_audio_filename(raw)
+        chunks = _split_wav(raw, self._settings.chunk_seconds) if filename.endswith(".wav") else None
+        if chunks and len(chunks) > 1:
+            metrics.incr("audio.chunked")
+            text = self._transcribe_chunks(provider, chunks)
+        else:
+            text = provider.transcribe_audio(raw, filename)
+        metrics.observe("audio.transcribe_ms", (time.perf_counter() - started) * 1000)
+
+        with self._lock:
+            self._cache[digest] = text
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self._settings.cache_size:
+                self._cache.popitem(last=False)
+        return text
+
+    def _transcribe_chunks(self, provider: LLMProvider, chunks: list[bytes]) -> str:
+        parts: list[str] = []
+        limit = max(self._settings.max_parallel, 1)
+        # Submit in windows so one long recording cannot occupy every worker.
+        for start in range(0, len(chunks), limit):
+            window = chunks[start : start + limit]
+            futures = [
+                submit_with_context(_chunk_executor, provider.transcribe_audio, chunk, f"part{start + i}.wav")
+                for i, chunk in enumerate(window)
+            ]
+            parts.extend(f.result() for f in futures)
+        return "".join(p.strip() for p in parts if p.strip())
+
+
+def sniff_audio_filename(raw: bytes) -> str:
+    if raw[:4] == b"RIFF" and raw[8:12] == b"WAVE":
+        return "audio.wav"
+    if raw[:3] == b"ID3" or raw[:2] in {b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"}:
+        return "audio.mp3"
+    if raw[:4] == b"OggS":
+        return "audio.ogg"
+    if raw[:4] == b"\x1aE\xdf\xa3":
+        return "audio.webm"
+    if raw[:4] == b"fLaC":
+        return "audio.flac"
+    return "audio.m4a"
+
+
+def _split_wav(raw: bytes, chunk_seconds: int) -> Optional[list[bytes]]:
+    if chunk_seconds <= 0:
+        return None
+    try:
+        with wave.open(io.BytesIO(raw), "rb") as src:
+            params = src.getparams()
+            frames_per_chunk = params.framerate * chunk_seconds
+            if params.nframes <= frames_per_chunk:
+                return None
+            chunks: list[bytes] = []
+            while True:
+                frames = src.readframes(frames_per_chunk)
+                if not frames:
+                    break
+                out = io.BytesIO()
+                with wave.open(out, "wb") as dst:
+                    dst.setparams(params)
+                    dst.writeframes(frames)
+                chunks.append(out.getvalue())
+    except (wave.Error, EOFError):
+        return None
+    return chunks
+
+
+def _decode_base64(value: str) -> bytes:
+    if value.startswith("data:") and "," in value:
+        value = value.split(",", 1)[1]
+    try:
+        return base64.b64decode(value, validate=False)
+    except (binascii.Error, ValueError) as exc:
+        raise ToolError("invalid_param", "audio must be base64 string") from exc
+
+
+_transcriber: Optional[AudioTranscriber] = None
+_transcriber_lock = threading.Lock()
+
+
+def get_audio_transcriber() -> AudioTranscriber:
+    global _transcriber
+    if _transcriber is None:
+        with _transcriber_lock:
+            if _transcriber is None:
+                _transcriber = AudioTranscriber(load_audio_settings())
+    return _transcriber
+
+
+def transcribe_audio(provider: LLMProvider, audio_base64: str) -> str:
+    return get_audio_transcriber().transcribe(provider, audio_base64)
+
+
+__all__ = [
+    "AudioTranscriber",
+    "get_audio_transcriber",
+    "sniff_audio_filename",
+    "transcribe_audio",
+]
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from api.core import metrics
+from api.db.connection import ToolError
+
+# Below this many seconds a stage is not worth starting.
+MIN_STAGE_SECONDS = 0.05
+
+
+class Deadline:
+    """Absolute per-request time budget, measured on the monotonic clock."""
+
+    def __init__(self, seconds: float) -> None:
+        self._budget = seconds
+        self._expires_at = time.monotonic() + seconds
+
+    @property
+    def budget(self) -> float:
+        return self._budget
+
+    def remaining(self) -> float:
+        return max(self._expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= MIN_STAGE_SECONDS
+
+    def timeout(self, cap: float, stage: str) -> float:
+        """Timeout for one stage: the remaining budget, but never more than cap.
+
+        Raises deadline_exceeded when nothing useful is left.
+        """
+        remaining = self.remaining()
+        if remaining <= MIN_STAGE_SECONDS:
+            metrics.incr("deadline.exceeded", stage=stage)
+            raise ToolError("deadline_exceeded", "request deadline exceeded", {"stage": stage})
+        return min(cap, remaining)
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: float | None) -> Iterator[Optional[Deadline]]:
+    """Install a deadline for the calls made inside the block (None = unbounded)."""
+    if seconds is None or seconds <= 0:
+        yield current_deadline()
+        return
+    deadline = Deadline(seconds)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def stage_timeout(cap: float, stage: str) -> float:
+    """cap, shortened to the current request's remaining budget if there is one."""
+    deadline = _current.get()
+    if deadline is None:
+        return cap
+    return deadline.timeout(cap, stage)
+
+
+def remaining_budget() -> Optional[float]:
+    deadline = _current.get()
+    return None if deadline is None else deadline.remaining()
+
+
+__all__ = [
+    "Deadline",
+    "current_deadline",
+    "deadline_scope",
+    "remaining_budget",
+    "stage_timeout",
+]
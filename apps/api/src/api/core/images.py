@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import io
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from api.core import metrics
+from api.db.connection import ToolError
+from api.settings import ImageSettings, load_image_settings
+
+_MAGIC = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    digest: str
+    mime_type: str
+    base64: str
+    original_bytes: int
+    prepared_bytes: int
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+
+class ImagePreprocessor:
+    """Decode, downscale, re-encode and strip EXIF once per distinct image.
+
+    Results are cached by content hash so the same upload is not reprocessed
+    for classify and route, or when the client resends it.
+    """
+
+    def __init__(self, settings: ImageSettings) -> None:
+        self._settings = settings
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[str, PreparedImage] = OrderedDict()
+
+    @property
+    def settings(self) -> ImageSettings:
+        return self._settings
+
+    def prepare(self, image_base64s: list[str]) -> list[PreparedImage]:
+        return [self.prepare_one(item) for item in image_base64s]
+
+    def prepare_one(self, image_base64: str) -> PreparedImage:
+        raw = _decode_base64(image_base64)
+        digest = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            cached = self._cache.get(digest)
+            if cached is not None:
+                self._cache.move_to_end(digest)
+                metrics.incr("images.cache_hits")
+                return cached
+
+        started = time.perf_counter()
+        prepared = self._process(raw, digest)
+        metrics.observe("images.preprocess_ms", (time.perf_counter() - started) * 1000)
+        metrics.incr("images.bytes_in", prepared.original_bytes)
+        metrics.incr("images.bytes_out", prepared.prepared_bytes)
+
+        with self._lock:
+            self._cache[digest] = prepared
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self._settings.cache_size:
+                self._cache.popitem(last=False)
+        return prepared
+
+    def _process(self, raw: bytes, digest: str) -> PreparedImage:
+        try:
+            with Image.open(io.BytesIO(raw)) as img:
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail((self._settings.max_edge, self._settings.max_edge))
+                img = _to_rgb(img)
+                out = io.BytesIO()
+                # No exif= argument: metadata is dropped on re-encode.
+                img.save(out, format="JPEG", quality=self._settings.jpeg_quality, optimize=True)
+        except Image.DecompressionBombError as exc:
+            # Over Pillow's MAX_IMAGE_PIXELS: decoding would exhaust memory,
+            # and the raw upload is no safer to forward to the model.
+            metrics.incr("images.decompression_bomb")
+            raise ToolError("invalid_param", "image dimensions too large", {"digest": digest}) from exc
+        except (UnidentifiedImageError, OSError, ValueError):
+            metrics.incr("images.decode_failed")
+            return PreparedImage(
+                digest=digest,
+                mime_type=sniff_image_mime(raw),
+                base64=base64.b64encode(raw).decode("ascii"),
+                original_bytes=len(raw),
+                prepared_bytes=len(raw),
+            )
+        data = out.getvalue()
+        return PreparedImage(
+            digest=digest,
+            mime_type="image/jpeg",
+            base64=base64.b64encode(data).decode("ascii"),
+            original_bytes=len(raw),
+            prepared_bytes=len(data),
+        )
+
+
+def sniff_image_mime(raw: bytes) -> str:
+    for magic, mime in _MAGIC:
+        if raw.startswith(magic):
+            return mime
+    if raw[:4] == b"RIFF" and raw[8:12] == b"WEBP":
+        return "image/webp"
+    if raw[4:12] in {b"ftypheic", b"ftypheix", b"ftypmif1"}:
+        return "image/heic"
+    return "image/jpeg"
+
+
+def image_data_url(image: str) -> str:
+    """Return image as a data URL, sniffing the MIME type of bare base64."""
+    if image.startswith("data:"):
+        return image
+    try:
+        head = base64.b64decode(image[:24] + "=" * (-len(image[:24]) % 4))
+    except (binascii.Error, ValueError):
+        head = b""
+    return f"data:{sniff_image_mime(head)};base64,{image}"
+
+
+def _decode_base64(value: str) -> bytes:
+    if value.startswith("data:") and "," in value:
+        value = value.split(",", 1)[1]
+    try:
+        return base64.b64decode(value, validate=False)
+    except (binascii.Error, ValueError) as exc:
+        raise ToolError("invalid_param", "images must be list of base64 strings") from exc
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    if img.mode == "RGB":
+        return img
+    if img.mode in {"RGBA", "LA"} or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[-1])
+        return background
+    return img.convert("RGB")
+
+
+_preprocessor: Optional[ImagePreprocessor] = None
+_preprocessor_lock = threading.Lock()
+
+
+def get_image_preprocessor() -> ImagePreprocessor:
+    global _preprocessor
+    if _preprocessor is None:
+        with _preprocessor_lock:
+            if _preprocessor is None:
+                _preprocessor = ImagePreprocessor(load_image_settings())
+    return _preprocessor
+
+
+def prepare_images(image_base64s: list[str] | None) -> list[PreparedImage]:
+    if not image_base64s:
+        return []
+    return get_image_preprocessor().prepare(image_base64s)
+
+
+__all__ = [
+    "ImagePreprocessor",
+    "PreparedImage",
+    "get_image_preprocessor",
+    "image_data_url",
+    "prepare_images",
+    "sniff_image_mime",
+]
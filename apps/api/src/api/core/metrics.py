@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Any, Optional
+
+DEFAULT_WINDOW = 512
+
+
+class MetricsRegistry:
+    """In-process counters and rolling timing samples, exposed via /router/health."""
+
+    def __init__(self, window: int = DEFAULT_WINDOW) -> None:
+        self._window = window
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {}
+        self._gauges: dict[str, float] = {}
+        self._samples: dict[str, deque[float]] = {}
+        self._sample_counts: dict[str, int] = {}
+
+    def incr(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = deque(maxlen=self._window)
+                self._samples[key] = samples
+            samples.append(value)
+            self._sample_counts[key] = self._sample_counts.get(key, 0) + 1
+
+    def counter(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0.0)
+
+    def percentile(self, name: str, q: float, **labels: Any) -> Optional[float]:
+        with self._lock:
+            samples = self._samples.get(_key(name, labels))
+            if not samples:
+                return None
+            ordered = sorted(samples)
+        return _percentile(ordered, q)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            samples = {k: sorted(v) for k, v in self._samples.items()}
+            counts = dict(self._sample_counts)
+        timings: dict[str, dict[str, Any]] = {}
+        for key, ordered in samples.items():
+            if not ordered:
+                continue
+            timings[key] = {
+                "count": counts.get(key, len(ordered)),
+                "p50": _round(_percentile(ordered, 0.5)),
+                "p90": _round(_percentile(ordered, 0.9)),
+                "p99": _round(_percentile(ordered, 0.99)),
+                "max": _round(ordered[-1]),
+            }
+        return {"counters": counters, "gauges": gauges, "timings": timings}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._samples.clear()
+            self._sample_counts.clear()
+
+
+def _key(name: str, labels: dict[str, Any]) -> str:
+    if not labels:
+        return name
+    parts = ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+    return f"{name}{{{parts}}}"
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    if len(ordered) == 1:
+        return ordered[0]
+    pos = q * (len(ordered) - 1)
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    frac = pos - lower
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * frac
+
+
+def _round(value: float) -> float:
+    return round(value, 2)
+
+
+_REGISTRY = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    return _REGISTRY
+
+
+def incr(name: str, value: float = 1.0, **labels: Any) -> None:
+    _REGISTRY.incr(name, value, **labels)
+
+
+def set_gauge(name: str, value: float, **labels: Any) -> None:
+    _REGISTRY.set_gauge(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    _REGISTRY.observe(name, value, **labels)
+
+
+__all__ = ["MetricsRegistry", "get_metrics", "incr", "observe", "set_gauge"]
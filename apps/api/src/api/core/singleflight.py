@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+from api.core import metrics
+from api.core.deadline import remaining_budget
+from api.db.connection import ToolError
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    __slots__ = ("done", "result", "error", "finished_at")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+        self.finished_at: Optional[float] = None
+
+
+class SingleFlight(Generic[T]):
+    """Run at most one computation per key and share its result.
+
+    Callers arriving while a computation for the same key is in flight wait for
+    it. Successful results stay shared for window_seconds after completion so
+    a retry that lands just after the first request finishes gets the same
+    answer; failures are handed to concurrent waiters and then forgotten.
+    A waiter gives up with deadline_exceeded when its own request budget runs
+    out, however long the leader still takes.
+    """
+
+    def __init__(self, name: str, window_seconds: float = 10.0) -> None:
+        self._name = name
+        self._window = window_seconds
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call[T]] = {}
+
+    def do(self, key: str, fn: Callable[[], T], **labels: Any) -> T:
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            metrics.set_gauge(f"{self._name}.inflight", self._inflight())
+
+        if not leader:
+            metrics.incr(f"{self._name}.coalesced", **labels)
+            if not call.done.wait(remaining_budget()):
+                metrics.incr("deadline.exceeded", stage=self._name)
+                raise ToolError("deadline_exceeded", "request deadline exceeded", {"stage": self._name})
+            if call.error is not None:
+                raise call.error
+            return call.result  # type: ignore[return-value]
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            with self._lock:
+                self._calls.pop(key, None)
+            raise
+        finally:
+            call.finished_at = time.monotonic()
+            call.done.set()
+            with self._lock:
+                metrics.set_gauge(f"{self._name}.inflight", self._inflight())
+        return call.result
+
+    def _evict(self, now: float) -> None:
+        expired = [
+            key
+            for key, call in self._calls.items()
+            if call.finished_at is not None and now - call.finished_at > self._window
+        ]
+        for key in expired:
+            del self._calls[key]
+
+    def _inflight(self) -> int:
+        return sum(1 for call in self._calls.values() if call.finished_at is None)
+
+
+__all__ = ["SingleFlight"]
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import re
+
+_HINT_PREFIX_RE = re.compile(r"^\[TYPE_HINT:[a-z_]+\]\s*")
+_CJK_RE = re.compile(r"[　-ヿ㐀-鿿＀-￯]+")
+_WORD_RE = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+
+# Stands in for every number, so "午饭 32" and "午饭 45" share a term.
+NUMBER_TERM = "#"
+
+
+def lexical_terms(text: str) -> frozenset[str]:
+    """CJK character bigrams plus lowercase ASCII words; numbers collapse to NUMBER_TERM.
+
+    Bigrams need no word segmentation, which Chinese input lacks, and still
+    match "工资到账" against "工资 到账".
+    """
+    text = strip_type_hint(text).lower()
+    terms: set[str] = set()
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            terms.add(run)
+        terms.update(run[i : i + 2] for i in range(len(run) - 1))
+    for word in _WORD_RE.findall(text):
+        terms.add(NUMBER_TERM if word[0].isdigit() else word)
+    return frozenset(terms)
+
+
+def strip_type_hint(text: str) -> str:
+    """Drop the orchestrator's injected [TYPE_HINT:...] prefix."""
+    return _HINT_PREFIX_RE.sub("", text.strip())
+
+
+__all__ = ["NUMBER_TERM", "lexical_terms", "strip_type_hint"]
@@ -3,9 +3,10 @@ from __future__ import annotations
 import json
 import os
 import threading
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Iterable, Optional
+from typing import Any, Callable, Collection, Iterable, Iterator, Optional
 from zoneinfo import ZoneInfo
 
 import psycopg
@@ -31,11 +32,18 @@ class ToolError(Exception):
         return f"{self.code}: {self.message}"
 
 
+STATEMENT_TIMEOUT_FLOOR_MS = 2000
+
+
 class DBCursor:
-    def __init__(self, cursor: psycopg.Cursor) -> None:
+    def __init__(self, cursor: psycopg.Cursor, owner: Optional[DBConnection] = None) -> None:
         self._cursor = cursor
+        # Connection whose request budget bounds this cursor's statements.
+        self._owner = owner
 
     def execute(self, sql: str, params: Iterable[Any] | None = None) -> DBCursor:
+        if self._owner is not None:
+            self._owner._apply_statement_timeout()
         self._cursor.execute(_adapt_sql(sql), tuple(params or ()))
         return self
 
@@ -50,24 +58,57 @@ class DBCursor:
     def lastrowid(self) -> Optional[int]:
         return None
 
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
 
 class DBConnection:
     def __init__(self, conn: psycopg.Connection) -> None:
         self._conn = conn
+        self._statement_timeout_ms: Optional[int] = None
+        self._after_commit: list[Callable[[], None]] = []
 
     def execute(self, sql: str, params: Iterable[Any] | None = None) -> DBCursor:
+        self._apply_statement_timeout()
         cur = self._conn.cursor()
         cur.execute(_adapt_sql(sql), tuple(params or ()))
         return DBCursor(cur)
 
     def cursor(self) -> DBCursor:
-        return DBCursor(self._conn.cursor())
+        return DBCursor(self._conn.cursor(), self)
+
+    def _apply_statement_timeout(self) -> None:
+        # Late import: api.core.deadline depends on this module for ToolError.
+        from api.core.deadline import remaining_budget
+
+        remaining = remaining_budget()
+        if remaining is None:
+            return
+        # Keep a floor so drafts produced by an LLM call that used up the
+        # budget can still be saved.
+        timeout_ms = max(int(remaining * 1000), STATEMENT_TIMEOUT_FLOOR_MS)
+        current = self._statement_timeout_ms
+        if current is not None and (timeout_ms == current or timeout_ms > current // 2):
+            return
+        self._conn.execute("SELECT set_config('statement_timeout', %s, false)", (str(timeout_ms),))
+        self._statement_timeout_ms = timeout_ms
+
+    def on_commit(self, callback: Callable[[], None]) -> None:
+        """Run callback once the current transaction commits; dropped if it rolls back."""
+        self._after_commit.append(callback)
 
     def commit(self) -> None:
         self._conn.commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
 
     def rollback(self) -> None:
         self._conn.rollback()
+        self._after_commit.clear()
+        # A set_config made inside the rolled back transaction is undone too.
+        self._statement_timeout_ms = None
 
     def close(self) -> None:
         self._conn.close()
@@ -78,9 +119,9 @@ class DBConnection:
     def __exit__(self, exc_type, exc, tb) -> None:
         try:
             if exc is None:
-                self._conn.commit()
+                self.commit()
             else:
-                self._conn.rollback()
+                self.rollback()
         finally:
             self._conn.close()
 
@@ -108,6 +149,17 @@ def get_connection() -> DBConnection:
     return DBConnection(conn)
 
 
+@contextmanager
+def use_connection(conn: DBConnection | None = None) -> Iterator[DBConnection]:
+    """conn as given, leaving its transaction to the caller, or a fresh one committed on exit."""
+    if conn is not None:
+        yield conn
+        return
+    with get_connection() as own:
+        ensure_tables(own)
+        yield own
+
+
 def ensure_tables(conn: DBConnection) -> None:
     global _tables_ready
     if _tables_ready:
@@ -207,7 +259,8 @@ def ensure_tables(conn: DBConnection) -> None:
                 result_json TEXT,
                 undo_token TEXT,
                 commit_id TEXT,
-                created_at TEXT NOT NULL
+                created_at TEXT NOT NULL,
+                input_text TEXT
             )
             """
         )
@@ -217,6 +270,32 @@ def ensure_tables(conn: DBConnection) -> None:
         cur.execute(
             "CREATE INDEX IF NOT EXISTS idx_orchestrator_undo_token ON orchestrator_logs(undo_token)"
         )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS orchestrator_responses (
+                request_id TEXT PRIMARY KEY,
+                response_json TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                expires_at TIMESTAMPTZ NOT NULL
+            )
+            """
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_orchestrator_responses_expires_at ON orchestrator_responses(expires_at)"
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS draft_field_stats (
+                tool_name TEXT NOT NULL,
+                token TEXT NOT NULL,
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                weight DOUBLE PRECISION NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (tool_name, token, field, value)
+            )
+            """
+        )
 
         cur.execute(
             """
@@ -254,6 +333,9 @@ def ensure_tables(conn: DBConnection) -> None:
         cur.execute("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS commit_id TEXT")
         cur.execute("ALTER TABLE events ADD COLUMN IF NOT EXISTS commit_id TEXT")
         cur.execute("ALTER TABLE orchestrator_logs ADD COLUMN IF NOT EXISTS commit_id TEXT")
+        cur.execute("ALTER TABLE orchestrator_logs ADD COLUMN IF NOT EXISTS input_text TEXT")
+        cur.execute("ALTER TABLE orchestrator_logs ADD COLUMN IF NOT EXISTS superseded_at TEXT")
+        cur.execute("ALTER TABLE orchestrator_responses ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'ready'")
         cur.execute("ALTER TABLE finance_settings ADD COLUMN IF NOT EXISTS balance_base DOUBLE PRECISION")
         cur.execute("ALTER TABLE finance_settings ADD COLUMN IF NOT EXISTS balance_base_at TEXT")
         cur.execute("ALTER TABLE finance_settings ADD COLUMN IF NOT EXISTS currency TEXT NOT NULL DEFAULT 'CNY'")
@@ -336,11 +418,10 @@ def require_non_empty_str(value: Any, field: str) -> str:
     return value.strip()
 
 
-def require_enum(value: Any, field: str, allowed: Iterable[str]) -> str:
+def require_enum(value: Any, field: str, allowed: Collection[str]) -> str:
     s = require_non_empty_str(value, field)
-    allowed_list = list(allowed)
-    if s not in allowed_list:
-        raise ToolError("invalid_param", f"{field} must be one of {allowed_list}")
+    if s not in allowed:
+        raise ToolError("invalid_param", f"{field} must be one of {list(allowed)}")
     return s
 
 
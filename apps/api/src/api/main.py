@@ -1,8 +1,10 @@
 ﻿from __future__ import annotations
 
 import secrets
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.requests import Request
 from fastapi.responses import JSONResponse
@@ -12,12 +14,23 @@ from api.routes.dashboard import router as dashboard_router
 from api.routes.events import router as events_router
 from api.routes.finance import router as finance_router
 from api.routes.router_health import router as router_health_router
+from api.router.provider import load_provider_from_config, reset_provider
 from api.routes.tasks import router as tasks_router
 from api.settings import load_server_settings
 
 server_settings = load_server_settings()
 
-app = FastAPI(title="AI Companion API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    provider = load_provider_from_config()
+    if provider is not None:
+        await run_in_threadpool(provider.warm_up)
+    yield
+    reset_provider()
+
+
+app = FastAPI(title="AI Companion API", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=server_settings.cors_allow_origins,
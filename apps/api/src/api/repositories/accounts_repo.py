@@ -44,6 +44,21 @@ class AccountsRepository:
         row = cur.fetchone()
         return dict(row) if row else None
 
+    def get_accounts(self, account_ids: list[int]) -> list[dict[str, Any]]:
+        if not account_ids:
+            return []
+        cur = self._conn.cursor()
+        cur.execute(
+            """
+            SELECT id, name, kind, subtype, currency, balance_base, balance_base_at,
+                   is_active, created_at, updated_at
+            FROM accounts
+            WHERE id = ANY(?)
+            """,
+            (list(account_ids),),
+        )
+        return [dict(row) for row in cur.fetchall()]
+
     def insert_account(
         self,
         *,
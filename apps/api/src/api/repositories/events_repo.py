@@ -96,6 +96,14 @@ class EventRepository:
             (is_deleted, updated_at, event_id),
         )
 
+    def update_is_deleted_many(
+        self, event_ids: list[int], is_deleted: int, updated_at: str
+    ) -> list[sqlite3.Row]:
+        return self._conn.execute(
+            "UPDATE events SET is_deleted = ?, updated_at = ? WHERE id = ANY(?) AND is_deleted <> ? RETURNING *",
+            (is_deleted, updated_at, list(event_ids), is_deleted),
+        ).fetchall()
+
     def update_data_json(self, event_id: int, data_json: str, updated_at: str) -> None:
         self._conn.execute(
             "UPDATE events SET data_json = ?, updated_at = ? WHERE id = ?",
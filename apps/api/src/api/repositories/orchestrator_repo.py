@@ -3,6 +3,21 @@
 import time
 from typing import Any, Optional
 
+# Namespace (first key) of the advisory locks taken on draft ids.
+_DRAFT_LOCK_CLASS = 7301
+_LOG_COLUMNS = (
+    "kind",
+    "request_id",
+    "draft_id",
+    "tool_name",
+    "payload_json",
+    "result_json",
+    "undo_token",
+    "commit_id",
+    "created_at",
+    "input_text",
+)
+
 
 class OrchestratorRepository:
     def __init__(self, conn) -> None:
@@ -20,12 +35,17 @@ class OrchestratorRepository:
         undo_token: Optional[str],
         commit_id: Optional[str],
         created_at: str,
+        input_text: Optional[str] = None,
+        commit: bool = True,
     ) -> int:
-        cur = self._execute_write(
+        """Append a log row; with commit=False it joins the caller's open transaction."""
+        execute = self._execute_write if commit else self._conn.execute
+        cur = execute(
             """
             INSERT INTO orchestrator_logs (
-                kind, request_id, draft_id, tool_name, payload_json, result_json, undo_token, commit_id, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                kind, request_id, draft_id, tool_name, payload_json, result_json, undo_token, commit_id, created_at,
+                input_text
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             RETURNING id
             """,
             (
@@ -38,11 +58,41 @@ class OrchestratorRepository:
                 undo_token,
                 commit_id,
                 created_at,
+                input_text,
             ),
         )
         row = cur.fetchone()
         return int(row["id"])
 
+    def insert_logs(self, rows: list[dict[str, Any]], commit: bool = True) -> None:
+        """Append many log rows (dicts keyed like insert_log's arguments) in one statement."""
+        if not rows:
+            return
+        placeholders = ",".join("(" + ", ".join("?" for _ in _LOG_COLUMNS) + ")" for _ in rows)
+        params = tuple(row.get(column) for row in rows for column in _LOG_COLUMNS)
+        sql = f"INSERT INTO orchestrator_logs ({', '.join(_LOG_COLUMNS)}) VALUES {placeholders}"
+        if commit:
+            self._execute_write(sql, params)
+        else:
+            self._conn.execute(sql, params)
+
+    def lock_drafts(self, draft_ids: list[str]) -> None:
+        """Block until no other transaction is committing any of draft_ids.
+
+        Transaction-scoped advisory locks, released on commit or rollback.
+        Taken in sorted order so overlapping batches cannot deadlock.
+        """
+        if not draft_ids:
+            return
+        self._conn.execute(
+            """
+            SELECT pg_advisory_xact_lock(?, hashtext(draft_id))
+            FROM unnest(?::text[]) WITH ORDINALITY AS ids(draft_id, n)
+            ORDER BY n
+            """,
+            (_DRAFT_LOCK_CLASS, sorted(set(draft_ids))),
+        ).fetchall()
+
     def get_drafts_by_ids(self, draft_ids: list[str]) -> list[dict[str, Any]]:
         if not draft_ids:
             return []
@@ -60,10 +110,32 @@ class OrchestratorRepository:
         ).fetchone()
         return row
 
-    def update_draft_payload(self, draft_id: str, payload_json: str) -> None:
-        self._execute_write(
-            "UPDATE orchestrator_logs SET payload_json = ? WHERE kind = 'draft' AND draft_id = ?",
-            (payload_json, draft_id),
+    def update_draft_payload(self, draft_id: str, payload_json: str, expected_json: Optional[str] = None) -> bool:
+        """Set a draft's payload_json; with expected_json, only while the row still holds it.
+
+        Returns whether a row was updated.
+        """
+        if expected_json is None:
+            cur = self._execute_write(
+                "UPDATE orchestrator_logs SET payload_json = ? WHERE kind = 'draft' AND draft_id = ?",
+                (payload_json, draft_id),
+            )
+        else:
+            cur = self._execute_write(
+                "UPDATE orchestrator_logs SET payload_json = ? "
+                "WHERE kind = 'draft' AND draft_id = ? AND payload_json = ?",
+                (payload_json, draft_id, expected_json),
+            )
+        return cur.rowcount > 0
+
+    def supersede_drafts(self, draft_ids: list[str], superseded_at: str) -> None:
+        """Retire drafts replaced by another draft set; part of the caller's transaction."""
+        if not draft_ids:
+            return
+        placeholders = ",".join("?" for _ in draft_ids)
+        self._conn.execute(
+            f"UPDATE orchestrator_logs SET superseded_at = ? WHERE kind = 'draft' AND draft_id IN ({placeholders})",
+            (superseded_at, *draft_ids),
         )
 
     def get_commits_by_undo_token(self, undo_token: str) -> list[dict[str, Any]]:
@@ -87,6 +159,98 @@ class OrchestratorRepository:
         ).fetchone()
         return row
 
+    def get_commits_by_draft_ids(self, draft_ids: list[str]) -> dict[str, dict[str, Any]]:
+        """Latest commit row of each of draft_ids that has one, keyed by draft_id."""
+        if not draft_ids:
+            return {}
+        rows = self._conn.execute(
+            """
+            SELECT DISTINCT ON (draft_id) *
+            FROM orchestrator_logs
+            WHERE kind = 'commit' AND draft_id = ANY(?)
+            ORDER BY draft_id, id DESC
+            """,
+            (list(draft_ids),),
+        ).fetchall()
+        return {row["draft_id"]: row for row in rows}
+
+    def get_commit_examples(self, limit: int) -> list[dict[str, Any]]:
+        rows = self._conn.execute(
+            """
+            SELECT request_id, input_text, tool_name, payload_json
+            FROM orchestrator_logs
+            WHERE kind = 'commit' AND input_text IS NOT NULL AND input_text <> ''
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+        return list(rows)
+
+    def get_response(self, request_id: str) -> Optional[dict[str, Any]]:
+        """The unexpired row for request_id; status is pending, ready or failed."""
+        row = self._conn.execute(
+            "SELECT * FROM orchestrator_responses WHERE request_id = ? AND expires_at > now()",
+            (request_id,),
+        ).fetchone()
+        return row
+
+    def save_response(
+        self, *, request_id: str, response_json: str, created_at: str, ttl_seconds: int
+    ) -> None:
+        self._execute_write(
+            """
+            INSERT INTO orchestrator_responses (request_id, response_json, created_at, expires_at, status)
+            VALUES (?, ?, ?, now() + (? * INTERVAL '1 second'), 'ready')
+            ON CONFLICT (request_id) DO UPDATE SET
+                response_json = EXCLUDED.response_json,
+                created_at = EXCLUDED.created_at,
+                expires_at = EXCLUDED.expires_at,
+                status = 'ready'
+            """,
+            (request_id, response_json, created_at, ttl_seconds),
+        )
+
+    def reserve_response(
+        self, *, request_id: str, response_json: str, created_at: str, ttl_seconds: int
+    ) -> bool:
+        """Claim request_id as pending, holding response_json until the result is saved.
+
+        Atomic across connections and worker processes. Returns False when
+        the id is already pending or ready; an expired or failed id can be
+        claimed again.
+        """
+        cur = self._execute_write(
+            """
+            INSERT INTO orchestrator_responses (request_id, response_json, created_at, expires_at, status)
+            VALUES (?, ?, ?, now() + (? * INTERVAL '1 second'), 'pending')
+            ON CONFLICT (request_id) DO UPDATE SET
+                response_json = EXCLUDED.response_json,
+                created_at = EXCLUDED.created_at,
+                expires_at = EXCLUDED.expires_at,
+                status = 'pending'
+            WHERE orchestrator_responses.expires_at <= now() OR orchestrator_responses.status = 'failed'
+            RETURNING request_id
+            """,
+            (request_id, response_json, created_at, ttl_seconds),
+        )
+        return cur.fetchone() is not None
+
+    def fail_response(self, request_id: str, response_json: str) -> None:
+        """Mark a pending request_id failed; response_json carries the error."""
+        self._execute_write(
+            "UPDATE orchestrator_responses SET status = 'failed', response_json = ? "
+            "WHERE request_id = ? AND status = 'pending'",
+            (response_json, request_id),
+        )
+
+    def purge_expired_responses(self) -> int:
+        cur = self._execute_write(
+            "DELETE FROM orchestrator_responses WHERE expires_at <= now()",
+            (),
+        )
+        return max(cur.rowcount, 0)
+
     def _execute_write(
         self, sql: str, params: tuple[Any, ...], retries: int = 4, base_sleep: float = 0.05
     ):
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import Any
+
+
+class PredictionRepository:
+    def __init__(self, conn) -> None:
+        self._conn = conn
+
+    def list_field_stats(self) -> list[dict[str, Any]]:
+        cur = self._conn.cursor()
+        cur.execute(
+            """
+            SELECT tool_name, token, field, value, weight
+            FROM draft_field_stats
+            WHERE weight > 0
+            """
+        )
+        return [dict(row) for row in cur.fetchall()]
+
+    def add_field_weights(self, rows: list[tuple[str, str, str, str, float]], updated_at: str) -> None:
+        """Add weight to (tool_name, token, field, value) counters, creating missing ones."""
+        if not rows:
+            return
+        placeholders = ",".join("(?, ?, ?, ?, ?, ?)" for _ in rows)
+        params: list[Any] = []
+        for tool_name, token, field, value, weight in rows:
+            params.extend((tool_name, token, field, value, weight, updated_at))
+        cur = self._conn.cursor()
+        cur.execute(
+            f"""
+            INSERT INTO draft_field_stats (tool_name, token, field, value, weight, updated_at)
+            VALUES {placeholders}
+            ON CONFLICT (tool_name, token, field, value) DO UPDATE SET
+                weight = draft_field_stats.weight + EXCLUDED.weight,
+                updated_at = EXCLUDED.updated_at
+            """,
+            tuple(params),
+        )
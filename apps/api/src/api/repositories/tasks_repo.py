@@ -63,6 +63,14 @@ class TaskRepository:
         params = list(fields.values()) + [task_id]
         self._conn.execute(f"UPDATE tasks SET {assignments} WHERE id = ?", params)
 
+    def update_is_deleted_many(
+        self, task_ids: list[int], is_deleted: int, updated_at: str
+    ) -> list[sqlite3.Row]:
+        return self._conn.execute(
+            "UPDATE tasks SET is_deleted = ?, updated_at = ? WHERE id = ANY(?) AND is_deleted <> ? RETURNING *",
+            (is_deleted, updated_at, list(task_ids), is_deleted),
+        ).fetchall()
+
     def search(
         self,
         *,
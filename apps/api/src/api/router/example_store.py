@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+
+from api.core import metrics
+from api.core.text_terms import lexical_terms, strip_type_hint
+from api.router.prompt_compiler import estimate_tokens
+from api.settings import ExampleSettings, load_llm_settings
+
+logger = logging.getLogger("api.router")
+
+_TOOL_INTENTS = {
+    "create_expense": "expense",
+    "create_income": "income",
+    "create_transfer": "transfer",
+    "create_task": "task",
+    "create_lifelog": "lifelog",
+    "create_meal": "meal",
+}
+# Bookkeeping and absolute-time fields: copying them from an old record
+# would teach the model wrong timestamps or bookkeeping keys.
+_DROPPED_ARGUMENTS = {
+    "idempotency_key",
+    "commit_id",
+    "source",
+    "confidence",
+    "happened_at",
+    "due_at",
+    "remind_at",
+}
+# Real account ids never reach the prompt. Each distinct id in an example is
+# swapped for a stand-in (101, 102, ...) like the static router examples use,
+# so a transfer still shows two different accounts. Amounts are kept: they
+# repeat what the input text already says.
+_ACCOUNT_ARGUMENTS = ("account_id", "from_account_id", "to_account_id")
+_PLACEHOLDER_ACCOUNT_BASE = 101
+
+
+@dataclass(frozen=True)
+class FewShotExample:
+    text: str
+    intent: str
+    tools: frozenset[str]
+    rendered: str
+    est_tokens: int
+    terms: frozenset[str]
+
+
+class ExampleStore:
+    """Few-shot examples built from committed drafts, indexed by character bigrams.
+
+    Commits are what the user actually confirmed (after any edits), so they
+    are the best available labels for how this user's inputs should route.
+    The index is rebuilt from orchestrator_logs every refresh_seconds, or on
+    the next lookup after invalidate().
+    """
+
+    def __init__(self, settings: ExampleSettings) -> None:
+        self._settings = settings
+        self._lock = threading.Lock()
+        self._examples: list[FewShotExample] = []
+        self._index: dict[str, list[int]] = {}
+        self._loaded_at: Optional[float] = None
+        self._refreshing = False
+
+    @property
+    def settings(self) -> ExampleSettings:
+        return self._settings
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+    def select(self, text: str, allowed_tools: Iterable[str] | None = None) -> list[FewShotExample]:
+        """Up to k examples most similar to text that fit in token_budget."""
+        if not self._settings.enabled or self._settings.k <= 0:
+            return []
+        self._refresh_if_stale()
+        query = lexical_terms(text)
+        if not query:
+            return []
+        allowed = frozenset(allowed_tools) if allowed_tools is not None else None
+        with self._lock:
+            examples = self._examples
+            index = self._index
+        overlap: dict[int, int] = defaultdict(int)
+        for term in query:
+            for i in index.get(term, ()):
+                overlap[i] += 1
+
+        scored: list[tuple[float, int]] = []
+        for i, shared in overlap.items():
+            example = examples[i]
+            if allowed is not None and not example.tools <= allowed:
+                continue
+            score = shared / (len(query) + len(example.terms) - shared)
+            if score >= self._settings.min_similarity:
+                scored.append((score, i))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+
+        chosen: list[FewShotExample] = []
+        seen: set[str] = set()
+        budget = self._settings.token_budget
+        for _, i in scored:
+            example = examples[i]
+            if example.rendered in seen or example.est_tokens > budget:
+                continue
+            chosen.append(example)
+            seen.add(example.rendered)
+            budget -= example.est_tokens
+            if len(chosen) >= self._settings.k:
+                break
+        metrics.observe("router.examples_selected", len(chosen))
+        return chosen
+
+    def load(self, rows: Iterable[dict[str, Any]]) -> None:
+        """Rebuild the index from commit rows, newest first."""
+        examples = _examples_from_rows(rows, self._settings.max_examples)
+        index: dict[str, list[int]] = defaultdict(list)
+        for i, example in enumerate(examples):
+            for term in example.terms:
+                index[term].append(i)
+        with self._lock:
+            self._examples = examples
+            self._index = dict(index)
+            self._loaded_at = time.monotonic()
+        metrics.set_gauge("router.examples_indexed", len(examples))
+
+    def _refresh_if_stale(self) -> None:
+        with self._lock:
+            loaded_at = self._loaded_at
+            fresh = loaded_at is not None and time.monotonic() - loaded_at < self._settings.refresh_seconds
+            # Concurrent lookups keep using the current index while one thread reloads.
+            if fresh or self._refreshing:
+                return
+            self._refreshing = True
+        try:
+            rows = _fetch_commit_rows(self._settings.max_examples * 3)
+        except Exception as exc:  # noqa: BLE001
+            # Keep serving the previous index; routing works without examples.
+            logger.warning("few-shot example refresh failed: %s", exc)
+            with self._lock:
+                self._loaded_at = time.monotonic()
+            return
+        else:
+            self.load(rows)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+def render_examples(examples: list[FewShotExample]) -> str:
+    if not examples:
+        return ""
+    body = "\n\n".join(e.rendered for e in examples)
+    return (
+        "Similar inputs this user confirmed before (tool_calls only; emit matching cards as usual):\n"
+        + body
+    )
+
+
+def _examples_from_rows(rows: Iterable[dict[str, Any]], limit: int) -> list[FewShotExample]:
+    # One commit row per tool call; calls from the same input form one example.
+    grouped: dict[tuple[Optional[str], str], list[dict[str, Any]]] = {}
+    for row in rows:
+        text = strip_type_hint(row.get("input_text") or "")
+        if not text or row.get("tool_name") not in _TOOL_INTENTS:
+            continue
+        key = (row.get("request_id"), text)
+        if key not in grouped:
+            if len(grouped) >= limit:
+                break
+            grouped[key] = []
+        grouped[key].append(row)
+
+    examples: list[FewShotExample] = []
+    for (_, text), calls in grouped.items():
+        tool_calls: list[dict[str, Any]] = []
+        placeholders: dict[Any, int] = {}
+        for row in reversed(calls):
+            try:
+                payload = json.loads(row.get("payload_json") or "{}")
+            except json.JSONDecodeError:
+                continue
+            arguments = {k: v for k, v in payload.items() if k not in _DROPPED_ARGUMENTS and v is not None}
+            for field in _ACCOUNT_ARGUMENTS:
+                if field in arguments:
+                    arguments[field] = placeholders.setdefault(
+                        arguments[field], _PLACEHOLDER_ACCOUNT_BASE + len(placeholders)
+                    )
+            tool_calls.append({"name": row["tool_name"], "arguments": arguments})
+        if not tool_calls:
+            continue
+        tools = frozenset(c["name"] for c in tool_calls)
+        intent = "multi_event" if len(tool_calls) > 1 else _TOOL_INTENTS[tool_calls[0]["name"]]
+        rendered = (
+            f"User input: {text}\n"
+            f"intent: {intent}\n"
+            f"tool_calls: {json.dumps(tool_calls, ensure_ascii=False, separators=(',', ':'))}"
+        )
+        examples.append(
+            FewShotExample(
+                text=text,
+                intent=intent,
+                tools=tools,
+                rendered=rendered,
+                est_tokens=estimate_tokens(rendered),
+                terms=lexical_terms(text),
+            )
+        )
+    return examples
+
+
+def _fetch_commit_rows(limit: int) -> list[dict[str, Any]]:
+    # Late imports: the repository layer is not needed unless examples are on.
+    from api.db.connection import ensure_tables, get_connection
+    from api.repositories.orchestrator_repo import OrchestratorRepository
+
+    with get_connection() as conn:
+        ensure_tables(conn)
+        return OrchestratorRepository(conn).get_commit_examples(limit)
+
+
+_store: Optional[ExampleStore] = None
+_store_lock = threading.Lock()
+
+
+def get_example_store() -> ExampleStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                settings = load_llm_settings()
+                _store = ExampleStore(settings.examples if settings is not None else ExampleSettings())
+    return _store
+
+
+__all__ = [
+    "ExampleStore",
+    "FewShotExample",
+    "get_example_store",
+    "render_examples",
+]
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import re
+from typing import Iterable, Optional
+
+_TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+
+
+class JSONObjectExtractor:
+    """Incrementally scans model output for the first complete top-level JSON object.
+
+    Text before the opening brace (prose, code fences) is skipped, and braces
+    inside string literals are ignored, so chunks can be fed as they arrive.
+    """
+
+    def __init__(self) -> None:
+        self._buf: list[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._done: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self._done is not None
+
+    @property
+    def result(self) -> Optional[str]:
+        return self._done
+
+    def feed(self, chunk: str) -> Optional[str]:
+        if self._done is not None:
+            return self._done
+        for ch in chunk:
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._buf = [ch]
+                continue
+            self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._done = "".join(self._buf)
+                    return self._done
+        return None
+
+
+class JSONArrayItemStream:
+    """Incrementally yields the objects of selected top-level arrays as each one closes.
+
+    For model output like {"tool_calls": [{...}, {...}], ...} fed chunk by
+    chunk, feed() returns ("tool_calls", "<object text>") pairs for items
+    completed by that chunk, long before the whole document is valid JSON.
+    Only objects directly inside an array under one of keys are reported.
+    """
+
+    def __init__(self, keys: Iterable[str]) -> None:
+        self._keys = frozenset(keys)
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string: list[str] = []
+        self._last_string: Optional[str] = None
+        self._array_key: Optional[str] = None
+        self._item: list[str] = []
+
+    def feed(self, chunk: str) -> list[tuple[str, str]]:
+        items: list[tuple[str, str]] = []
+        for ch in chunk:
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                continue
+            capturing = self._depth >= 3 and self._array_key is not None
+            if capturing:
+                self._item.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = "".join(self._string)
+                elif self._depth == 1:
+                    self._string.append(ch)
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string = []
+            elif ch in "{[":
+                if self._depth == 1 and ch == "[" and self._last_string in self._keys:
+                    # Keys are the last string seen before the array opens.
+                    self._array_key = self._last_string
+                elif self._depth == 2 and ch == "{" and self._array_key is not None:
+                    self._item = [ch]
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 2 and ch == "}" and capturing:
+                    items.append((self._array_key, "".join(self._item)))
+                    self._item = []
+                elif self._depth == 1:
+                    self._array_key = None
+        return items
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    return JSONObjectExtractor().feed(text)
+
+
+def strip_trailing_commas(text: str) -> str:
+    return _TRAILING_COMMA_RE.sub(r"\1", text)
+
+
+__all__ = ["JSONArrayItemStream", "JSONObjectExtractor", "extract_json_object", "strip_trailing_commas"]
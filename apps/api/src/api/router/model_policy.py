@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from api.router.provider import LLMProvider
+from api.settings import ModelPolicySettings, load_llm_settings
+
+FAST = "fast"
+MAIN = "main"
+
+
+@dataclass(frozen=True)
+class RouteFeatures:
+    text_chars: int
+    image_count: int
+    has_type_hint: bool
+    # Confidence of the deterministic parser's single draft, if it produced exactly one.
+    fast_path_confidence: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class ModelChoice:
+    model: str
+    tier: str
+    reason: str
+
+
+def choose_route_model(
+    provider: LLMProvider,
+    features: RouteFeatures,
+    settings: ModelPolicySettings | None = None,
+) -> ModelChoice:
+    """Pick fast_model for short, text-only inputs and the main model otherwise."""
+    settings = settings or get_model_policy_settings()
+
+    def main(reason: str) -> ModelChoice:
+        return ModelChoice(model=provider.model, tier=MAIN, reason=reason)
+
+    def fast(reason: str) -> ModelChoice:
+        return ModelChoice(model=provider.fast_model, tier=FAST, reason=reason)
+
+    if not settings.enabled:
+        return main("disabled")
+    if provider.fast_model == provider.model:
+        return main("single_model")
+    if features.image_count > 0:
+        return main("images")
+    if features.text_chars > settings.fast_max_chars:
+        return main("long_text")
+    if features.has_type_hint:
+        return fast("type_hint")
+    if (
+        features.fast_path_confidence is not None
+        and features.fast_path_confidence >= settings.fast_path_min_confidence
+    ):
+        return fast("fast_path")
+    if features.text_chars <= settings.short_chars:
+        return fast("short_text")
+    return main("ambiguous")
+
+
+_policy_settings: Optional[ModelPolicySettings] = None
+_policy_lock = threading.Lock()
+
+
+def get_model_policy_settings() -> ModelPolicySettings:
+    global _policy_settings
+    if _policy_settings is None:
+        with _policy_lock:
+            if _policy_settings is None:
+                settings = load_llm_settings()
+                _policy_settings = settings.routing if settings is not None else ModelPolicySettings()
+    return _policy_settings
+
+
+__all__ = [
+    "FAST",
+    "MAIN",
+    "ModelChoice",
+    "RouteFeatures",
+    "choose_route_model",
+    "get_model_policy_settings",
+]
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from api.tools.registry import get_tool
+
+PROMPTS_DIR = Path(__file__).resolve().parents[5] / "packages" / "prompts"
+ROUTER_FRAGMENTS_DIR = PROMPTS_DIR / "router"
+
+_prompt_cache: dict[Path, tuple[int, str]] = {}
+_prompt_cache_lock = threading.Lock()
+
+_CJK_RE = re.compile(r"[　-ヿ㐀-鿿＀-￯]")
+
+# Tools offered in the "Allowed tools" block, in prompt order. Their
+# signatures come from the tool registry (packages/schemas/tools).
+_PROMPT_TOOLS: tuple[str, ...] = (
+    "create_expense",
+    "create_income",
+    "create_transfer",
+    "create_task",
+    "create_lifelog",
+    "create_meal",
+)
+
+
+@dataclass(frozen=True)
+class _PromptSpec:
+    tools: tuple[str, ...]
+    sections: tuple[str, ...]
+    examples: tuple[str, ...]
+    finance: bool
+
+
+_FULL_SPEC = _PromptSpec(
+    tools=_PROMPT_TOOLS,
+    sections=("expense", "income", "transfer", "repayment", "task", "lifelog", "meal"),
+    examples=("transfer", "repayment", "expense", "income", "multi_event"),
+    finance=True,
+)
+
+_HINT_SPECS: dict[str, _PromptSpec] = {
+    "expense": _PromptSpec(("create_expense",), ("expense",), ("expense",), False),
+    "income": _PromptSpec(("create_income",), ("income",), ("income",), False),
+    "transfer": _PromptSpec(("create_transfer",), ("transfer",), ("transfer",), True),
+    "repayment": _PromptSpec(("create_transfer",), ("transfer", "repayment"), ("repayment",), True),
+    "task": _PromptSpec(("create_task",), ("task",), (), False),
+    "lifelog": _PromptSpec(("create_lifelog",), ("lifelog",), (), False),
+    "meal": _PromptSpec(("create_meal",), ("meal",), (), False),
+}
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    text: str
+    type_hint: str | None
+    tools: tuple[str, ...]
+    est_tokens: int
+
+
+def load_prompt(path: Path) -> str:
+    """Return prompt text, re-reading the file only when its mtime changes."""
+    mtime = path.stat().st_mtime_ns
+    cached = _prompt_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _prompt_cache_lock:
+        cached = _prompt_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        text = path.read_text(encoding="utf-8")
+        _prompt_cache[path] = (mtime, text)
+        return text
+
+
+def compile_router_prompt(type_hint: str | None = None, format_example_only: bool = False) -> CompiledPrompt:
+    """Assemble the router prompt from fragments under packages/prompts/router.
+
+    Without a hint (or with an unknown one) every tool, rule section and
+    example is included. A hint narrows the prompt to that tool's signature,
+    rules and examples; the output contract and shared rules stay the same.
+    format_example_only keeps just the first canned example as a reference
+    for the output shape, for callers that supply their own examples.
+    """
+    spec = _HINT_SPECS.get(type_hint or "", _FULL_SPEC)
+    hint = type_hint if spec is not _FULL_SPEC else None
+
+    parts = [
+        _fragment("header.txt"),
+        "Allowed tools:\n" + "".join(f"- {get_tool(name).signature}\n" for name in spec.tools),
+        _fragment("contract.txt"),
+    ]
+    if spec.finance:
+        parts.append(_fragment("finance.txt"))
+    parts.append("Tool-specific rules:\n")
+    parts.extend(_fragment(f"tools/{name}.txt") for name in spec.sections)
+    parts.append(_fragment("footer.txt"))
+    examples = spec.examples[:1] if format_example_only else spec.examples
+    if examples:
+        parts.append("Examples:\n" + "\n".join(_fragment(f"examples/{name}.txt") for name in examples))
+
+    text = "\n".join(parts)
+    return CompiledPrompt(text=text, type_hint=hint, tools=spec.tools, est_tokens=estimate_tokens(text))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, one per four other characters."""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _fragment(name: str) -> str:
+    return load_prompt(ROUTER_FRAGMENTS_DIR / name)
+
+
+__all__ = ["CompiledPrompt", "compile_router_prompt", "estimate_tokens", "load_prompt"]
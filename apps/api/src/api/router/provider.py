@@ -1,17 +1,26 @@
 ﻿from __future__ import annotations
 
-import base64
+import importlib.util
 import json
 import logging
 import os
-import tempfile
-import urllib.request
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
-from typing import Any, Optional
+from typing import Any, Callable, Iterator, Optional
+
+import httpx
 from openai import OpenAI
 
+from api.core import metrics
+from api.core.deadline import remaining_budget, stage_timeout
+from api.core.images import image_data_url
+from api.core.metrics import get_metrics
 from api.db.connection import ToolError
-from api.settings import LLMSettings, load_llm_settings
+from api.router.scheduler import LLMScheduler, get_llm_scheduler, submit_with_context
+from api.settings import CircuitBreakerSettings, HTTPPoolSettings, LLMSettings, load_llm_settings
 
 logger = logging.getLogger("api.llm")
 
@@ -23,6 +32,14 @@ class LLMConfig:
     model: str
     fast_model: str
     timeout_seconds: int = 30
+    structured_output: bool = True
+    name: str = "primary"
+    http: HTTPPoolSettings | None = None
+
+
+# Failures caused on our side (request budget spent, local queue full).
+# They neither count against an endpoint's breaker nor trigger failover.
+LOCAL_LLM_ERRORS = frozenset({"deadline_exceeded", "llm_queue_timeout"})
 
 
 class LLMProvider:
@@ -32,24 +49,222 @@ class LLMProvider:
         user_input: str,
         image_base64s: list[str] | None = None,
         model: str | None = None,
+        response_format: dict[str, Any] | None = None,
+        context: str | None = None,
+        max_tokens: int | None = None,
+        stop: list[str] | None = None,
+        stage: str | None = None,
     ) -> str:
         raise NotImplementedError
 
-    def transcribe_audio(self, audio_base64: str) -> str:
+    def generate_stream(
+        self,
+        prompt: str,
+        user_input: str,
+        image_base64s: list[str] | None = None,
+        model: str | None = None,
+        response_format: dict[str, Any] | None = None,
+        context: str | None = None,
+        max_tokens: int | None = None,
+        stop: list[str] | None = None,
+        stage: str | None = None,
+    ) -> Iterator[str]:
+        """Yield the completion in pieces as it is produced.
+
+        Providers without token streaming yield the whole completion at once.
+        """
+        yield self.generate(
+            prompt,
+            user_input,
+            image_base64s=image_base64s,
+            model=model,
+            response_format=response_format,
+            context=context,
+            max_tokens=max_tokens,
+            stop=stop,
+            stage=stage,
+        )
+
+    def transcribe_audio(self, audio: bytes, filename: str = "audio.m4a") -> str:
+        raise NotImplementedError
+
+    @property
+    def model(self) -> str:
         raise NotImplementedError
 
     @property
     def fast_model(self) -> str:
         raise NotImplementedError
 
+    @property
+    def available(self) -> bool:
+        return True
+
+    def warm_up(self) -> None:
+        return None
+
+    def close(self) -> None:
+        return None
+
+
+class CircuitBreaker:
+    """Per-endpoint breaker over a rolling window of call outcomes.
+
+    Errors and calls slower than slow_call_ms count as failures. Once the
+    failure rate crosses the threshold the breaker opens and calls are
+    rejected immediately; after open_seconds a single probe is let through
+    (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, settings: CircuitBreakerSettings | None = None) -> None:
+        self._name = name
+        self._settings = settings or CircuitBreakerSettings()
+        self._lock = threading.Lock()
+        self._outcomes: deque[bool] = deque(maxlen=max(self._settings.window, 1))
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+        metrics.incr("llm.breaker_rejected", provider=self._name)
+        return False
+
+    def record(self, ok: bool, latency_ms: float) -> None:
+        failed = not ok or latency_ms > self._settings.slow_call_ms
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if failed:
+                    self._open()
+                else:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                    logger.warning("LLM circuit for %s closed", self._name)
+                return
+            if self._state == self.OPEN:
+                return
+            self._outcomes.append(failed)
+            if len(self._outcomes) < self._settings.min_calls:
+                return
+            if sum(self._outcomes) / len(self._outcomes) >= self._settings.failure_rate:
+                self._open()
+
+    def release(self) -> None:
+        """End a call whose outcome says nothing about the endpoint.
+
+        A half-open probe cut short by the caller's deadline frees the probe
+        slot, so the next call can probe instead of being rejected forever.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            self._maybe_half_open()
+            failures = sum(self._outcomes)
+            total = len(self._outcomes)
+            return {
+                "name": self._name,
+                "state": self._state,
+                "failure_rate": round(failures / total, 3) if total else 0.0,
+                "window_calls": total,
+            }
+
+    def _open(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        metrics.incr("llm.breaker_opened", provider=self._name)
+        logger.warning("LLM circuit for %s opened", self._name)
+
+    def _maybe_half_open(self) -> None:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self._settings.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str, settings: CircuitBreakerSettings | None = None) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, settings)
+            _breakers[name] = breaker
+        return breaker
+
+
+def circuit_breaker_states() -> list[dict[str, Any]]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [b.snapshot() for b in breakers]
+
+
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+_RETRYABLE_STATUS = {429, 503}
+
 
 class OpenAICompatibleProvider(LLMProvider):
-    def __init__(self, config: LLMConfig) -> None:
+    def __init__(
+        self,
+        config: LLMConfig,
+        breaker: CircuitBreaker | None = None,
+        scheduler: LLMScheduler | None = None,
+    ) -> None:
         self._config = config
+        self._breaker = breaker or get_circuit_breaker(config.name)
+        self._scheduler = scheduler or get_llm_scheduler(config.name)
+        self._http = _build_http_client(config.http or HTTPPoolSettings(), config.timeout_seconds)
         self._client = OpenAI(
             api_key=config.api_key,
-            base_url=config.base_url
+            base_url=config.base_url,
+            http_client=self._http,
         )
+        self._structured_output = config.structured_output
+
+    @property
+    def name(self) -> str:
+        return self._config.name
+
+    @property
+    def model(self) -> str:
+        return self._config.model
+
+    @property
+    def timeout_seconds(self) -> int:
+        return self._config.timeout_seconds
+
+    @property
+    def supports_structured_output(self) -> bool:
+        return self._structured_output
+
+    @property
+    def available(self) -> bool:
+        return self._breaker.state != CircuitBreaker.OPEN
 
     def generate(
         self,
@@ -57,74 +272,376 @@ class OpenAICompatibleProvider(LLMProvider):
         user_input: str,
         image_base64s: list[str] | None = None,
         model: str | None = None,
+        response_format: dict[str, Any] | None = None,
+        context: str | None = None,
+        max_tokens: int | None = None,
+        stop: list[str] | None = None,
+        stage: str | None = None,
+    ) -> str:
+        return self._guarded(
+            lambda: self._generate(
+                prompt,
+                user_input,
+                image_base64s,
+                model,
+                response_format,
+                context,
+                max_tokens=max_tokens,
+                stop=stop,
+                stage=stage,
+            ),
+            stage=stage,
+        )
+
+    def generate_stream(
+        self,
+        prompt: str,
+        user_input: str,
+        image_base64s: list[str] | None = None,
+        model: str | None = None,
+        response_format: dict[str, Any] | None = None,
+        context: str | None = None,
+        max_tokens: int | None = None,
+        stop: list[str] | None = None,
+        stage: str | None = None,
+    ) -> Iterator[str]:
+        if not self._breaker.allow():
+            raise ToolError("llm_unavailable", "LLM circuit open", {"provider": self.name})
+        started = time.perf_counter()
+        first = True
+        try:
+            for delta in self._generate_stream(
+                prompt,
+                user_input,
+                image_base64s,
+                model,
+                response_format,
+                context,
+                max_tokens=max_tokens,
+                stop=stop,
+                stage=stage,
+            ):
+                if first:
+                    first = False
+                    metrics.observe(
+                        "llm.first_token_ms",
+                        (time.perf_counter() - started) * 1000,
+                        provider=self.name,
+                    )
+                yield delta
+        except GeneratorExit:
+            # The consumer stopped reading; the backend itself was fine.
+            self._record_outcome(started, None, stage)
+            raise
+        except BaseException as exc:
+            self._record_outcome(started, exc, stage)
+            raise
+        self._record_outcome(started, None, stage)
+
+    def _guarded(self, call: Callable[[], str], stage: str | None = None) -> str:
+        if not self._breaker.allow():
+            raise ToolError("llm_unavailable", "LLM circuit open", {"provider": self.name})
+        started = time.perf_counter()
+        try:
+            result = call()
+        except BaseException as exc:
+            self._record_outcome(started, exc, stage)
+            raise
+        self._record_outcome(started, None, stage)
+        return result
+
+    def _record_outcome(self, started: float, error: BaseException | None, stage: str | None = None) -> None:
+        latency_ms = (time.perf_counter() - started) * 1000
+        if error is None:
+            self._breaker.record(True, latency_ms)
+            # Per stage: a short classify call and a full draft call have
+            # very different latencies, and hedging waits on the stage's p90.
+            metrics.observe("llm.latency_ms", latency_ms, **_latency_labels(self.name, stage))
+            return
+        # Running out of the caller's budget, or waiting too long in our own
+        # queue, says nothing about the backend.
+        if isinstance(error, ToolError) and error.code in LOCAL_LLM_ERRORS:
+            self._breaker.release()
+            return
+        self._breaker.record(False, latency_ms)
+        metrics.incr("llm.errors", provider=self.name)
+
+    def _generate(
+        self,
+        prompt: str,
+        user_input: str,
+        image_base64s: list[str] | None,
+        model: str | None,
+        response_format: dict[str, Any] | None,
+        context: str | None,
+        *,
+        max_tokens: int | None = None,
+        stop: list[str] | None = None,
+        stage: str | None = None,
     ) -> str:
         url = self._config.base_url.rstrip("/") + "/chat/completions"
+        payload, use_format = self._build_payload(
+            prompt, user_input, image_base64s, model, response_format, context, max_tokens, stop
+        )
+        try:
+            body = self._post(url, payload)
+        except ToolError:
+            raise
+        except httpx.HTTPStatusError as exc:
+            if not self._rejected_response_format(exc, use_format):
+                raise ToolError("llm_error", "LLM request failed", {"error": str(exc)}) from exc
+            payload.pop("response_format", None)
+            try:
+                body = self._post(url, payload)
+            except Exception as retry_exc:  # noqa: BLE001
+                raise ToolError("llm_error", "LLM request failed", {"error": str(retry_exc)}) from retry_exc
+        except Exception as exc:  # noqa: BLE001
+            raise ToolError("llm_error", "LLM request failed", {"error": str(exc)}) from exc
+
+        try:
+            parsed = json.loads(body)
+            content = parsed["choices"][0]["message"]["content"]
+            _record_usage(parsed.get("usage"), model or self._config.model, stage)
+            self._log_model_output(
+                kind="generate",
+                model=model or self._config.model,
+                text=_normalize_llm_text(content),
+            )
+            return content
+        except Exception as exc:  # noqa: BLE001
+            raise ToolError("llm_error", "LLM response parse failed", {"body": body}) from exc
+
+    def _generate_stream(
+        self,
+        prompt: str,
+        user_input: str,
+        image_base64s: list[str] | None,
+        model: str | None,
+        response_format: dict[str, Any] | None,
+        context: str | None,
+        *,
+        max_tokens: int | None = None,
+        stop: list[str] | None = None,
+        stage: str | None = None,
+    ) -> Iterator[str]:
+        url = self._config.base_url.rstrip("/") + "/chat/completions"
+        payload, use_format = self._build_payload(
+            prompt, user_input, image_base64s, model, response_format, context, max_tokens, stop
+        )
+        payload["stream"] = True
+        model_name = model or self._config.model
+        parts: list[str] = []
+        try:
+            try:
+                for delta in self._stream_deltas(url, payload, model_name, stage):
+                    parts.append(delta)
+                    yield delta
+            except httpx.HTTPStatusError as exc:
+                # Status errors arrive before the first token, so the plain-text
+                # retry does not repeat anything the caller has already seen.
+                if not self._rejected_response_format(exc, use_format):
+                    raise ToolError("llm_error", "LLM request failed", {"error": str(exc)}) from exc
+                payload.pop("response_format", None)
+                for delta in self._stream_deltas(url, payload, model_name, stage):
+                    parts.append(delta)
+                    yield delta
+        except ToolError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            raise ToolError("llm_error", "LLM request failed", {"error": str(exc)}) from exc
+        if not parts:
+            raise ToolError("llm_error", "LLM returned empty response", {"provider": self.name})
+        self._log_model_output(kind="generate_stream", model=model_name, text="".join(parts))
+
+    def _stream_deltas(
+        self,
+        url: str,
+        payload: dict[str, Any],
+        model: str,
+        stage: str | None,
+    ) -> Iterator[str]:
+        for line in self._stream_post(url, payload):
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                return
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError as exc:
+                raise ToolError("llm_error", "LLM stream parse failed", {"line": line}) from exc
+            if isinstance(chunk.get("usage"), dict):
+                _record_usage(chunk["usage"], model, stage)
+            for choice in chunk.get("choices") or []:
+                delta = (choice.get("delta") or {}).get("content")
+                if isinstance(delta, str) and delta:
+                    yield delta
+
+    def _rejected_response_format(self, exc: httpx.HTTPStatusError, use_format: bool) -> bool:
+        if not use_format or exc.response.status_code not in {400, 422}:
+            return False
+        # Backend rejected response_format: remember that and retry as plain text.
+        logger.warning("LLM backend rejected response_format, disabling structured output: %s", exc)
+        self._structured_output = False
+        return True
+
+    def _build_payload(
+        self,
+        prompt: str,
+        user_input: str,
+        image_base64s: list[str] | None,
+        model: str | None,
+        response_format: dict[str, Any] | None,
+        context: str | None,
+        max_tokens: int | None,
+        stop: list[str] | None,
+    ) -> tuple[dict[str, Any], bool]:
         content = [{"type": "text", "text": user_input}]
         if image_base64s:
             for image_base64 in image_base64s:
                 content.append({
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
+                    "image_url": {"url": image_data_url(image_base64)}
                 })
             
+        # Keep the large static prompt as a byte-identical prefix so providers
+        # can reuse their prompt cache; per-request context goes after it.
+        messages: list[dict[str, Any]] = [{"role": "system", "content": prompt}]
+        if context:
+            messages.append({"role": "system", "content": context})
+        messages.append({"role": "user", "content": content})
         payload = {
             "model": model or self._config.model,
-            "messages": [
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": content},
-            ],
+            "messages": messages,
             "temperature": 0.2,
         }
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        if stop:
+            payload["stop"] = stop
+        use_format = response_format is not None and self._structured_output
+        if use_format:
+            payload["response_format"] = response_format
+        return payload, use_format
+
+    def _post(self, url: str, payload: dict[str, Any]) -> str:
         data = json.dumps(payload).encode("utf-8")
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self._config.api_key}",
         }
-        req = urllib.request.Request(url, data=data, headers=headers, method="POST")
-        try:
-            with urllib.request.urlopen(req, timeout=self._config.timeout_seconds) as resp:
-                body = resp.read().decode("utf-8")
-        except Exception as exc:  # noqa: BLE001
-            raise ToolError("llm_error", "LLM request failed", {"error": str(exc)}) from exc
+        max_retries = self._scheduler.settings.max_retries
+        for attempt in range(max_retries + 1):
+            with self._scheduler.slot():
+                timeout = stage_timeout(self._config.timeout_seconds, "llm")
+                try:
+                    resp = self._http.post(url, content=data, headers=headers, timeout=timeout)
+                except httpx.TimeoutException as exc:
+                    if timeout < self._config.timeout_seconds:
+                        metrics.incr("deadline.exceeded", stage="llm")
+                        raise ToolError("deadline_exceeded", "request deadline exceeded", {"stage": "llm"}) from exc
+                    raise
+            if resp.status_code in _RETRYABLE_STATUS and attempt < max_retries:
+                # Rate limited or overloaded: back off (honouring Retry-After)
+                # instead of surfacing llm_error and triggering repair/fallback.
+                delay = self._scheduler.backoff_delay(attempt, resp.headers.get("Retry-After"))
+                remaining = remaining_budget()
+                if remaining is not None and delay >= remaining:
+                    # The retry could not finish in time; let the caller fall back now.
+                    resp.raise_for_status()
+                if resp.status_code == 429:
+                    metrics.incr("llm.rate_limited", provider=self.name)
+                    self._scheduler.pause(delay)
+                metrics.observe("llm.backoff_ms", delay * 1000, provider=self.name)
+                time.sleep(delay)
+                continue
+            resp.raise_for_status()
+            return resp.text
+        raise AssertionError("unreachable")
+
+    def _stream_post(self, url: str, payload: dict[str, Any]) -> Iterator[str]:
+        """POST with the same slot, retry and deadline rules as _post, yielding body lines.
+
+        The scheduler slot is held until the stream ends, since the request is
+        in flight all that time.
+        """
+        data = json.dumps(payload).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self._config.api_key}",
+        }
+        max_retries = self._scheduler.settings.max_retries
+        for attempt in range(max_retries + 1):
+            with self._scheduler.slot():
+                timeout = stage_timeout(self._config.timeout_seconds, "llm")
+                try:
+                    with self._http.stream("POST", url, content=data, headers=headers, timeout=timeout) as resp:
+                        if resp.status_code in _RETRYABLE_STATUS and attempt < max_retries:
+                            # Nothing has been yielded yet, so backing off is still invisible to the caller.
+                            status = resp.status_code
+                            delay = self._scheduler.backoff_delay(attempt, resp.headers.get("Retry-After"))
+                            remaining = remaining_budget()
+                            if remaining is not None and delay >= remaining:
+                                resp.raise_for_status()
+                        else:
+                            resp.raise_for_status()
+                            for line in resp.iter_lines():
+                                # The read timeout restarts with every chunk, so
+                                # check the request budget between them.
+                                stage_timeout(self._config.timeout_seconds, "llm")
+                                yield line
+                            return
+                except httpx.TimeoutException as exc:
+                    if timeout < self._config.timeout_seconds:
+                        metrics.incr("deadline.exceeded", stage="llm")
+                        raise ToolError("deadline_exceeded", "request deadline exceeded", {"stage": "llm"}) from exc
+                    raise
+            if status == 429:
+                metrics.incr("llm.rate_limited", provider=self.name)
+                self._scheduler.pause(delay)
+            metrics.observe("llm.backoff_ms", delay * 1000, provider=self.name)
+            time.sleep(delay)
+        raise AssertionError("unreachable")
 
+    def warm_up(self) -> None:
+        # Any response will do: the point is to leave an open TCP/TLS
+        # connection in the pool before the first real request.
+        url = self._config.base_url.rstrip("/") + "/models"
         try:
-            parsed = json.loads(body)
-            content = parsed["choices"][0]["message"]["content"]
-            self._log_model_output(
-                kind="generate",
-                model=model or self._config.model,
-                text=_normalize_llm_text(content),
-            )
-            return content
-        except Exception as exc:  # noqa: BLE001
-            raise ToolError("llm_error", "LLM response parse failed", {"body": body}) from exc
+            self._http.get(url, headers={"Authorization": f"Bearer {self._config.api_key}"}, timeout=5)
+        except httpx.HTTPError as exc:
+            logger.warning("LLM warm-up for %s failed: %s", self.name, exc)
 
-    def transcribe_audio(self, audio_base64: str) -> str:
-        audio_bytes = base64.b64decode(audio_base64)
-        
-        with tempfile.NamedTemporaryFile(suffix=".m4a", delete=True) as temp_audio:
-            temp_audio.write(audio_bytes)
-            temp_audio.flush()
-            temp_audio.seek(0)
-            
-            try:
+    def close(self) -> None:
+        self._http.close()
+
+    def transcribe_audio(self, audio: bytes, filename: str = "audio.m4a") -> str:
+        return self._guarded(lambda: self._transcribe_audio(audio, filename), stage="transcribe")
+
+    def _transcribe_audio(self, audio: bytes, filename: str) -> str:
+        # Upload straight from memory; the filename only tells the server the container format.
+        try:
+            with self._scheduler.slot():
                 transcript = self._client.audio.transcriptions.create(
                     model="whisper-large-v3",
-                    file=temp_audio,
+                    file=(filename, audio),
                     language="zh",
                     prompt="请准确转录中文内容，注意标点符号和语法",
                     response_format="text",
-                    temperature=0.2
+                    temperature=0.2,
+                    timeout=stage_timeout(self._config.timeout_seconds, "transcribe"),
                 )
-                text = transcript.strip()
-                self._log_model_output(
-                    kind="transcribe_audio",
-                    model="whisper-large-v3",
-                    text=text,
-                )
-                return text
-            except Exception as exc:  # noqa: BLE001
-                raise ToolError("llm_error", "Audio transcription failed", {"error": str(exc)}) from exc
+        except ToolError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            raise ToolError("llm_error", "Audio transcription failed", {"error": str(exc)}) from exc
+        text = transcript.strip()
+        self._log_model_output(
+            kind="transcribe_audio",
+            model="whisper-large-v3",
+            text=text,
+        )
+        return text
 
     @property
     def fast_model(self) -> str:
@@ -136,10 +653,233 @@ class OpenAICompatibleProvider(LLMProvider):
         logger.warning("LLM %s model=%s output:\n%s", kind, model, text)
 
 
+class MultiProvider(LLMProvider):
+    """Priority-ordered endpoints with hedging on slow answers and failover on errors.
+
+    The first endpoint is asked first. With hedging on, if it has not answered
+    within its recent p90 latency for the same stage (route, classify, chat,
+    ...), the next endpoint is asked too and the first valid answer wins. An
+    endpoint that errors is replaced by the next one.
+    """
+
+    def __init__(
+        self,
+        providers: list[OpenAICompatibleProvider],
+        *,
+        hedge: bool = False,
+        hedge_min_delay_ms: int = 300,
+    ) -> None:
+        if not providers:
+            raise ValueError("providers must be non-empty")
+        self._providers = providers
+        self._hedge = hedge and len(providers) > 1
+        self._hedge_min_delay = hedge_min_delay_ms / 1000.0
+
+    @property
+    def providers(self) -> list[OpenAICompatibleProvider]:
+        return list(self._providers)
+
+    @property
+    def model(self) -> str:
+        return self._providers[0].model
+
+    @property
+    def fast_model(self) -> str:
+        return self._providers[0].fast_model
+
+    @property
+    def supports_structured_output(self) -> bool:
+        return self._providers[0].supports_structured_output
+
+    @property
+    def available(self) -> bool:
+        return any(p.available for p in self._providers)
+
+    def warm_up(self) -> None:
+        for provider in self._providers:
+            provider.warm_up()
+
+    def close(self) -> None:
+        for provider in self._providers:
+            provider.close()
+
+    def generate(
+        self,
+        prompt: str,
+        user_input: str,
+        image_base64s: list[str] | None = None,
+        model: str | None = None,
+        response_format: dict[str, Any] | None = None,
+        context: str | None = None,
+        max_tokens: int | None = None,
+        stop: list[str] | None = None,
+        stage: str | None = None,
+    ) -> str:
+        def call(provider: OpenAICompatibleProvider) -> str:
+            return provider.generate(
+                prompt,
+                user_input,
+                image_base64s=image_base64s,
+                model=self._model_for(provider, model),
+                response_format=response_format,
+                context=context,
+                max_tokens=max_tokens,
+                stop=stop,
+                stage=stage,
+            )
+
+        return self._run(call, hedge=self._hedge, stage=stage)
+
+    def generate_stream(
+        self,
+        prompt: str,
+        user_input: str,
+        image_base64s: list[str] | None = None,
+        model: str | None = None,
+        response_format: dict[str, Any] | None = None,
+        context: str | None = None,
+        max_tokens: int | None = None,
+        stop: list[str] | None = None,
+        stage: str | None = None,
+    ) -> Iterator[str]:
+        # No hedging: two live streams cannot be merged. Failover is only
+        # possible until the first piece has been handed to the caller.
+        last_error: ToolError | None = None
+        for position, provider in enumerate(self._providers):
+            if position > 0:
+                metrics.incr("llm.failover", provider=provider.name)
+            stream = provider.generate_stream(
+                prompt,
+                user_input,
+                image_base64s=image_base64s,
+                model=self._model_for(provider, model),
+                response_format=response_format,
+                context=context,
+                max_tokens=max_tokens,
+                stop=stop,
+                stage=stage,
+            )
+            try:
+                first = next(stream)
+            except StopIteration:
+                last_error = ToolError("llm_error", "LLM returned empty response", {"provider": provider.name})
+                continue
+            except ToolError as exc:
+                if exc.code in LOCAL_LLM_ERRORS:
+                    raise
+                last_error = exc
+                continue
+            if position > 0:
+                metrics.incr("llm.served_by_alternate", provider=provider.name)
+            yield first
+            yield from stream
+            return
+        raise last_error or ToolError("llm_error", "LLM request failed")
+
+    def transcribe_audio(self, audio: bytes, filename: str = "audio.m4a") -> str:
+        return self._run(lambda provider: provider.transcribe_audio(audio, filename), hedge=False)
+
+    def _model_for(self, provider: OpenAICompatibleProvider, model: str | None) -> str | None:
+        primary = self._providers[0]
+        if model is None or provider is primary:
+            return model
+        if model == primary.fast_model:
+            return provider.fast_model
+        if model == primary.model:
+            return provider.model
+        return model
+
+    def _hedge_delay(self, provider: OpenAICompatibleProvider, stage: str | None) -> float:
+        p90 = get_metrics().percentile("llm.latency_ms", 0.9, **_latency_labels(provider.name, stage))
+        if p90 is None:
+            return max(self._hedge_min_delay, provider.timeout_seconds / 2)
+        return max(self._hedge_min_delay, p90 / 1000.0)
+
+    def _run(
+        self, call: Callable[[OpenAICompatibleProvider], str], *, hedge: bool, stage: str | None = None
+    ) -> str:
+        waiting = list(self._providers)
+        in_flight: dict[Future, OpenAICompatibleProvider] = {}
+
+        def start(provider: OpenAICompatibleProvider) -> None:
+            in_flight[submit_with_context(_hedge_executor, call, provider)] = provider
+
+        start(waiting.pop(0))
+        if hedge and waiting:
+            first = next(iter(in_flight.values()))
+            done, _ = wait(list(in_flight), timeout=self._hedge_delay(first, stage))
+            if not done:
+                alternate = waiting.pop(0)
+                metrics.incr("llm.hedged", provider=alternate.name)
+                start(alternate)
+
+        last_error: ToolError | None = None
+        while in_flight:
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = in_flight.pop(future)
+                try:
+                    result = future.result()
+                    if not isinstance(result, str) or not result.strip():
+                        raise ToolError("llm_error", "LLM returned empty response", {"provider": provider.name})
+                except ToolError as exc:
+                    last_error = exc
+                    if waiting and exc.code not in LOCAL_LLM_ERRORS:
+                        alternate = waiting.pop(0)
+                        metrics.incr("llm.failover", provider=alternate.name)
+                        start(alternate)
+                    continue
+                if provider is not self._providers[0]:
+                    metrics.incr("llm.served_by_alternate", provider=provider.name)
+                return result
+        raise last_error or ToolError("llm_error", "LLM request failed")
+
+
+def _build_http_client(pool: HTTPPoolSettings, timeout_seconds: int) -> httpx.Client:
+    http2 = pool.http2 and importlib.util.find_spec("h2") is not None
+    return httpx.Client(
+        http2=http2,
+        timeout=timeout_seconds,
+        limits=httpx.Limits(
+            max_connections=pool.max_connections,
+            max_keepalive_connections=pool.max_keepalive_connections,
+            keepalive_expiry=pool.keepalive_expiry_seconds,
+        ),
+    )
+
+
 def _llm_debug_enabled() -> bool:
     return os.environ.get("APP_LLM_DEBUG", "").strip().lower() in {"1", "true", "yes", "on"}
 
 
+def _latency_labels(provider: str, stage: str | None) -> dict[str, str]:
+    return {"provider": provider} if stage is None else {"provider": provider, "stage": stage}
+
+
+def _record_usage(usage: Any, model: str, stage: str | None = None) -> None:
+    if not isinstance(usage, dict):
+        return
+    labels = {"model": model} if stage is None else {"model": model, "stage": stage}
+    prompt_tokens = usage.get("prompt_tokens")
+    if isinstance(prompt_tokens, int):
+        metrics.incr("llm.prompt_tokens", prompt_tokens, **labels)
+    completion_tokens = usage.get("completion_tokens")
+    if isinstance(completion_tokens, int):
+        metrics.incr("llm.completion_tokens", completion_tokens, **labels)
+    details = usage.get("prompt_tokens_details")
+    cached = details.get("cached_tokens") if isinstance(details, dict) else None
+    if isinstance(cached, int):
+        metrics.incr("llm.prompt_cached_tokens", cached, **labels)
+    if stage is not None:
+        logger.info(
+            "LLM usage stage=%s model=%s prompt_tokens=%s completion_tokens=%s",
+            stage,
+            model,
+            prompt_tokens,
+            completion_tokens,
+        )
+
+
 def _normalize_llm_text(content: Any) -> str:
     if isinstance(content, str):
         return content
@@ -157,15 +897,67 @@ def _normalize_llm_text(content: Any) -> str:
     return str(content)
 
 
+_provider: Optional[LLMProvider] = None
+_provider_loaded = False
+_provider_lock = threading.Lock()
+
+
 def load_provider_from_config() -> Optional[LLMProvider]:
+    """Return the process-wide provider, building it on first use."""
+    global _provider, _provider_loaded
+    if _provider_loaded:
+        return _provider
+    with _provider_lock:
+        if not _provider_loaded:
+            _provider = _build_provider()
+            _provider_loaded = True
+        return _provider
+
+
+def reset_provider() -> None:
+    global _provider, _provider_loaded
+    with _provider_lock:
+        if _provider is not None:
+            _provider.close()
+        _provider = None
+        _provider_loaded = False
+
+
+def _build_provider() -> Optional[LLMProvider]:
     settings = load_llm_settings()
     if settings is None:
         return None
-    config = LLMConfig(
+    primary = _provider_from_settings(settings, settings)
+    if not settings.alternates:
+        return primary
+    providers = [primary] + [
+        _provider_from_settings(alternate, settings)
+        for alternate in settings.alternates
+    ]
+    return MultiProvider(
+        providers,
+        hedge=settings.hedge,
+        hedge_min_delay_ms=settings.hedge_min_delay_ms,
+    )
+
+
+def _provider_from_settings(settings: LLMSettings, shared: LLMSettings) -> OpenAICompatibleProvider:
+    config = _config_from_settings(settings, shared.http)
+    return OpenAICompatibleProvider(
+        config,
+        get_circuit_breaker(config.name, shared.breaker),
+        get_llm_scheduler(config.name, shared.scheduler),
+    )
+
+
+def _config_from_settings(settings: LLMSettings, http: HTTPPoolSettings | None = None) -> LLMConfig:
+    return LLMConfig(
         base_url=settings.base_url,
         api_key=settings.api_key,
         model=settings.model,
         fast_model=settings.fast_model,
         timeout_seconds=settings.timeout_seconds,
+        structured_output=settings.structured_output,
+        name=settings.name,
+        http=http,
     )
-    return OpenAICompatibleProvider(config)
@@ -1,36 +1,66 @@
 ﻿from __future__ import annotations
 
 import json
+import logging
 import re
-from pathlib import Path
-from typing import Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Collection, TypeVar
 
 from pydantic import ValidationError
 
+from api.core import metrics
+from api.core.deadline import remaining_budget
 from api.db.connection import ToolError, now_iso8601
+from api.router.example_store import get_example_store, render_examples
+from api.router.json_extract import JSONArrayItemStream, extract_json_object, strip_trailing_commas
+from api.router.model_policy import FAST, RouteFeatures, choose_route_model, get_model_policy_settings
+from api.router.prompt_compiler import PROMPTS_DIR, CompiledPrompt, compile_router_prompt, load_prompt
 from api.router.provider import LLMProvider, load_provider_from_config
-from api.router.schema import RouterDecision
-
-PROMPT_PATH = (
-    Path(__file__).resolve().parents[5]
-    / "packages"
-    / "prompts"
-    / "router_prompt.txt"
-)
-
-CLASSIFY_PROMPT_PATH = (
-    Path(__file__).resolve().parents[5]
-    / "packages"
-    / "prompts"
-    / "classify_prompt.txt"
-)
-
-CHAT_PROMPT_PATH = (
-    Path(__file__).resolve().parents[5]
-    / "packages"
-    / "prompts"
-    / "chat_prompt.txt"
-)
+from api.router.scheduler import submit_with_context
+from api.router.schema import BatchRouterDecision, RouterDecision, ToolCall
+
+logger = logging.getLogger("api.router")
+
+CLASSIFY_PROMPT_PATH = PROMPTS_DIR / "classify_prompt.txt"
+CHAT_PROMPT_PATH = PROMPTS_DIR / "chat_prompt.txt"
+
+# Per-stage output caps. A hinted route emits a single tool call and card,
+# the unhinted one may emit several (multi_event).
+ROUTE_MAX_TOKENS = 1500
+ROUTE_HINTED_MAX_TOKENS = 800
+CLASSIFY_MAX_TOKENS = 4
+CLASSIFY_STOP = ["\n"]
+CHAT_MAX_TOKENS = 600
+BATCH_CHUNK_SIZE = 10
+BATCH_ITEM_MAX_TOKENS = 400
+BATCH_MAX_TOKENS = 4096
+# Budget a second router call (repair or escalation) needs to be worth starting.
+ROUTE_RETRY_MIN_SECONDS = 2.0
+
+BATCH_PROMPT_PATH = PROMPTS_DIR / "router" / "batch.txt"
+
+_batch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="route-batch")
+
+T = TypeVar("T")
+
+ROUTER_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "router_decision",
+        "schema": RouterDecision.model_json_schema(),
+        "strict": False,
+    },
+}
+
+BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "router_batch_decision",
+        "schema": BatchRouterDecision.model_json_schema(),
+        "strict": False,
+    },
+}
 
 
 def route(
@@ -38,28 +68,294 @@ def route(
     image_base64s: list[str] | None = None,
     provider: LLMProvider | None = None,
     max_retries: int = 2,
+    type_hint: str | None = None,
+    fast_path_confidence: float | None = None,
+    on_tool_call: Callable[[ToolCall], None] | None = None,
 ) -> RouterDecision:
-    prompt = PROMPT_PATH.read_text(encoding="utf-8")
-    prompt += f"\n\nCURRENT TIME (Asia/Shanghai): {now_iso8601()}"
+    """Route text (and images) to tool calls and cards.
+
+    With on_tool_call, the first answer is streamed and each tool call is
+    reported as soon as its object is complete. Repairs and escalations run
+    unstreamed, so the callback sees at most one answer's calls; the returned
+    decision is authoritative.
+    """
     provider = provider or load_provider_from_config()
     if provider is None:
         raise ToolError("llm_unavailable", "LLM provider not configured")
 
+    compiled = compile_router_prompt(type_hint)
+    # Confirmed records similar to this input replace the canned examples
+    # (one is kept as a reference for the full output shape).
+    # They go in the per-request context so the system prompt stays a
+    # cacheable prefix.
+    examples = get_example_store().select(text, compiled.tools)
+    if examples:
+        compiled = compile_router_prompt(type_hint, format_example_only=True)
+    prompt = compiled.text
+    max_tokens = ROUTE_HINTED_MAX_TOKENS if compiled.type_hint else ROUTE_MAX_TOKENS
+    _record_prompt_size(compiled)
+    context = f"CURRENT TIME (Asia/Shanghai): {now_iso8601()}"
+    if examples:
+        context += "\n\n" + render_examples(examples)
+        metrics.observe("router.example_tokens_est", sum(e.est_tokens for e in examples))
+    metrics.incr(
+        "router.calls",
+        structured=getattr(provider, "supports_structured_output", False),
+    )
+    policy = get_model_policy_settings()
+    choice = choose_route_model(
+        provider,
+        RouteFeatures(
+            text_chars=len(text.strip()),
+            image_count=len(image_base64s or []),
+            has_type_hint=type_hint is not None,
+            fast_path_confidence=fast_path_confidence,
+        ),
+        policy,
+    )
+    metrics.incr("router.model_choice", tier=choice.tier, reason=choice.reason)
+
+    def run(
+        model: str,
+        retries: int,
+        on_tool_call: Callable[[ToolCall], None] | None = None,
+    ) -> RouterDecision:
+        started = time.perf_counter()
+        try:
+            return _generate_with_repair(
+                provider,
+                prompt,
+                text,
+                _parse_decision,
+                image_base64s=image_base64s,
+                context=context,
+                response_format=ROUTER_RESPONSE_FORMAT,
+                max_tokens=max_tokens,
+                stage="route",
+                max_retries=retries,
+                model=model,
+                on_tool_call=on_tool_call,
+            )
+        finally:
+            metrics.observe("router.latency_ms", (time.perf_counter() - started) * 1000, model=model)
+
+    if choice.tier != FAST:
+        return run(choice.model, max_retries, on_tool_call)
+
+    # Fast model gets one shot; a bad or unsure answer is re-routed on the
+    # main model instead of spending repair calls on the weaker one.
+    decision: RouterDecision | None = None
+    try:
+        decision = run(choice.model, 0, on_tool_call)
+    except ToolError as exc:
+        if exc.code not in {"router_invalid_json", "router_invalid_schema", "llm_error"}:
+            raise
+        if not _has_budget_for_retry():
+            raise
+        reason = "fast_failed"
+    else:
+        if decision.confidence >= policy.escalate_below_confidence:
+            return decision
+        reason = "low_confidence"
+        if not _has_budget_for_retry():
+            # An unsure answer in time beats a better one after the deadline.
+            metrics.incr("router.escalations_skipped", reason="deadline")
+            return decision
+    metrics.incr("router.escalations", reason=reason)
+    return run(provider.model, max_retries)
+
+
+def route_batch(
+    texts: list[str],
+    provider: LLMProvider | None = None,
+    max_retries: int = 1,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    fallback_codes: Collection[str] = (),
+) -> list[RouterDecision | None]:
+    """Route many texts with one router call per chunk of chunk_size items.
+
+    Returns one decision per input, in order; None marks an item the model
+    left out of its answer. Chunks are routed concurrently. A chunk failing
+    with a ToolError in fallback_codes leaves only its own items as None;
+    other errors fail the whole batch.
+    """
+    if not texts:
+        return []
+    provider = provider or load_provider_from_config()
+    if provider is None:
+        raise ToolError("llm_unavailable", "LLM provider not configured")
+
+    prompt = compile_router_prompt(None).text + "\n" + load_prompt(BATCH_PROMPT_PATH)
+    context = f"CURRENT TIME (Asia/Shanghai): {now_iso8601()}"
+    chunks = [list(range(start, min(start + chunk_size, len(texts)))) for start in range(0, len(texts), chunk_size)]
+
+    def run_chunk(indexes: list[int]) -> dict[int, RouterDecision]:
+        payload = json.dumps(
+            [{"index": i, "text": texts[i]} for i in indexes],
+            ensure_ascii=False,
+        )
+        metrics.incr(
+            "router.batch_calls",
+            structured=getattr(provider, "supports_structured_output", False),
+        )
+        batch = _generate_with_repair(
+            provider,
+            prompt,
+            payload,
+            _parse_batch_decision,
+            image_base64s=None,
+            context=context,
+            response_format=BATCH_RESPONSE_FORMAT,
+            max_tokens=min(BATCH_ITEM_MAX_TOKENS * len(indexes), BATCH_MAX_TOKENS),
+            stage="route_batch",
+            max_retries=max_retries,
+        )
+        wanted = set(indexes)
+        return {item.index: item.decision for item in batch.items if item.index in wanted}
+
+    def run_chunk_or_skip(indexes: list[int]) -> dict[int, RouterDecision]:
+        try:
+            return run_chunk(indexes)
+        except ToolError as exc:
+            if exc.code not in fallback_codes:
+                raise
+            logger.warning("batch route chunk of %d items failed: %s", len(indexes), exc.code)
+            metrics.incr("router.batch_chunk_failures", code=exc.code)
+            return {}
+
+    decisions: dict[int, RouterDecision] = {}
+    if len(chunks) == 1:
+        decisions.update(run_chunk_or_skip(chunks[0]))
+    else:
+        futures = [submit_with_context(_batch_executor, run_chunk_or_skip, chunk) for chunk in chunks]
+        for future in futures:
+            decisions.update(future.result())
+    missing = len(texts) - len(decisions)
+    if missing:
+        metrics.incr("router.batch_missing_items", missing)
+    metrics.observe("router.batch_size", len(texts))
+    return [decisions.get(i) for i in range(len(texts))]
+
+
+def _generate_with_repair(
+    provider: LLMProvider,
+    prompt: str,
+    text: str,
+    parse: Callable[[str], T],
+    *,
+    image_base64s: list[str] | None,
+    context: str,
+    response_format: dict[str, Any],
+    max_tokens: int,
+    stage: str,
+    max_retries: int,
+    model: str | None = None,
+    on_tool_call: Callable[[ToolCall], None] | None = None,
+) -> T:
     last_error: ToolError | None = None
     user_input = text
+    repair_started: float | None = None
     for attempt in range(max_retries + 1):
-        output = provider.generate(prompt, user_input, image_base64s=image_base64s)
+        if attempt > 0 and not _has_budget_for_retry():
+            metrics.incr("router.repairs_skipped", reason="deadline")
+            break
+        if attempt == 0 and on_tool_call is not None:
+            output = _generate_streaming(
+                provider,
+                prompt,
+                user_input,
+                on_tool_call,
+                image_base64s=image_base64s,
+                response_format=response_format,
+                context=context,
+                model=model,
+                max_tokens=max_tokens,
+                stage=stage,
+            )
+        else:
+            output = provider.generate(
+                prompt,
+                user_input,
+                image_base64s=image_base64s,
+                response_format=response_format,
+                context=context,
+                model=model,
+                max_tokens=max_tokens,
+                stage=stage,
+            )
         try:
-            return _parse_decision(output)
+            parsed = parse(output)
         except ToolError as exc:
             if exc.code not in {"router_invalid_json", "router_invalid_schema"}:
                 raise
+            metrics.incr("router.parse_failures", code=exc.code)
             last_error = exc
             if attempt < max_retries:
+                metrics.incr("router.repairs")
+                if repair_started is None:
+                    repair_started = time.perf_counter()
                 user_input = _build_repair_prompt(text, output, exc)
+            continue
+        if repair_started is not None:
+            metrics.incr("router.repaired")
+            metrics.observe("router.repair_latency_ms", (time.perf_counter() - repair_started) * 1000)
+        return parsed
+    if repair_started is not None:
+        metrics.observe("router.repair_latency_ms", (time.perf_counter() - repair_started) * 1000)
+    metrics.incr("router.failed")
     raise last_error or ToolError("router_invalid_json", "Router output is not valid JSON")
 
 
+def _generate_streaming(
+    provider: LLMProvider,
+    prompt: str,
+    user_input: str,
+    on_tool_call: Callable[[ToolCall], None],
+    **kwargs: Any,
+) -> str:
+    items = JSONArrayItemStream({"tool_calls"})
+    parts: list[str] = []
+    for delta in provider.generate_stream(prompt, user_input, **kwargs):
+        parts.append(delta)
+        for _, item in items.feed(delta):
+            call = _parse_tool_call(item)
+            if call is not None:
+                metrics.incr("router.streamed_tool_calls")
+                on_tool_call(call)
+    return "".join(parts)
+
+
+def _parse_tool_call(text: str) -> ToolCall | None:
+    # Malformed items are left to the full parse (and its repair) at the end.
+    for candidate in (text, strip_trailing_commas(text)):
+        try:
+            return ToolCall.model_validate(json.loads(candidate))
+        except (json.JSONDecodeError, ValidationError):
+            continue
+    return None
+
+
+def _has_budget_for_retry() -> bool:
+    remaining = remaining_budget()
+    return remaining is None or remaining >= ROUTE_RETRY_MIN_SECONDS
+
+
+def _record_prompt_size(compiled: CompiledPrompt) -> None:
+    hint = compiled.type_hint or "none"
+    metrics.observe("router.prompt_tokens_est", compiled.est_tokens, hint=hint)
+    if compiled.type_hint is None:
+        return
+    saved = compile_router_prompt(None).est_tokens - compiled.est_tokens
+    metrics.incr("router.prompt_tokens_saved_est", saved, hint=hint)
+    logger.info(
+        "router prompt hint=%s tools=%s est_tokens=%d saved_est=%d",
+        hint,
+        ",".join(compiled.tools),
+        compiled.est_tokens,
+        saved,
+    )
+
+
 def _build_repair_prompt(original_text: str, output: str, error: ToolError) -> str:
     details = error.details or {}
     return (
@@ -71,18 +367,41 @@ def _build_repair_prompt(original_text: str, output: str, error: ToolError) -> s
 
 
 def _parse_decision(output: str) -> RouterDecision:
-    output = _clean_json_output(output)
+    data = _load_json_tolerant(output)
     try:
-        data = json.loads(output)
-    except json.JSONDecodeError as exc:
-        raise ToolError("router_invalid_json", "Router output is not valid JSON", {"output": output}) from exc
+        return RouterDecision.model_validate(data)
+    except ValidationError as exc:
+        raise ToolError("router_invalid_schema", "Router output schema invalid", {"errors": exc.errors()}) from exc
 
+
+def _parse_batch_decision(output: str) -> BatchRouterDecision:
+    data = _load_json_tolerant(output)
     try:
-        return RouterDecision.model_validate(data)
+        return BatchRouterDecision.model_validate(data)
     except ValidationError as exc:
         raise ToolError("router_invalid_schema", "Router output schema invalid", {"errors": exc.errors()}) from exc
 
 
+def _load_json_tolerant(output: str) -> Any:
+    cleaned = _clean_json_output(output)
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        pass
+    # Models sometimes wrap the object in prose or leave trailing commas;
+    # salvage the first balanced object instead of paying for a repair call.
+    extracted = extract_json_object(cleaned)
+    if extracted is not None:
+        for candidate in (extracted, strip_trailing_commas(extracted)):
+            try:
+                data = json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+            metrics.incr("router.salvaged_json")
+            return data
+    raise ToolError("router_invalid_json", "Router output is not valid JSON", {"output": output})
+
+
 def _clean_json_output(output: str) -> str:
     text = output.strip()
     if text.startswith("```"):
@@ -96,13 +415,21 @@ def classify_intent(
     image_base64s: list[str] | None = None,
     provider: LLMProvider | None = None,
 ) -> str:
-    prompt = CLASSIFY_PROMPT_PATH.read_text(encoding="utf-8")
+    prompt = load_prompt(CLASSIFY_PROMPT_PATH)
     provider = provider or load_provider_from_config()
     if provider is None:
         return "action"
     try:
         # Use a fast/cheap model for intent classification
-        output = provider.generate(prompt, text, image_base64s=image_base64s, model=provider.fast_model).strip().lower()
+        output = provider.generate(
+            prompt,
+            text,
+            image_base64s=image_base64s,
+            model=provider.fast_model,
+            max_tokens=CLASSIFY_MAX_TOKENS,
+            stop=CLASSIFY_STOP,
+            stage="classify",
+        ).strip().lower()
         if "chat" in output:
             return "chat"
         return "action"
@@ -113,14 +440,32 @@ def chat_reply(
     text: str,
     image_base64s: list[str] | None = None,
     provider: LLMProvider | None = None,
+    on_delta: Callable[[str], None] | None = None,
 ) -> str:
-    prompt = CHAT_PROMPT_PATH.read_text(encoding="utf-8")
+    prompt = load_prompt(CHAT_PROMPT_PATH)
     provider = provider or load_provider_from_config()
     if provider is None:
         return "你好！有什么我可以帮你的？"
     try:
-        return provider.generate(prompt, text, image_base64s=image_base64s).strip()
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
+        if on_delta is None:
+            return provider.generate(
+                prompt,
+                text,
+                image_base64s=image_base64s,
+                max_tokens=CHAT_MAX_TOKENS,
+                stage="chat",
+            ).strip()
+        parts: list[str] = []
+        for delta in provider.generate_stream(
+            prompt,
+            text,
+            image_base64s=image_base64s,
+            max_tokens=CHAT_MAX_TOKENS,
+            stage="chat",
+        ):
+            parts.append(delta)
+            on_delta(delta)
+        return "".join(parts).strip()
+    except Exception:
+        logger.exception("chat reply failed")
         return "抱歉，我刚刚走神了，能再说一遍吗？"
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Iterator, Optional
+
+from api.core import metrics
+from api.core.deadline import stage_timeout
+from api.db.connection import ToolError
+from api.settings import LLMSchedulerSettings
+
+# Lower value is served first.
+INTERACTIVE = 0
+BACKGROUND = 10
+
+_PRIORITY_LABELS = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: int) -> Iterator[None]:
+    """Run LLM calls made inside the block at the given scheduling priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class LLMScheduler:
+    """Admission control for one LLM endpoint.
+
+    A call needs a concurrency slot and a token from the bucket. Waiters are
+    served strictly by (priority, arrival), so interactive requests overtake
+    queued background work. A 429 pauses admission for the Retry-After period.
+    """
+
+    def __init__(self, name: str, settings: LLMSchedulerSettings | None = None) -> None:
+        self._name = name
+        self._settings = settings or LLMSchedulerSettings()
+        self._cond = threading.Condition()
+        self._queue: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._inflight = 0
+        self._tokens = float(max(self._settings.burst, 1))
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+
+    @property
+    def settings(self) -> LLMSchedulerSettings:
+        return self._settings
+
+    @contextmanager
+    def slot(self, priority: int | None = None) -> Iterator[None]:
+        priority = current_priority() if priority is None else priority
+        started = time.monotonic()
+        # A request that is almost out of budget should not sit in the queue.
+        deadline = started + stage_timeout(self._settings.queue_timeout_seconds, "llm_queue")
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            self._publish()
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._wait_time(ticket, now)
+                    if wait == 0:
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        metrics.incr("llm.queue_timeouts", provider=self._name)
+                        # Local load, not an endpoint failure: see LOCAL_LLM_ERRORS.
+                        raise ToolError("llm_queue_timeout", "LLM queue timeout", {"provider": self._name})
+                    self._cond.wait(remaining if wait is None else min(wait, remaining))
+            except BaseException:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._publish()
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._queue)
+            self._inflight += 1
+            if self._settings.rate_per_second > 0:
+                self._tokens -= 1
+            self._publish()
+            # The next waiter may now be at the head and admissible.
+            self._cond.notify_all()
+        metrics.observe(
+            "llm.queue_wait_ms",
+            (time.monotonic() - started) * 1000,
+            provider=self._name,
+            priority=_PRIORITY_LABELS.get(priority, str(priority)),
+        )
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._inflight -= 1
+                self._publish()
+                self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all admissions, e.g. while the vendor is rate limiting us."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to wait before retry number attempt (0-based)."""
+        cap = self._settings.backoff_max_ms / 1000.0
+        hinted = parse_retry_after(retry_after)
+        if hinted is not None:
+            return min(hinted, cap) + random.uniform(0, 0.1 * min(hinted, cap))
+        ceiling = min(cap, self._settings.backoff_base_ms / 1000.0 * (2 ** attempt))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._cond:
+            return {
+                "name": self._name,
+                "queued": len(self._queue),
+                "inflight": self._inflight,
+                "max_concurrency": self._settings.max_concurrency,
+                "paused": time.monotonic() < self._paused_until,
+            }
+
+    def _wait_time(self, ticket: tuple[int, int], now: float) -> Optional[float]:
+        # 0 = go now; a number = re-check after that many seconds;
+        # None = wait until another call finishes or leaves the queue.
+        if self._queue[0] != ticket:
+            return None
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._inflight >= self._settings.max_concurrency:
+            return None
+        rate = self._settings.rate_per_second
+        if rate <= 0:
+            return 0
+        self._tokens = min(
+            float(max(self._settings.burst, 1)),
+            self._tokens + (now - self._refilled_at) * rate,
+        )
+        self._refilled_at = now
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / rate
+
+    def _publish(self) -> None:
+        metrics.set_gauge("llm.queue_depth", len(self._queue), provider=self._name)
+        metrics.set_gauge("llm.inflight", self._inflight, provider=self._name)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def submit_with_context(executor: Any, fn: Any, *args: Any) -> Any:
+    """executor.submit that carries the caller's LLM priority and deadline into the worker thread."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+_schedulers: dict[str, LLMScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_llm_scheduler(name: str, settings: LLMSchedulerSettings | None = None) -> LLMScheduler:
+    with _schedulers_lock:
+        scheduler = _schedulers.get(name)
+        if scheduler is None:
+            scheduler = LLMScheduler(name, settings)
+            _schedulers[name] = scheduler
+        return scheduler
+
+
+def llm_scheduler_states() -> list[dict[str, Any]]:
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return [s.snapshot() for s in schedulers]
+
+
+__all__ = [
+    "BACKGROUND",
+    "INTERACTIVE",
+    "LLMScheduler",
+    "current_priority",
+    "get_llm_scheduler",
+    "llm_priority",
+    "llm_scheduler_states",
+    "parse_retry_after",
+    "submit_with_context",
+]
@@ -27,4 +27,13 @@ class RouterDecision(BaseModel):
     clarify_question: Optional[str] = None
     reply_to_user: Optional[str] = None
     tool_calls: List[ToolCall] = Field(default_factory=list)
-    cards: List[Card] = Field(default_factory=list)
+    cards: List[Card] = Field(default_factory=list)
+
+
+class BatchRouterItem(BaseModel):
+    index: int
+    decision: RouterDecision
+
+
+class BatchRouterDecision(BaseModel):
+    items: List[BatchRouterItem] = Field(default_factory=list)
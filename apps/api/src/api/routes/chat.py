@@ -1,19 +1,50 @@
 ﻿from __future__ import annotations
 
+import asyncio
 import json
+import logging
 import re
-import uuid
+import threading
+from typing import Any, AsyncIterator, Optional
 
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
+from api.core.audio import transcribe_audio
 from api.core.constants_loader import get_constants
+from api.core.deadline import deadline_scope
+from api.core.images import prepare_images
 from api.db.connection import ToolError, ensure_tables, get_connection, normalize_iso8601
 from api.repositories.events_repo import EventRepository
 from api.services.events_service import EventService
 from api.services.orchestrator_service import get_orchestrator_service
 from api.router.provider import load_provider_from_config
+from api.settings import load_server_settings
 
 router = APIRouter()
+logger = logging.getLogger("api.chat")
+
+MAX_BATCH_TEXTS = 50
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout-Ms"
+
+_request_budget: Optional[float] = None
+_request_budget_lock = threading.Lock()
+
+# Workers of open /chat/stream responses; held so they are not garbage collected.
+_stream_workers: set[asyncio.Future] = set()
+
+_TYPE_TAG_RE = re.compile(r"(?:^|\s)@(expense|income|transfer|repayment|lifelog|meal|task)\b", re.IGNORECASE)
+
+
+def _extract_type_tag(text: object, type_hint: object) -> tuple[object, object]:
+    if isinstance(text, str) and text.strip():
+        match = _TYPE_TAG_RE.search(text)
+        if match:
+            if type_hint is None:
+                type_hint = match.group(1).lower()
+            text = (text[: match.start()] + text[match.end() :]).strip()
+    return text, type_hint
 
 
 @router.post("/chat")
@@ -27,7 +58,6 @@ async def chat(request: Request) -> dict:
         ) from exc
 
     text = body.get("text")
-    images = body.get("images")
     confirm_draft_ids = body.get("confirm_draft_ids")
     undo_token = body.get("undo_token")
     commit_id = body.get("commit_id")
@@ -161,29 +191,7 @@ async def chat(request: Request) -> dict:
                 raise ToolError("invalid_param", "payload must be object")
             return service.task_action(task_id, op.strip(), payload)
 
-        if draft_defaults is not None and not isinstance(draft_defaults, dict):
-            raise ToolError("invalid_param", "draft_defaults must be object")
-        if isinstance(draft_defaults, dict) and "account_id" in draft_defaults:
-            account_id = draft_defaults.get("account_id")
-            if account_id is not None:
-                if not isinstance(account_id, int) or account_id <= 0:
-                    raise ToolError("invalid_param", "draft_defaults.account_id must be positive integer")
-        if isinstance(draft_defaults, dict) and "category" in draft_defaults:
-            category = draft_defaults.get("category")
-            if category is not None:
-                if not isinstance(category, str) or not category.strip():
-                    raise ToolError("invalid_param", "draft_defaults.category must be non-empty string")
-                consts = get_constants()
-                allowed = set(consts.expense.categories) | set(consts.income.categories)
-                if category.strip() not in allowed:
-                    raise ToolError("invalid_param", "draft_defaults.category is invalid")
-        if isinstance(draft_defaults, dict):
-            for field in ("from_account_id", "to_account_id"):
-                if field in draft_defaults:
-                    value = draft_defaults.get(field)
-                    if value is not None:
-                        if not isinstance(value, int) or value <= 0:
-                            raise ToolError("invalid_param", f"draft_defaults.{field} must be positive integer")
+        _validate_draft_defaults(draft_defaults)
 
         if commit_id:
             if not isinstance(commit_id, str):
@@ -203,73 +211,298 @@ async def chat(request: Request) -> dict:
                 raise ToolError("invalid_param", "confirm_draft_ids must be non-empty list")
             return service.commit_drafts(cleaned)
 
-        image = body.get("image")
-        audio = body.get("audio")
+        # Transcription and drafting share one budget; the transcription task
+        # and the threadpool call both inherit it through the context.
+        with deadline_scope(_request_deadline_seconds(request)):
+            audio = body.get("audio")
+            images_list = _collect_images(body)
+
+            transcription_task: asyncio.Future[str] | None = None
+            if audio:
+                if not isinstance(audio, str):
+                    raise ToolError("invalid_param", "audio must be base64 string")
+                provider = load_provider_from_config()
+                if not provider:
+                    raise ToolError("llm_unavailable", "LLM provider not configured for audio transcription")
+                # Start transcription first; image preprocessing and the tag parse
+                # below overlap with it instead of waiting for it.
+                transcription_task = asyncio.ensure_future(run_in_threadpool(transcribe_audio, provider, audio))
+
+            try:
+                if images_list:
+                    # Warms the preprocessor cache that create_drafts reads from.
+                    await run_in_threadpool(prepare_images, images_list)
+                text, type_hint = _extract_type_tag(text, type_hint)
+            except BaseException:
+                if transcription_task is not None:
+                    transcription_task.cancel()
+                raise
+
+            if transcription_task is not None:
+                transcription = await transcription_task
+                # Use the transcribed text. Prepend or replace as needed.
+                # We'll just set it as the primary text for intent routing.
+                if not text:
+                    text = transcription
+                else:
+                    text = f"{text}\n\n[语音附加内容]: {transcription}"
+                text, type_hint = _extract_type_tag(text, type_hint)
+
+            if not (text and text.strip()) and not images_list and not audio:
+                raise ToolError("invalid_param", "text, images, or audio must be provided")
+            _validate_type_hint(type_hint)
+
+            request_id = body.get("request_id")
+            if request_id is not None and (not isinstance(request_id, str) or not request_id.strip()):
+                raise ToolError("invalid_param", "request_id must be non-empty string")
+            progressive = body.get("progressive", False)
+            if not isinstance(progressive, bool):
+                raise ToolError("invalid_param", "progressive must be boolean")
+            return await run_in_threadpool(
+                service.handle_progressive_request if progressive else service.handle_draft_request,
+                request_id.strip() if request_id else None,
+                text.strip() if text else "",
+                image_base64s=images_list if images_list else None,
+                type_hint=type_hint.strip() if isinstance(type_hint, str) else None,
+                draft_defaults=draft_defaults if isinstance(draft_defaults, dict) else None,
+            )
+    except ToolError as exc:
+        raise HTTPException(status_code=400, detail={"code": exc.code, "message": exc.message}) from exc
+    finally:
+        service.close()
 
-        images_list: list[str] = []
-        if isinstance(images, list):
-            for item in images:
-                if not isinstance(item, str) or not item.strip():
-                    raise ToolError("invalid_param", "images must be list of base64 strings")
-                images_list.append(item)
-        elif images is not None:
-            raise ToolError("invalid_param", "images must be list of base64 strings")
-
-        if image and isinstance(image, str):
-            images_list.append(image)
-        
-        if audio:
-            provider = load_provider_from_config()
-            if not provider:
-                raise ToolError("llm_unavailable", "LLM provider not configured for audio transcription")
-            transcription = provider.transcribe_audio(audio)
-            
-            # Use the transcribed text. Prepend or replace as needed. 
-            # We'll just set it as the primary text for intent routing.
-            if not text:
-                text = transcription
-            else:
-                text = f"{text}\n\n[语音附加内容]: {transcription}"
-
-        if isinstance(text, str) and text.strip():
-            match = re.search(r"(?:^|\s)@(expense|income|transfer|repayment|lifelog|meal|task)\b", text, re.IGNORECASE)
-            if match:
-                if type_hint is None:
-                    type_hint = match.group(1).lower()
-                text = (text[: match.start()] + text[match.end() :]).strip()
 
+@router.post("/chat/stream")
+async def chat_stream(request: Request) -> StreamingResponse:
+    """Draft creation as Server-Sent Events.
+
+    Emits "stage" markers (accepted, transcribed, classified, routed),
+    "reply_delta" pieces of a chat reply, a "draft" preview per tool call
+    as soon as the router has produced it, and finally "done" with the same
+    body /chat would return (or "error" with code and message). Only draft
+    creation is streamed; confirm, undo and edit stay on /chat.
+    """
+    try:
+        body = await request.json()
+    except json.JSONDecodeError as exc:
+        raise HTTPException(
+            status_code=400,
+            detail={"code": "invalid_json", "message": "Request body must be JSON"},
+        ) from exc
+
+    try:
+        text = body.get("text")
+        type_hint = body.get("type_hint")
+        draft_defaults = body.get("draft_defaults")
+        audio = body.get("audio")
+        _validate_draft_defaults(draft_defaults)
+        images_list = _collect_images(body)
+        if audio is not None and not isinstance(audio, str):
+            raise ToolError("invalid_param", "audio must be base64 string")
+        provider = load_provider_from_config()
+        if audio and not provider:
+            raise ToolError("llm_unavailable", "LLM provider not configured for audio transcription")
+        if text is not None and not isinstance(text, str):
+            raise ToolError("invalid_param", "text must be string")
+        text, type_hint = _extract_type_tag(text, type_hint)
         if not (text and text.strip()) and not images_list and not audio:
             raise ToolError("invalid_param", "text, images, or audio must be provided")
-        if type_hint is not None:
-            if not isinstance(type_hint, str) or not type_hint.strip():
-                raise ToolError("invalid_param", "type_hint must be non-empty string")
-            allowed_type_hints = {"expense", "income", "transfer", "repayment", "lifelog", "meal", "task"}
-            if type_hint.strip() not in allowed_type_hints:
-                raise ToolError(
-                    "invalid_param",
-                    f"type_hint must be one of {sorted(allowed_type_hints)}",
+        _validate_type_hint(type_hint)
+        request_id = body.get("request_id")
+        if request_id is not None and (not isinstance(request_id, str) or not request_id.strip()):
+            raise ToolError("invalid_param", "request_id must be non-empty string")
+        budget = _request_deadline_seconds(request)
+    except ToolError as exc:
+        raise HTTPException(status_code=400, detail={"code": exc.code, "message": exc.message}) from exc
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[tuple[str, dict[str, Any]] | None] = asyncio.Queue()
+    disconnected = threading.Event()
+
+    def emit(event: str, data: dict[str, Any]) -> None:
+        # After a disconnect the work still finishes (and is saved under
+        # request_id for a retry); its events are just dropped.
+        if not disconnected.is_set():
+            loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    def work() -> None:
+        nonlocal text, type_hint
+        service = get_orchestrator_service()
+        try:
+            with deadline_scope(budget):
+                if audio:
+                    transcription = transcribe_audio(provider, audio)
+                    emit("stage", {"stage": "transcribed", "text": transcription})
+                    text = transcription if not text else f"{text}\n\n[语音附加内容]: {transcription}"
+                    text, type_hint = _extract_type_tag(text, type_hint)
+                response = service.handle_draft_request(
+                    request_id.strip() if request_id else None,
+                    text.strip() if text else "",
+                    image_base64s=images_list or None,
+                    type_hint=type_hint.strip() if isinstance(type_hint, str) else None,
+                    draft_defaults=draft_defaults if isinstance(draft_defaults, dict) else None,
+                    on_event=emit,
                 )
+            emit("done", response)
+        except ToolError as exc:
+            emit("error", {"code": exc.code, "message": exc.message})
+        except Exception:  # noqa: BLE001
+            logger.exception("chat stream failed")
+            emit("error", {"code": "internal_error", "message": "internal error"})
+        finally:
+            service.close()
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            yield _sse_event("stage", {"stage": "accepted"})
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                yield _sse_event(*item)
+        finally:
+            disconnected.set()
 
-        request_id = body.get("request_id") or str(uuid.uuid4())
-        draft_result = service.create_drafts(
-            text.strip() if text else "",
-            image_base64s=images_list if images_list else None,
-            type_hint=type_hint.strip() if isinstance(type_hint, str) else None,
+    worker = asyncio.ensure_future(run_in_threadpool(work))
+    _stream_workers.add(worker)
+    worker.add_done_callback(_stream_workers.discard)
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they are written.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/chat/requests/{request_id}")
+def chat_request_status(request_id: str) -> dict:
+    service = get_orchestrator_service()
+    try:
+        return service.get_request_status(request_id)
+    except ToolError as exc:
+        status_code = 404 if exc.code == "not_found" else 400
+        raise HTTPException(status_code=status_code, detail={"code": exc.code, "message": exc.message}) from exc
+    finally:
+        service.close()
+
+
+@router.post("/chat/batch")
+async def chat_batch(request: Request) -> dict:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError as exc:
+        raise HTTPException(
+            status_code=400,
+            detail={"code": "invalid_json", "message": "Request body must be JSON"},
+        ) from exc
+
+    texts = body.get("texts")
+    request_id = body.get("request_id")
+    draft_defaults = body.get("draft_defaults")
+
+    service = get_orchestrator_service()
+    try:
+        if not isinstance(texts, list) or not texts:
+            raise ToolError("invalid_param", "texts must be non-empty list")
+        if len(texts) > MAX_BATCH_TEXTS:
+            raise ToolError("invalid_param", f"texts must have at most {MAX_BATCH_TEXTS} items")
+        items: list[tuple[str, str | None]] = []
+        for item in texts:
+            if not isinstance(item, str) or not item.strip():
+                raise ToolError("invalid_param", "texts must be list of non-empty strings")
+            text, type_hint = _extract_type_tag(item, None)
+            items.append((text.strip(), type_hint))
+        if request_id is not None and (not isinstance(request_id, str) or not request_id.strip()):
+            raise ToolError("invalid_param", "request_id must be non-empty string")
+        _validate_draft_defaults(draft_defaults)
+
+        return await run_in_threadpool(
+            service.handle_batch_request,
+            request_id.strip() if request_id else None,
+            items,
             draft_defaults=draft_defaults if isinstance(draft_defaults, dict) else None,
         )
-        if draft_result.get("need_clarification"):
-            return draft_result
-
-        drafts = draft_result["drafts"]
-        cards = draft_result.get("cards", [])
-        items = service.save_drafts(request_id, drafts)
-        return {
-            "drafts": items,
-            "cards": cards,
-            "request_id": request_id,
-            "reply_to_user": draft_result.get("reply_to_user"),
-        }
     except ToolError as exc:
         raise HTTPException(status_code=400, detail={"code": exc.code, "message": exc.message}) from exc
     finally:
         service.close()
+
+
+def _collect_images(body: dict) -> list[str]:
+    images = body.get("images")
+    image = body.get("image")
+    images_list: list[str] = []
+    if isinstance(images, list):
+        for item in images:
+            if not isinstance(item, str) or not item.strip():
+                raise ToolError("invalid_param", "images must be list of base64 strings")
+            images_list.append(item)
+    elif images is not None:
+        raise ToolError("invalid_param", "images must be list of base64 strings")
+    if image and isinstance(image, str):
+        images_list.append(image)
+    return images_list
+
+
+def _validate_type_hint(type_hint: object) -> None:
+    if type_hint is None:
+        return
+    if not isinstance(type_hint, str) or not type_hint.strip():
+        raise ToolError("invalid_param", "type_hint must be non-empty string")
+    allowed_type_hints = {"expense", "income", "transfer", "repayment", "lifelog", "meal", "task"}
+    if type_hint.strip() not in allowed_type_hints:
+        raise ToolError(
+            "invalid_param",
+            f"type_hint must be one of {sorted(allowed_type_hints)}",
+        )
+
+
+def _validate_draft_defaults(draft_defaults: object) -> None:
+    if draft_defaults is not None and not isinstance(draft_defaults, dict):
+        raise ToolError("invalid_param", "draft_defaults must be object")
+    if isinstance(draft_defaults, dict) and "account_id" in draft_defaults:
+        account_id = draft_defaults.get("account_id")
+        if account_id is not None:
+            if not isinstance(account_id, int) or account_id <= 0:
+                raise ToolError("invalid_param", "draft_defaults.account_id must be positive integer")
+    if isinstance(draft_defaults, dict) and "category" in draft_defaults:
+        category = draft_defaults.get("category")
+        if category is not None:
+            if not isinstance(category, str) or not category.strip():
+                raise ToolError("invalid_param", "draft_defaults.category must be non-empty string")
+            consts = get_constants()
+            allowed = set(consts.expense.categories) | set(consts.income.categories)
+            if category.strip() not in allowed:
+                raise ToolError("invalid_param", "draft_defaults.category is invalid")
+    if isinstance(draft_defaults, dict):
+        for field in ("from_account_id", "to_account_id"):
+            if field in draft_defaults:
+                value = draft_defaults.get(field)
+                if value is not None:
+                    if not isinstance(value, int) or value <= 0:
+                        raise ToolError("invalid_param", f"draft_defaults.{field} must be positive integer")
+
+
+def _sse_event(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _request_deadline_seconds(request: Request) -> float:
+    """Configured request budget, shortened by the client's timeout header if given."""
+    global _request_budget
+    if _request_budget is None:
+        with _request_budget_lock:
+            if _request_budget is None:
+                _request_budget = load_server_settings().request_budget_seconds
+    budget = _request_budget
+    raw = request.headers.get(REQUEST_TIMEOUT_HEADER)
+    if raw is None:
+        return budget
+    try:
+        client_ms = int(raw)
+    except ValueError as exc:
+        raise ToolError("invalid_param", f"{REQUEST_TIMEOUT_HEADER} must be integer milliseconds") from exc
+    if client_ms <= 0:
+        raise ToolError("invalid_param", f"{REQUEST_TIMEOUT_HEADER} must be positive")
+    return min(client_ms / 1000.0, budget) if budget > 0 else client_ms / 1000.0
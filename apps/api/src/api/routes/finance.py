@@ -8,7 +8,7 @@ from api.repositories.accounts_repo import AccountsRepository
 from api.repositories.finance_repo import FinanceRepository
 from api.services.accounts_service import AccountsService
 from api.services.finance_service import FinanceService
-from api.tools.events import create_transfer
+from api.tools.registry import get_tool
 
 router = APIRouter(prefix="/api/finance", tags=["finance"])
 
@@ -105,13 +105,15 @@ def set_account_balance(account_id: int, payload: AccountBalancePayload) -> dict
 def create_finance_transfer(payload: TransferPayload) -> dict:
     if not payload.currency.strip():
         raise ToolError("invalid_param", "currency must be non-empty string")
-    return create_transfer(
-        amount=payload.amount,
-        from_account_id=payload.from_account_id,
-        to_account_id=payload.to_account_id,
-        currency=payload.currency,
-        note=payload.note,
-        happened_at=payload.happened_at,
+    return get_tool("create_transfer").run(
+        {
+            "amount": payload.amount,
+            "from_account_id": payload.from_account_id,
+            "to_account_id": payload.to_account_id,
+            "currency": payload.currency,
+            "note": payload.note,
+            "happened_at": payload.happened_at,
+        }
     )
 
 
@@ -2,7 +2,9 @@
 
 from fastapi import APIRouter
 
-from api.router.provider import load_provider_from_config
+from api.core.metrics import get_metrics
+from api.router.provider import circuit_breaker_states, load_provider_from_config
+from api.router.scheduler import llm_scheduler_states
 from api.settings import load_llm_settings, load_server_settings
 
 router = APIRouter()
@@ -15,10 +17,26 @@ def router_health() -> dict:
     server = load_server_settings()
     model = settings.model if settings else None
     base_url = settings.base_url if settings else None
+    providers = []
+    if settings is not None:
+        for endpoint in [settings, *settings.alternates]:
+            providers.append(
+                {
+                    "name": endpoint.name,
+                    "base_url": endpoint.base_url,
+                    "model": endpoint.model,
+                    "priority": endpoint.priority,
+                }
+            )
     return {
         "llm_configured": provider is not None,
         "model": model,
         "base_url": base_url,
+        "providers": providers,
+        "hedge": bool(settings and settings.hedge),
+        "breakers": circuit_breaker_states(),
+        "schedulers": llm_scheduler_states(),
         "auth_enabled": bool(server.bearer_token),
         "cors_allow_origins": server.cors_allow_origins,
+        "metrics": get_metrics().snapshot(),
     }
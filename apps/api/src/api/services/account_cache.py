@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Iterable, Optional
+
+from api.core import metrics
+from api.db.connection import ensure_tables, get_connection
+from api.repositories.accounts_repo import AccountsRepository
+from api.settings import AccountCacheSettings, load_account_cache_settings
+
+
+class AccountCache:
+    """In-process copy of account rows, keyed by id.
+
+    Accounts change rarely, but every expense/income/transfer draft card and
+    every committed tool call looks them up. Rows (and ids that do not exist)
+    are kept for ttl_seconds; AccountsService drops an id once the
+    transaction that creates or rebalances that account commits, and the
+    TTL bounds how long another process's change can go unseen. Misses for a whole id list are loaded
+    with one query.
+    """
+
+    def __init__(self, settings: AccountCacheSettings) -> None:
+        self._settings = settings
+        self._lock = threading.Lock()
+        # account_id -> (row or None when the id does not exist, loaded_at)
+        self._entries: dict[int, tuple[Optional[dict[str, Any]], float]] = {}
+
+    def get(self, account_id: int, repo: Optional[AccountsRepository] = None) -> Optional[dict[str, Any]]:
+        return self.get_many([account_id], repo).get(account_id)
+
+    def get_many(
+        self, account_ids: Iterable[int], repo: Optional[AccountsRepository] = None
+    ) -> dict[int, dict[str, Any]]:
+        """Rows for the ids that exist. Misses are read through repo, or a fresh connection."""
+        wanted = list(dict.fromkeys(account_ids))
+        found: dict[int, dict[str, Any]] = {}
+        misses: list[int] = []
+        now = time.monotonic()
+        with self._lock:
+            for account_id in wanted:
+                entry = self._entries.get(account_id)
+                if entry is None or now - entry[1] >= self._settings.ttl_seconds:
+                    misses.append(account_id)
+                elif entry[0] is not None:
+                    found[account_id] = dict(entry[0])
+        if len(wanted) > len(misses):
+            metrics.incr("accounts.cache_hits", len(wanted) - len(misses))
+        if not misses:
+            return found
+
+        metrics.incr("accounts.cache_misses", len(misses))
+        rows = self._load(misses, repo)
+        loaded = {int(row["id"]): row for row in rows}
+        if self._settings.ttl_seconds > 0:
+            loaded_at = time.monotonic()
+            with self._lock:
+                for account_id in misses:
+                    self._entries[account_id] = (loaded.get(account_id), loaded_at)
+        for account_id, row in loaded.items():
+            found[account_id] = dict(row)
+        return found
+
+    def invalidate(self, account_id: Optional[int] = None) -> None:
+        with self._lock:
+            if account_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(account_id, None)
+
+    def _load(self, account_ids: list[int], repo: Optional[AccountsRepository]) -> list[dict[str, Any]]:
+        if repo is not None:
+            return repo.get_accounts(account_ids)
+        with get_connection() as conn:
+            ensure_tables(conn)
+            return AccountsRepository(conn).get_accounts(account_ids)
+
+
+_cache: Optional[AccountCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_account_cache() -> AccountCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AccountCache(load_account_cache_settings())
+    return _cache
+
+
+__all__ = ["AccountCache", "get_account_cache"]
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from api.db.connection import ToolError, normalize_iso8601, now_iso8601
 from api.repositories.accounts_repo import AccountsRepository
+from api.services.account_cache import get_account_cache
 
 ACCOUNT_KINDS = {"asset", "liability"}
 ACCOUNT_SUBTYPES = {
@@ -27,10 +28,8 @@ class AccountsService:
         return self._repo.list_accounts(active_only=True)
 
     def get_account(self, account_id: int) -> dict:
-        account = self._repo.get_account(account_id)
-        if account is None or account.get("is_active") != 1:
-            raise ToolError("not_found", "account not found", {"account_id": account_id})
-        return account
+        """Active account by id, served from the account cache when fresh."""
+        return _require_active(get_account_cache().get(account_id, self._repo), account_id)
 
     def create_account(
         self,
@@ -63,7 +62,8 @@ class AccountsService:
             created_at=now,
             updated_at=now,
         )
-        return self.get_account(account_id)
+        self._invalidate_on_commit(account_id)
+        return _require_active(self._repo.get_account(account_id), account_id)
 
     def set_balance(
         self,
@@ -79,7 +79,19 @@ class AccountsService:
             balance_base_at=normalize_iso8601(balance_base_at),
             updated_at=now_iso8601(),
         )
-        return self.get_account(account_id)
+        self._invalidate_on_commit(account_id)
+        return _require_active(self._repo.get_account(account_id), account_id)
+
+    def _invalidate_on_commit(self, account_id: int) -> None:
+        # Dropping the row before the caller commits would let another
+        # request cache the old row again in the meantime.
+        self._repo._conn.on_commit(lambda: get_account_cache().invalidate(account_id))
+
+
+def _require_active(account: dict | None, account_id: int) -> dict:
+    if account is None or account.get("is_active") != 1:
+        raise ToolError("not_found", "account not found", {"account_id": account_id})
+    return account
 
 
 def _normalize_balance_for_kind(balance: float, kind: str) -> float:
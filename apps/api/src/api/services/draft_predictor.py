@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from api.core import metrics
+from api.core.text_terms import NUMBER_TERM, lexical_terms
+from api.db.connection import ensure_tables, get_connection, now_iso8601
+from api.repositories.predictions_repo import PredictionRepository
+from api.settings import PredictorSettings, load_predictor_settings
+
+logger = logging.getLogger("api.orchestrator")
+
+# Draft fields the predictor learns, per tool.
+PREDICTED_FIELDS: dict[str, tuple[str, ...]] = {
+    "create_expense": ("category", "account_id"),
+    "create_income": ("category", "account_id"),
+}
+# Terms per input that are counted; long notes add noise, not signal.
+_MAX_TERMS = 32
+
+
+@dataclass(frozen=True)
+class FieldPrediction:
+    value: Any
+    # Share of the vote and total evidence behind value.
+    share: float
+    weight: float
+
+
+class DraftFieldPredictor:
+    """Predicts category / account_id from the words in a note.
+
+    Counts how often each text term (see lexical_terms) ended up with each
+    field value in committed drafts, with edit_draft corrections counting
+    extra. Counters live in draft_field_stats and are mirrored in memory.
+    Learning updates both, and the in-memory copy is reloaded every
+    refresh_seconds to pick up other processes' updates.
+    """
+
+    def __init__(self, settings: PredictorSettings) -> None:
+        self._settings = settings
+        self._lock = threading.Lock()
+        self._stats: dict[tuple[str, str, str], dict[str, float]] = {}
+        self._loaded_at: Optional[float] = None
+        self._refreshing = False
+
+    @property
+    def settings(self) -> PredictorSettings:
+        return self._settings
+
+    def predict(self, tool_name: str, text: str | None) -> dict[str, FieldPrediction]:
+        fields = PREDICTED_FIELDS.get(tool_name)
+        if not self._settings.enabled or not fields or not text:
+            return {}
+        self._refresh_if_stale()
+        terms = _learnable_terms(text)
+        predictions: dict[str, FieldPrediction] = {}
+        with self._lock:
+            for field in fields:
+                votes: dict[str, float] = defaultdict(float)
+                evidence: dict[str, float] = defaultdict(float)
+                for term in terms:
+                    counts = self._stats.get((tool_name, term, field))
+                    if not counts:
+                        continue
+                    # Each term votes with its own distribution, so a term seen
+                    # a hundred times does not drown out a rarer, sharper one.
+                    total = sum(counts.values())
+                    for value, weight in counts.items():
+                        votes[value] += weight / total
+                        evidence[value] += weight
+                if not votes:
+                    continue
+                best = max(votes, key=lambda v: (votes[v], evidence[v]))
+                share = votes[best] / sum(votes.values())
+                if share >= self._settings.min_share and evidence[best] >= self._settings.min_weight:
+                    predictions[field] = FieldPrediction(_decode(field, best), share, evidence[best])
+        for field in predictions:
+            metrics.incr("predictor.hits", field=field)
+        return predictions
+
+    def learn(
+        self,
+        conn,
+        tool_name: str,
+        text: str | None,
+        values: dict[str, Any],
+        weight: float = 1.0,
+    ) -> None:
+        """Count values (a subset of the tool's predicted fields) against the terms of text."""
+        fields = PREDICTED_FIELDS.get(tool_name)
+        if not self._settings.enabled or not fields or not text:
+            return
+        terms = _learnable_terms(text)
+        encoded = {field: _encode(field, values.get(field)) for field in fields}
+        encoded = {field: value for field, value in encoded.items() if value is not None}
+        if not terms or not encoded:
+            return
+        rows = [
+            (tool_name, term, field, value, weight)
+            for term in terms
+            for field, value in encoded.items()
+        ]
+        PredictionRepository(conn).add_field_weights(rows, now_iso8601())
+        conn.commit()
+        with self._lock:
+            for tool, term, field, value, w in rows:
+                counts = self._stats.setdefault((tool, term, field), {})
+                counts[value] = counts.get(value, 0.0) + w
+        metrics.incr("predictor.learned", len(encoded), tool=tool_name)
+
+    def load(self, rows: list[dict[str, Any]]) -> None:
+        stats: dict[tuple[str, str, str], dict[str, float]] = {}
+        for row in rows:
+            key = (row["tool_name"], row["token"], row["field"])
+            stats.setdefault(key, {})[row["value"]] = float(row["weight"])
+        with self._lock:
+            self._stats = stats
+            self._loaded_at = time.monotonic()
+        metrics.set_gauge("predictor.terms", len(stats))
+
+    def _refresh_if_stale(self) -> None:
+        with self._lock:
+            loaded_at = self._loaded_at
+            fresh = loaded_at is not None and time.monotonic() - loaded_at < self._settings.refresh_seconds
+            if fresh or self._refreshing:
+                return
+            self._refreshing = True
+        try:
+            with get_connection() as conn:
+                ensure_tables(conn)
+                rows = PredictionRepository(conn).list_field_stats()
+        except Exception as exc:  # noqa: BLE001
+            # Drafts fall back to the fixed defaults until the next refresh.
+            logger.warning("draft predictor refresh failed: %s", exc)
+            with self._lock:
+                self._loaded_at = time.monotonic()
+            return
+        else:
+            self.load(rows)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+def _learnable_terms(text: str) -> list[str]:
+    # Amounts say nothing about the category.
+    terms = sorted(t for t in lexical_terms(text) if t != NUMBER_TERM)
+    return terms[:_MAX_TERMS]
+
+
+def _encode(field: str, value: Any) -> Optional[str]:
+    if field == "account_id":
+        return str(value) if isinstance(value, int) and not isinstance(value, bool) and value > 0 else None
+    if isinstance(value, str) and value.strip():
+        return value.strip()
+    return None
+
+
+def _decode(field: str, value: str) -> Any:
+    return int(value) if field == "account_id" else value
+
+
+_predictor: Optional[DraftFieldPredictor] = None
+_predictor_lock = threading.Lock()
+
+
+def get_draft_predictor() -> DraftFieldPredictor:
+    global _predictor
+    if _predictor is None:
+        with _predictor_lock:
+            if _predictor is None:
+                _predictor = DraftFieldPredictor(load_predictor_settings())
+    return _predictor
+
+
+__all__ = [
+    "DraftFieldPredictor",
+    "FieldPrediction",
+    "PREDICTED_FIELDS",
+    "get_draft_predictor",
+]
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+
+from api.core import metrics
+from api.settings import DraftStoreSettings, load_draft_store_settings
+
+
+@dataclass
+class _Entry:
+    row: dict[str, Any]
+    touched_at: float
+
+
+class DraftStore:
+    """Recent draft rows of orchestrator_logs, kept in memory.
+
+    Drafts are saved, edited a few times and confirmed within minutes, so
+    save_drafts and edit_draft put their rows here and edit_draft reads them
+    back without a query. Only reads are cached: every edit is written to
+    Postgres before it returns. Another worker process may have edited a
+    draft since it was cached, so edit_draft writes conditionally on the
+    cached payload, and commit_drafts always reads the drafts it confirms
+    from Postgres.
+
+    Rows leave after ttl_seconds or when more than max_entries are held
+    (least recently used first).
+    """
+
+    def __init__(self, settings: DraftStoreSettings) -> None:
+        self._settings = settings
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self._settings.enabled and self._settings.max_entries > 0
+
+    def put_many(self, rows: Iterable[dict[str, Any]]) -> None:
+        """Remember draft rows that match what Postgres holds."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for row in rows:
+                draft_id = row["draft_id"]
+                self._entries[draft_id] = _Entry(row=dict(row), touched_at=now)
+                self._entries.move_to_end(draft_id)
+            self._evict()
+
+    def get(self, draft_id: str) -> Optional[dict[str, Any]]:
+        return self.get_many([draft_id]).get(draft_id)
+
+    def get_many(self, draft_ids: Iterable[str]) -> dict[str, dict[str, Any]]:
+        """Rows held for draft_ids; ids missing from the result must be read from Postgres."""
+        if not self.enabled:
+            return {}
+        found: dict[str, dict[str, Any]] = {}
+        misses = 0
+        now = time.monotonic()
+        with self._lock:
+            for draft_id in draft_ids:
+                entry = self._entries.get(draft_id)
+                if entry is not None and now - entry.touched_at >= self._settings.ttl_seconds:
+                    del self._entries[draft_id]
+                    entry = None
+                if entry is None:
+                    misses += 1
+                    continue
+                entry.touched_at = now
+                self._entries.move_to_end(draft_id)
+                found[draft_id] = dict(entry.row)
+        if found:
+            metrics.incr("drafts.store_hits", len(found))
+        if misses:
+            metrics.incr("drafts.store_misses", misses)
+        return found
+
+    def discard(self, draft_id: str) -> None:
+        with self._lock:
+            self._entries.pop(draft_id, None)
+
+    def _evict(self) -> None:
+        # Caller holds self._lock.
+        while len(self._entries) > self._settings.max_entries:
+            self._entries.popitem(last=False)
+
+
+_store: Optional[DraftStore] = None
+_store_lock = threading.Lock()
+
+
+def get_draft_store() -> DraftStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DraftStore(load_draft_store_settings())
+    return _store
+
+
+__all__ = ["DraftStore", "get_draft_store"]
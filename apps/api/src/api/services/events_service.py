@@ -89,6 +89,17 @@ class EventService:
             raise ToolError("not_found", "event not found", {"event_id": event_id})
         return self._row_to_event(row)
 
+    def set_deleted_many(self, event_ids: list[int], is_deleted: int) -> dict[int, dict[str, Any]]:
+        """set_deleted for many events with one statement, keyed by event id.
+
+        Ids that do not exist or already have that is_deleted value are left
+        out; the caller decides whether that is an error.
+        """
+        if not event_ids:
+            return {}
+        rows = self._repo.update_is_deleted_many(event_ids, is_deleted, now_iso8601())
+        return {int(row["id"]): self._row_to_event(row) for row in rows}
+
     def patch_event_data(self, event_id: int, patch: dict[str, Any]) -> dict[str, Any]:
         row = self._repo.get_by_id(event_id)
         if row is None:
@@ -1,15 +1,24 @@
 ﻿from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import timedelta
-import threading
-from typing import Any, Iterable, Optional
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Callable, Iterable, Optional, Sequence
 from uuid import uuid4
 
+from api.core import metrics
+from api.core.deadline import remaining_budget
+from api.core.images import PreparedImage, get_image_preprocessor, prepare_images
+from api.core.singleflight import SingleFlight
 from api.core.time_parse import parse_natural_time
 from api.core.constants_loader import get_constants
 from api.db.connection import (
     DEFAULT_TZ,
+    DBConnection,
     ToolError,
     ensure_iso8601,
     ensure_tables,
@@ -21,23 +30,22 @@ from api.db.connection import (
     require_enum,
     require_non_empty_str,
 )
-from api.repositories.accounts_repo import AccountsRepository
+from api.repositories.events_repo import EventRepository
 from api.repositories.orchestrator_repo import OrchestratorRepository
 from api.repositories.tasks_repo import TaskRepository
+from api.services.account_cache import get_account_cache
+from api.services.draft_predictor import PREDICTED_FIELDS, get_draft_predictor
+from api.services.draft_store import get_draft_store
+from api.services.events_service import EventService
 from api.services.tasks_service import TaskService
-from api.router.route import route as llm_route, classify_intent, chat_reply
-from api.router.provider import load_provider_from_config
-from api.tools.events import (
-    create_expense,
-    create_income,
-    create_lifelog,
-    create_meal,
-    create_mood,
-    create_transfer,
-    undo_event,
-    soft_delete_event,
-)
-from api.tools.tasks import create_task, postpone_task, soft_delete_task, undo_task
+from api.router.route import route as llm_route, route_batch as llm_route_batch, classify_intent, chat_reply
+from api.router.example_store import get_example_store
+from api.router.provider import LLMProvider, load_provider_from_config
+from api.router.scheduler import BACKGROUND, llm_priority, submit_with_context
+from api.router.schema import RouterDecision, ToolCall
+from api.tools.events import undo_event
+from api.tools.registry import get_tool, get_tool_registry
+from api.tools.tasks import postpone_task, soft_delete_task
 
 
 @dataclass
@@ -47,10 +55,46 @@ class Draft:
     payload: dict[str, Any]
     confidence: float
     card: dict[str, Any]
+    # Position in the uploaded images of the photo this draft was read from.
+    source_image_index: Optional[int] = None
 
 
-_commit_lock = threading.Lock()
+# Collapses client double-submits of the same /chat message into one pipeline run.
+_draft_flight: SingleFlight[dict[str, Any]] = SingleFlight("orchestrator.draft_requests", window_seconds=10.0)
+# Stored /chat responses let a retried request_id replay without LLM calls.
+_RESPONSE_TTL_SECONDS = 24 * 3600
+_RESPONSE_PURGE_INTERVAL_SECONDS = 600.0
+_last_response_purge = 0.0
 _DISABLED_CHAT_TOOLS = {"create_mood"}
+_FORCE_FALLBACK_HINTS = {"expense", "income", "transfer", "repayment", "lifelog", "meal", "task"}
+_LLM_FALLBACK_CODES = {
+    "deadline_exceeded",
+    "llm_queue_timeout",
+    "llm_unavailable",
+    "llm_error",
+    "router_invalid_json",
+    "router_invalid_schema",
+}
+# Remaining request budget (seconds) below which an LLM stage is skipped.
+ROUTE_MIN_BUDGET_SECONDS = 3.0
+# Deterministic drafts whose category came from the user's history are more
+# trustworthy, which also lets the router settle for the fast model.
+_PREDICTED_CONFIDENCE_BONUS = 0.15
+_PREDICTED_CONFIDENCE_CAP = 0.85
+CLASSIFY_MIN_BUDGET_SECONDS = 5.0
+
+_image_route_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="route-image")
+
+logger = logging.getLogger("api.orchestrator")
+
+# Progressive /chat: LLM refinements run here. Their pending / ready / failed
+# state is kept in orchestrator_responses, so any worker can answer a poll.
+_refine_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="draft-refine")
+# A pending reservation whose worker died expires instead of staying pending.
+_PENDING_TTL_SECONDS = 600
+
+# Receives (event, data) progress notifications while drafts are created.
+DraftEventSink = Callable[[str, dict[str, Any]], None]
 
 
 class OrchestratorService:
@@ -66,14 +110,22 @@ class OrchestratorService:
         image_base64s: list[str] | None = None,
         type_hint: str | None = None,
         draft_defaults: dict[str, Any] | None = None,
+        on_event: DraftEventSink | None = None,
     ) -> dict[str, Any]:
+        """Route the input to drafts (or a chat reply / clarifying question).
+
+        on_event, if given, is told about progress as it happens: "stage"
+        markers, "reply_delta" pieces of a streamed chat reply and a "draft"
+        preview for each tool call as soon as the router has produced it.
+        The returned result is authoritative; previews carry no draft_id.
+        """
         routed_text = _inject_type_hint(text, type_hint)
         provider = load_provider_from_config()
         has_images = bool(image_base64s)
         text_amount = _extract_amount(text)
 
         # Deterministic route for explicit tags: avoid LLM misclassification.
-        force_fallback_route = type_hint in {"expense", "income", "transfer", "repayment", "lifelog", "meal", "task"}
+        force_fallback_route = type_hint in _FORCE_FALLBACK_HINTS
         if has_images and type_hint in {"expense", "income", "meal"} and text_amount is None:
             force_fallback_route = False
 
@@ -98,12 +150,31 @@ class OrchestratorService:
                 "cards": [],
             }
         
+        if provider is None or not provider.available:
+            # LLM not configured or its circuit is open: answer from the
+            # deterministic path instead of waiting out timeouts.
+            metrics.incr("orchestrator.llm_bypassed")
+            return _fallback_result(text, type_hint, image_base64s, draft_defaults)
+
+        # Downscale/re-encode once and reuse for every LLM stage below.
+        prepared_images = prepare_images(image_base64s)
+        llm_images = [p.data_url for p in prepared_images] or None
+
+        if not _has_budget(ROUTE_MIN_BUDGET_SECONDS):
+            # Too little of the request budget left for a router call to finish.
+            metrics.incr("orchestrator.deadline_fallback", stage="route")
+            return _fallback_result(text, type_hint, image_base64s, draft_defaults)
+
         # Fast intent classification using gpt-4o-mini.
         # If the user explicitly gives type_hint, skip chat short-circuit.
-        if type_hint is None:
-            intent = classify_intent(routed_text, image_base64s, provider)
+        # Classification is skipped when the budget only covers the route call.
+        if type_hint is None and _has_budget(CLASSIFY_MIN_BUDGET_SECONDS):
+            intent = classify_intent(routed_text, llm_images, provider)
+            if on_event is not None:
+                on_event("stage", {"stage": "classified", "intent": intent})
             if intent == "chat":
-                reply = chat_reply(routed_text, image_base64s, provider)
+                on_delta = _reply_streamer(on_event) if on_event is not None else None
+                reply = chat_reply(routed_text, llm_images, provider, on_delta=on_delta)
                 return {
                     "need_clarification": False,
                     "reply_to_user": reply,
@@ -111,125 +182,420 @@ class OrchestratorService:
                     "cards": []
                 }
 
-        try:
-            decision = llm_route(text=routed_text, image_base64s=image_base64s, provider=provider)
-            if decision.need_clarification:
-                return {
-                    "need_clarification": True,
-                    "clarify_question": decision.clarify_question,
-                    "reply_to_user": decision.reply_to_user,
-                    "drafts": [],
-                    "cards": [c.model_dump() for c in decision.cards],
-                }
+        image_settings = get_image_preprocessor().settings
+        if 0 < image_settings.fan_out_min_images <= len(prepared_images):
+            fanned = _route_per_image(
+                text,
+                routed_text,
+                prepared_images,
+                provider,
+                type_hint,
+                draft_defaults,
+                image_settings.fan_out_parallel,
+            )
+            if fanned is not None:
+                return fanned
+            return _fallback_result(text, type_hint, image_base64s, draft_defaults)
 
-            drafts = _drafts_from_decision(decision)
-            drafts = _apply_draft_defaults(drafts, draft_defaults)
-            if not drafts and any(c.name in _DISABLED_CHAT_TOOLS for c in decision.tool_calls):
-                return {
-                    "need_clarification": False,
-                    "reply_to_user": "心情记录请使用 Dashboard 的快捷入口。",
-                    "drafts": [],
-                    "cards": [],
-                }
-            if type_hint is not None and not drafts:
-                forced = _fallback_drafts(
-                    text,
-                    type_hint=type_hint,
-                    image_base64s=image_base64s,
-                    draft_defaults=draft_defaults,
-                )
-                if forced:
-                    return {
-                        "need_clarification": False,
-                        "reply_to_user": decision.reply_to_user,
-                        "drafts": forced,
-                        "cards": [d.card for d in forced],
-                    }
-                return {
-                    "need_clarification": True,
-                    "clarify_question": _clarify_for_type_hint(type_hint),
-                    "reply_to_user": None,
-                    "drafts": [],
-                    "cards": [],
-                }
-            return {
-                "need_clarification": False,
-                "reply_to_user": decision.reply_to_user,
-                "drafts": drafts,
-                "cards": [d.card for d in drafts],
-            }
+        # The deterministic parser's confidence lets the router use the fast
+        # model for inputs it already understands.
+        fast_path = _fallback_drafts(text) if not has_images and type_hint is None else []
+        try:
+            decision = llm_route(
+                text=routed_text,
+                image_base64s=llm_images,
+                provider=provider,
+                type_hint=type_hint,
+                fast_path_confidence=fast_path[0].confidence if len(fast_path) == 1 else None,
+                on_tool_call=_draft_previewer(on_event) if on_event is not None else None,
+            )
         except ToolError as exc:
-            if exc.code not in {
-                "llm_unavailable",
-                "llm_error",
-                "router_invalid_json",
-                "router_invalid_schema",
-            }:
+            if exc.code not in _LLM_FALLBACK_CODES:
                 raise
-            drafts = _fallback_drafts(
+            if exc.code == "deadline_exceeded":
+                metrics.incr("orchestrator.deadline_fallback", stage=(exc.details or {}).get("stage", "route"))
+            return _fallback_result(text, type_hint, image_base64s, draft_defaults)
+        if on_event is not None:
+            on_event("stage", {"stage": "routed", "intent": decision.intent})
+        return _result_from_decision(decision, text, type_hint, image_base64s, draft_defaults)
+
+    def create_batch_drafts(
+        self,
+        items: list[tuple[str, str | None]],
+        draft_defaults: dict[str, Any] | None = None,
+    ) -> list[dict[str, Any]]:
+        """Create drafts for many (text, type_hint) items with as few router calls as possible.
+
+        Hinted items take the deterministic path as in create_drafts; the rest
+        are routed together by route_batch. Returns one result per item.
+        """
+        results: list[dict[str, Any] | None] = [None] * len(items)
+        pending: list[int] = []
+        for index, (text, type_hint) in enumerate(items):
+            if type_hint in _FORCE_FALLBACK_HINTS:
+                results[index] = _fallback_result(text, type_hint, None, draft_defaults)
+            else:
+                pending.append(index)
+
+        if pending:
+            provider = load_provider_from_config()
+            decisions: list[RouterDecision | None] = [None] * len(pending)
+            if provider is None or not provider.available:
+                metrics.incr("orchestrator.llm_bypassed")
+            else:
+                try:
+                    decisions = llm_route_batch(
+                        [_inject_type_hint(*items[i]) for i in pending],
+                        provider=provider,
+                        fallback_codes=_LLM_FALLBACK_CODES,
+                    )
+                except ToolError as exc:
+                    if exc.code not in _LLM_FALLBACK_CODES:
+                        raise
+            for index, decision in zip(pending, decisions):
+                text, type_hint = items[index]
+                if decision is None:
+                    results[index] = _fallback_result(text, type_hint, None, draft_defaults)
+                else:
+                    results[index] = _result_from_decision(decision, text, type_hint, None, draft_defaults)
+        return [r for r in results if r is not None]
+
+    def handle_draft_request(
+        self,
+        request_id: str | None,
+        text: str,
+        image_base64s: list[str] | None = None,
+        type_hint: str | None = None,
+        draft_defaults: dict[str, Any] | None = None,
+        on_event: DraftEventSink | None = None,
+        supersedes: Sequence[str] | None = None,
+    ) -> dict[str, Any]:
+        """Create and save drafts, sharing the work with identical concurrent requests.
+
+        Requests carrying the same client request_id, or (without one) the
+        same content, are coalesced so a double-submit yields one draft set.
+        Responses to client-supplied request_ids are persisted, so a retry
+        after a timeout replays the stored response. Only the request that
+        does the work reports progress to on_event (see create_drafts).
+        supersedes lists provisional drafts the new ones replace (see
+        _retire_superseded).
+        """
+        if request_id:
+            key = f"rid:{request_id}"
+            reason = "request_id"
+        else:
+            key = "content:" + _content_hash(text, image_base64s, type_hint, draft_defaults)
+            reason = "content"
+        effective_request_id = request_id or str(uuid4())
+
+        def compute() -> dict[str, Any]:
+            draft_result = self.create_drafts(
                 text,
-                type_hint=type_hint,
                 image_base64s=image_base64s,
+                type_hint=type_hint,
                 draft_defaults=draft_defaults,
+                on_event=on_event,
             )
-            if not drafts:
-                return {
-                    "need_clarification": True,
-                    "clarify_question": _clarify_for_type_hint(type_hint),
-                    "drafts": [],
-                }
+            if draft_result.get("need_clarification"):
+                return draft_result
+            items = self.save_drafts(
+                effective_request_id,
+                draft_result["drafts"],
+                # Image-derived drafts are not explained by the text alone.
+                input_text=None if image_base64s else text,
+            )
+            if supersedes:
+                items = self._retire_superseded(list(supersedes), items)
             return {
-                "need_clarification": False,
-                "reply_to_user": None,
-                "drafts": drafts,
-                "cards": [d.card for d in drafts],
+                "drafts": items,
+                "cards": draft_result.get("cards", []),
+                "request_id": effective_request_id,
+                "reply_to_user": draft_result.get("reply_to_user"),
             }
 
-    def save_drafts(self, request_id: str, drafts: Iterable[Draft]) -> list[dict[str, Any]]:
+        return self._run_idempotent(request_id, key, reason, compute)
+
+    def handle_progressive_request(
+        self,
+        request_id: str | None,
+        text: str,
+        image_base64s: list[str] | None = None,
+        type_hint: str | None = None,
+        draft_defaults: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        """Answer at once with the deterministic drafts and refine them in the background.
+
+        The provisional drafts are saved, so they can be confirmed right away.
+        The LLM result is stored under request_id like any /chat response and
+        supersedes the provisional drafts; clients poll get_request_status
+        (or retry with the same request_id) to pick it up and replace the
+        provisional cards. Inputs the deterministic parser cannot handle are
+        processed synchronously.
+        """
+        if request_id:
+            row = self._repo.get_response(request_id)
+            if row is not None and row["status"] != "failed":
+                # Ready: the refined response. Pending: the provisional one.
+                metrics.incr("orchestrator.replayed")
+                return json_loads(row["response_json"])
+
+        provisional = _fallback_drafts(
+            text,
+            type_hint=type_hint,
+            image_base64s=image_base64s,
+            draft_defaults=draft_defaults,
+        )
+        if not provisional:
+            return self.handle_draft_request(
+                request_id,
+                text,
+                image_base64s=image_base64s,
+                type_hint=type_hint,
+                draft_defaults=draft_defaults,
+            )
+
+        effective_request_id = request_id or str(uuid4())
+        response = {
+            "request_id": effective_request_id,
+            "status": "pending",
+            "provisional": True,
+            "reply_to_user": None,
+            "drafts": [_draft_item(d) for d in provisional],
+            "cards": [d.card for d in provisional],
+        }
+        # Claim the id before saving anything, so of concurrent retries (on
+        # any worker) only one saves provisional drafts and starts refining.
+        reserved = self._repo.reserve_response(
+            request_id=effective_request_id,
+            response_json=json_dumps(response),
+            created_at=now_iso8601(),
+            ttl_seconds=_PENDING_TTL_SECONDS,
+        )
+        if not reserved:
+            row = self._repo.get_response(effective_request_id)
+            if row is not None:
+                return json_loads(row["response_json"])
+            return {"request_id": effective_request_id, "status": "pending", "drafts": [], "cards": []}
+        try:
+            self.save_drafts(
+                effective_request_id,
+                provisional,
+                input_text=None if image_base64s else text,
+            )
+        except BaseException:
+            self.fail_request(effective_request_id, "internal_error")
+            raise
+        submit_with_context(
+            _refine_executor,
+            _refine_drafts,
+            effective_request_id,
+            [d.draft_id for d in provisional],
+            text,
+            image_base64s,
+            type_hint,
+            draft_defaults,
+        )
+        metrics.incr("orchestrator.provisional")
+        return response
+
+    def get_request_status(self, request_id: str) -> dict[str, Any]:
+        """State of a progressive request: pending, ready (with the response) or failed."""
+        row = self._repo.get_response(request_id)
+        if row is None:
+            raise ToolError("not_found", "request_id not found", {"request_id": request_id})
+        if row["status"] == "pending":
+            return {"request_id": request_id, "status": "pending"}
+        body = json_loads(row["response_json"])
+        if row["status"] == "failed":
+            return {"request_id": request_id, "status": "failed", "error": {"code": body.get("code")}}
+        return {"request_id": request_id, "status": "ready", "response": body}
+
+    def fail_request(self, request_id: str, code: str) -> None:
+        """Record that the background work for a pending request_id failed."""
+        # The failure may have left the transaction aborted.
+        self._repo._conn.rollback()
+        self._repo.fail_response(request_id, json_dumps({"code": code}))
+
+    def _retire_superseded(self, provisional_ids: list[str], items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Leave one confirmable draft set for a refined progressive request.
+
+        Normally the provisional drafts are retired. If one of them was
+        already confirmed, the refined drafts are retired instead and come
+        back with status "superseded", so the same expense is not recorded
+        twice. Runs under the commit locks of both sets.
+        """
+        refined_ids = [item["draft_id"] for item in items]
+        conn = self._repo._conn
+        try:
+            self._repo.lock_drafts(provisional_ids + refined_ids)
+            confirmed = self._repo.get_commits_by_draft_ids(provisional_ids)
+            self._repo.supersede_drafts(refined_ids if confirmed else provisional_ids, now_iso8601())
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if not confirmed:
+            return items
+        metrics.incr("orchestrator.refine_superseded")
+        return [{**item, "status": "superseded"} for item in items]
+
+    def handle_batch_request(
+        self,
+        request_id: str | None,
+        items: list[tuple[str, str | None]],
+        draft_defaults: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        """Create drafts for a batch of texts and save them under one request_id."""
+        if request_id:
+            key = f"batch-rid:{request_id}"
+            reason = "request_id"
+        else:
+            key = "batch-content:" + _content_hash(
+                json.dumps(items, ensure_ascii=False), None, None, draft_defaults
+            )
+            reason = "content"
+        effective_request_id = request_id or str(uuid4())
+
+        def compute() -> dict[str, Any]:
+            # Bulk imports queue behind interactive /chat calls for LLM capacity.
+            with llm_priority(BACKGROUND):
+                results = self.create_batch_drafts(items, draft_defaults=draft_defaults)
+            # One save for the whole batch, each draft tagged with its own text.
+            all_drafts: list[Draft] = []
+            all_texts: list[str | None] = []
+            for (text, _), result in zip(items, results):
+                drafts = result.get("drafts", [])
+                all_drafts.extend(drafts)
+                all_texts.extend([text] * len(drafts))
+            saved = self.save_drafts(effective_request_id, all_drafts, input_texts=all_texts)
+            out_items: list[dict[str, Any]] = []
+            offset = 0
+            for index, ((text, _), result) in enumerate(zip(items, results)):
+                count = len(result.get("drafts", []))
+                drafts = saved[offset:offset + count]
+                offset += count
+                item: dict[str, Any] = {
+                    "index": index,
+                    "text": text,
+                    "need_clarification": bool(result.get("need_clarification")),
+                    "reply_to_user": result.get("reply_to_user"),
+                    "drafts": drafts,
+                    "cards": result.get("cards", []),
+                }
+                if result.get("need_clarification"):
+                    item["clarify_question"] = result.get("clarify_question")
+                out_items.append(item)
+            return {"request_id": effective_request_id, "items": out_items}
+
+        return self._run_idempotent(request_id, key, reason, compute)
+
+    def _run_idempotent(
+        self,
+        request_id: str | None,
+        key: str,
+        reason: str,
+        compute: Callable[[], dict[str, Any]],
+    ) -> dict[str, Any]:
+        def run() -> dict[str, Any]:
+            if request_id:
+                stored = self._stored_response(request_id)
+                if stored is not None:
+                    metrics.incr("orchestrator.replayed")
+                    return stored
+            response = compute()
+            if request_id:
+                self._store_response(request_id, response)
+            return response
+
+        return _draft_flight.do(key, run, reason=reason)
+
+    def _stored_response(self, request_id: str) -> Optional[dict[str, Any]]:
+        """The saved response body for request_id, if it is ready and has not expired."""
+        row = self._repo.get_response(request_id)
+        if row is None or row["status"] != "ready":
+            return None
+        return json_loads(row["response_json"])
+
+    def _store_response(self, request_id: str, response: dict[str, Any]) -> None:
+        global _last_response_purge
+        self._repo.save_response(
+            request_id=request_id,
+            response_json=json_dumps(response),
+            created_at=now_iso8601(),
+            ttl_seconds=_RESPONSE_TTL_SECONDS,
+        )
+        now = time.monotonic()
+        if now - _last_response_purge > _RESPONSE_PURGE_INTERVAL_SECONDS:
+            _last_response_purge = now
+            self._repo.purge_expired_responses()
+
+    def save_drafts(
+        self,
+        request_id: str,
+        drafts: Iterable[Draft],
+        input_text: str | None = None,
+        input_texts: Sequence[str | None] | None = None,
+    ) -> list[dict[str, Any]]:
+        """Write drafts in one INSERT. input_texts, when given, is each draft's own input_text."""
         created_at = now_iso8601()
         items: list[dict[str, Any]] = []
-        for d in drafts:
-            self._repo.insert_log(
-                kind="draft",
-                request_id=request_id,
-                draft_id=d.draft_id,
-                tool_name=d.tool_name,
-                payload_json=json_dumps(d.payload),
-                result_json=None,
-                undo_token=None,
-                commit_id=None,
-                created_at=created_at,
-            )
-            items.append(
+        rows: list[dict[str, Any]] = []
+        for index, d in enumerate(drafts):
+            rows.append(
                 {
+                    "kind": "draft",
+                    "request_id": request_id,
                     "draft_id": d.draft_id,
                     "tool_name": d.tool_name,
-                    "payload": d.payload,
-                    "confidence": d.confidence,
-                    "status": "draft",
+                    "payload_json": json_dumps(d.payload),
+                    "created_at": created_at,
+                    "input_text": input_texts[index] if input_texts is not None else input_text,
                 }
             )
+            items.append(_draft_item(d))
+        self._repo.insert_logs(rows)
+        get_draft_store().put_many(rows)
         return items
 
     def commit_drafts(self, draft_ids: Iterable[str]) -> dict[str, Any]:
+        """Turn drafts into records in a single transaction.
+
+        Either every draft lands or none does. Per-draft advisory locks keep
+        concurrent confirms of the same draft (from any worker process) from
+        both creating records; drafts already committed return their
+        existing commit. Drafts are read from Postgres under those locks,
+        never from the draft store, so an edit made through another worker
+        just before is what gets committed.
+        """
         unique_ids = list(dict.fromkeys(draft_ids))
-        drafts = self._repo.get_drafts_by_ids(unique_ids)
-        if not drafts:
-            raise ToolError("not_found", "no drafts found", {"draft_ids": unique_ids})
-
-        self._repo._conn.commit()
+        conn = self._repo._conn
 
         committed: list[dict[str, Any]] = []
+        commit_rows: list[dict[str, Any]] = []
+        learned: list[tuple[str, str | None, dict[str, Any]]] = []
         new_undo_token: Optional[str] = None
         existing_undo_token: Optional[str] = None
         created_at = now_iso8601()
 
-        with _commit_lock:
+        try:
+            self._repo.lock_drafts(unique_ids)
+            drafts = self._repo.get_drafts_by_ids(unique_ids)
+            if not drafts:
+                raise ToolError("not_found", "no drafts found", {"draft_ids": unique_ids})
+            superseded = [row["draft_id"] for row in drafts if row.get("superseded_at")]
+            if superseded:
+                raise ToolError(
+                    "draft_superseded",
+                    "drafts were replaced by a refined result",
+                    {"draft_ids": superseded},
+                )
+            existing = self._repo.get_commits_by_draft_ids([row["draft_id"] for row in drafts])
+
             for row in drafts:
                 draft_id = row["draft_id"]
                 tool_name = row["tool_name"]
 
-                existed = self._repo.get_commit_by_draft_id(draft_id)
+                existed = existing.get(draft_id)
                 if existed is not None:
                     if existing_undo_token is None and existed["undo_token"]:
                         existing_undo_token = existed["undo_token"]
@@ -251,17 +617,24 @@ class OrchestratorService:
 
                 payload = json_loads(row["payload_json"])
                 commit_id = str(uuid4())
-                result = _call_tool(tool_name, {**payload, "commit_id": commit_id})
-                self._repo.insert_log(
-                    kind="commit",
-                    request_id=row["request_id"],
-                    draft_id=draft_id,
-                    tool_name=tool_name,
-                    payload_json=row["payload_json"],
-                    result_json=json_dumps(result),
-                    undo_token=new_undo_token,
-                    commit_id=commit_id,
-                    created_at=created_at,
+                try:
+                    result = _call_tool(tool_name, payload, commit_id=commit_id, conn=conn)
+                except ToolError as exc:
+                    # Tell the client which draft sank the batch.
+                    raise ToolError(exc.code, exc.message, {**(exc.details or {}), "draft_id": draft_id}) from exc
+                commit_rows.append(
+                    {
+                        "kind": "commit",
+                        "request_id": row["request_id"],
+                        "draft_id": draft_id,
+                        "tool_name": tool_name,
+                        "payload_json": row["payload_json"],
+                        "result_json": json_dumps(result),
+                        "undo_token": new_undo_token,
+                        "commit_id": commit_id,
+                        "created_at": created_at,
+                        "input_text": row.get("input_text"),
+                    }
                 )
                 committed.append(
                     {
@@ -271,7 +644,17 @@ class OrchestratorService:
                         "result": result,
                     }
                 )
-
+                learned.append((tool_name, _prediction_text(row.get("input_text"), payload), payload))
+            self._repo.insert_logs(commit_rows, commit=False)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+        self._learn_fields(learned, weight=1.0)
+        if new_undo_token is not None:
+            # Newly confirmed records become few-shot candidates on the next route.
+            get_example_store().invalidate()
         undo_token = new_undo_token or existing_undo_token
         return {"committed": committed, "undo_token": undo_token}
 
@@ -280,46 +663,74 @@ class OrchestratorService:
         if not commits:
             raise ToolError("not_found", "undo_token not found", {"undo_token": undo_token})
 
-        self._repo._conn.commit()
-
-        undone: list[dict[str, Any]] = []
-        for row in commits:
-            tool_name = row["tool_name"]
-            result = json_loads(row["result_json"]) if row["result_json"] else {}
-            undone.append(_undo_tool(tool_name, result))
-
-        return {"undone": undone, "undo_token": undo_token}
+        undone, skipped = self._undo_commits(commits)
+        return {"undone": undone, "skipped": skipped, "undo_token": undo_token}
 
     def undo_commit(self, commit_id: str) -> dict[str, Any]:
         row = self._repo.get_commit_by_id(commit_id)
         if row is None:
             raise ToolError("not_found", "commit_id not found", {"commit_id": commit_id})
-        self._repo._conn.commit()
-        tool_name = row["tool_name"]
-        result = json_loads(row["result_json"]) if row["result_json"] else {}
-        undone = _undo_tool(tool_name, result)
-        return {"undone": [undone], "commit_id": commit_id}
+        undone, skipped = self._undo_commits([row])
+        return {"undone": undone, "skipped": skipped, "commit_id": commit_id}
+
+    def _undo_commits(
+        self, commits: list[dict[str, Any]]
+    ) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        """Reverse commits in one transaction, returning (undone, skipped).
+
+        Records already undone or gone are skipped; the undo fails only when
+        none of the commits had anything left to reverse.
+        """
+        conn = self._repo._conn
+        try:
+            undone, skipped = _undo_tools(
+                [
+                    (row["tool_name"], json_loads(row["result_json"]) if row["result_json"] else {})
+                    for row in commits
+                ],
+                conn,
+            )
+            if skipped and not undone:
+                raise ToolError("not_found", "nothing left to undo", {"skipped": skipped})
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return undone, skipped
 
     def edit_draft(self, draft_id: str, patch: dict[str, Any]) -> dict[str, Any]:
-        row = self._repo.get_draft_by_id(draft_id)
-        if row is None:
-            raise ToolError("not_found", "draft not found", {"draft_id": draft_id})
+        store = get_draft_store()
+        row = store.get(draft_id)
+        written = False
+        if row is not None:
+            payload, updated, card = _patch_draft(draft_id, row, patch)
+            updated_json = json_dumps(updated)
+            # Another worker may have edited the draft since it was cached;
+            # then nothing is written and the edit is redone from Postgres.
+            written = self._repo.update_draft_payload(draft_id, updated_json, expected_json=row["payload_json"])
+            if not written:
+                metrics.incr("drafts.store_stale")
+        if not written:
+            row = self._repo.get_draft_by_id(draft_id)
+            if row is None:
+                store.discard(draft_id)
+                raise ToolError("not_found", "draft not found", {"draft_id": draft_id})
+            payload, updated, card = _patch_draft(draft_id, row, patch)
+            updated_json = json_dumps(updated)
+            self._repo.update_draft_payload(draft_id, updated_json)
         tool_name = row["tool_name"]
-        payload = json_loads(row["payload_json"]) if row["payload_json"] else {}
-        
-        if tool_name == "create_task":
-            updated = _apply_task_patch(payload, patch)
-            card = _task_card_from_payload(draft_id, updated)
-        else:
-            updated = dict(payload)
-            for k, v in patch.items():
-                if v is None and k in updated:
-                    del updated[k]
-                elif v is not None:
-                    updated[k] = v
-            card = _pick_card([], 0, draft_id, tool_name, updated)
-
-        self._repo.update_draft_payload(draft_id, json_dumps(updated))
+        store.put_many([{**row, "payload_json": updated_json}])
+        corrected = {
+            field: updated.get(field)
+            for field in PREDICTED_FIELDS.get(tool_name, ())
+            if patch.get(field) is not None and patch.get(field) != payload.get(field)
+        }
+        if corrected:
+            # An explicit correction says more than a confirmed guess.
+            self._learn_fields(
+                [(tool_name, _prediction_text(row.get("input_text"), updated), corrected)],
+                weight=get_draft_predictor().settings.correction_weight,
+            )
         consts = get_constants()
         draft_item = {
             "draft_id": draft_id,
@@ -330,6 +741,18 @@ class OrchestratorService:
         }
         return {"drafts": [draft_item], "cards": [card], "request_id": row["request_id"]}
 
+    def _learn_fields(self, items: list[tuple[str, str | None, dict[str, Any]]], weight: float) -> None:
+        predictor = get_draft_predictor()
+        for tool_name, text, values in items:
+            if tool_name not in PREDICTED_FIELDS:
+                continue
+            try:
+                predictor.learn(self._repo._conn, tool_name, text, values, weight)
+            except Exception as exc:  # noqa: BLE001
+                # Learning is best effort; never fail the commit or edit for it.
+                self._repo._conn.rollback()
+                logger.warning("draft predictor update failed: %s", exc)
+
     def task_action(self, task_id: int, op: str, payload: Optional[dict[str, Any]] = None) -> dict[str, Any]:
         if task_id <= 0:
             raise ToolError("invalid_param", "task_id must be positive integer")
@@ -396,31 +819,26 @@ def _display_card_data(tool_name: str, payload: dict[str, Any]) -> dict[str, Any
     if tool_name not in {"create_expense", "create_income", "create_transfer"}:
         return data
 
+    if tool_name == "create_transfer":
+        name_fields = {"from_account_id": "from_account_name", "to_account_id": "to_account_name"}
+    else:
+        name_fields = {"account_id": "account_name"}
+    account_ids = {
+        field: payload.get(field)
+        for field in name_fields
+        if isinstance(payload.get(field), int) and payload.get(field) > 0
+    }
+    if not account_ids:
+        return data
     try:
-        with get_connection() as conn:
-            ensure_tables(conn)
-            repo = AccountsRepository(conn)
-            if tool_name == "create_transfer":
-                from_account_id = payload.get("from_account_id")
-                to_account_id = payload.get("to_account_id")
-                if isinstance(from_account_id, int) and from_account_id > 0:
-                    account = repo.get_account(from_account_id)
-                    if account and account.get("name"):
-                        data["from_account_name"] = account["name"]
-                if isinstance(to_account_id, int) and to_account_id > 0:
-                    account = repo.get_account(to_account_id)
-                    if account and account.get("name"):
-                        data["to_account_name"] = account["name"]
-                return data
-            account_id = payload.get("account_id")
-            if not isinstance(account_id, int) or account_id <= 0:
-                return data
-            account = repo.get_account(account_id)
+        accounts = get_account_cache().get_many(account_ids.values())
     except Exception:
         return data
 
-    if account and account.get("name"):
-        data["account_name"] = account["name"]
+    for field, account_id in account_ids.items():
+        account = accounts.get(account_id)
+        if account and account.get("name"):
+            data[name_fields[field]] = account["name"]
     return data
 
 
@@ -457,6 +875,12 @@ def _fallback_drafts(
     def add(tool_name: str, payload: dict[str, Any], confidence: float = 0.5) -> None:
         draft_id = str(uuid4())
         payload = _normalize_time_fields(payload, tool_name)
+        predicted = _predicted_fields(tool_name, text)
+        if predicted:
+            # The user's own history beats the fixed category defaults below.
+            payload = {**payload, **predicted}
+            if "category" in predicted:
+                confidence = min(confidence + _PREDICTED_CONFIDENCE_BONUS, _PREDICTED_CONFIDENCE_CAP)
         payload = _merge_draft_defaults(tool_name, payload, draft_defaults)
         payload = {**payload, "idempotency_key": draft_id}
         card = _pick_card([], 0, draft_id, tool_name, payload)
@@ -524,22 +948,261 @@ def _fallback_drafts(
     return drafts
 
 
-def _call_tool(tool_name: str, payload: dict[str, Any]) -> dict[str, Any]:
-    if tool_name == "create_expense":
-        return create_expense(**payload)
-    if tool_name == "create_income":
-        return create_income(**payload)
-    if tool_name == "create_transfer":
-        return create_transfer(**payload)
-    if tool_name == "create_task":
-        return create_task(**payload)
-    if tool_name == "create_mood":
-        return create_mood(**payload)
-    if tool_name == "create_lifelog":
-        return create_lifelog(**payload)
-    if tool_name == "create_meal":
-        return create_meal(**payload)
-    raise ToolError("invalid_tool", "unsupported tool", {"tool_name": tool_name})
+def _result_from_decision(
+    decision: RouterDecision,
+    text: str,
+    type_hint: str | None,
+    image_base64s: list[str] | None,
+    draft_defaults: dict[str, Any] | None,
+) -> dict[str, Any]:
+    if decision.need_clarification:
+        return {
+            "need_clarification": True,
+            "clarify_question": decision.clarify_question,
+            "reply_to_user": decision.reply_to_user,
+            "drafts": [],
+            "cards": [c.model_dump() for c in decision.cards],
+        }
+
+    drafts = _drafts_from_decision(decision)
+    drafts = _fill_predicted_fields(drafts, text)
+    drafts = _apply_draft_defaults(drafts, draft_defaults)
+    if not drafts and any(c.name in _DISABLED_CHAT_TOOLS for c in decision.tool_calls):
+        return {
+            "need_clarification": False,
+            "reply_to_user": "心情记录请使用 Dashboard 的快捷入口。",
+            "drafts": [],
+            "cards": [],
+        }
+    if type_hint is not None and not drafts:
+        forced = _fallback_drafts(
+            text,
+            type_hint=type_hint,
+            image_base64s=image_base64s,
+            draft_defaults=draft_defaults,
+        )
+        if forced:
+            return {
+                "need_clarification": False,
+                "reply_to_user": decision.reply_to_user,
+                "drafts": forced,
+                "cards": [d.card for d in forced],
+            }
+        return {
+            "need_clarification": True,
+            "clarify_question": _clarify_for_type_hint(type_hint),
+            "reply_to_user": None,
+            "drafts": [],
+            "cards": [],
+        }
+    return {
+        "need_clarification": False,
+        "reply_to_user": decision.reply_to_user,
+        "drafts": drafts,
+        "cards": [d.card for d in drafts],
+    }
+
+
+def _refine_drafts(
+    request_id: str,
+    provisional_ids: list[str],
+    text: str,
+    image_base64s: list[str] | None,
+    type_hint: str | None,
+    draft_defaults: dict[str, Any] | None,
+) -> None:
+    # Runs after the HTTP response, so it needs its own connection.
+    started = time.perf_counter()
+    failure: str | None = None
+    service: OrchestratorService | None = None
+    try:
+        service = get_orchestrator_service()
+        service.handle_draft_request(
+            request_id,
+            text,
+            image_base64s=image_base64s,
+            type_hint=type_hint,
+            draft_defaults=draft_defaults,
+            supersedes=provisional_ids,
+        )
+    except ToolError as exc:
+        failure = exc.code
+    except Exception:  # noqa: BLE001
+        logger.exception("draft refinement failed for request %s", request_id)
+        failure = "internal_error"
+    metrics.observe("orchestrator.refine_ms", (time.perf_counter() - started) * 1000)
+    if service is None:
+        # No connection to record the failure with; the reservation expires.
+        metrics.incr("orchestrator.refine_failures", code=failure or "internal_error")
+        return
+    try:
+        if failure is not None:
+            metrics.incr("orchestrator.refine_failures", code=failure)
+            service.fail_request(request_id, failure)
+    except Exception:  # noqa: BLE001
+        logger.exception("could not record refinement failure for request %s", request_id)
+    finally:
+        service.close()
+
+
+def _route_per_image(
+    text: str,
+    routed_text: str,
+    images: list[PreparedImage],
+    provider: LLMProvider,
+    type_hint: str | None,
+    draft_defaults: dict[str, Any] | None,
+    parallel: int,
+) -> dict[str, Any] | None:
+    """Route each distinct image in its own call and merge the drafts.
+
+    One unreadable photo then costs only its own drafts, and latency tracks
+    the slowest image instead of growing with the image count. Re-uploads of
+    the same photo are routed once, and drafts with identical payloads (the
+    same receipt shot twice) are kept once. Returns None when every call
+    failed.
+    """
+    distinct: list[tuple[int, PreparedImage]] = []
+    seen_digests: set[str] = set()
+    for index, image in enumerate(images):
+        if image.digest in seen_digests:
+            metrics.incr("orchestrator.image_duplicates", kind="image")
+            continue
+        seen_digests.add(image.digest)
+        distinct.append((index, image))
+
+    def run(image: PreparedImage) -> RouterDecision:
+        return llm_route(
+            text=routed_text,
+            image_base64s=[image.data_url],
+            provider=provider,
+            type_hint=type_hint,
+        )
+
+    metrics.incr("orchestrator.image_fan_out")
+    decisions: list[RouterDecision | None] = []
+    limit = max(parallel, 1)
+    for start in range(0, len(distinct), limit):
+        window = distinct[start : start + limit]
+        futures = [submit_with_context(_image_route_executor, run, image) for _, image in window]
+        for future in futures:
+            try:
+                decisions.append(future.result())
+            except ToolError as exc:
+                if exc.code not in _LLM_FALLBACK_CODES:
+                    raise
+                metrics.incr("orchestrator.image_route_failures", code=exc.code)
+                decisions.append(None)
+
+    if all(d is None for d in decisions):
+        return None
+
+    drafts: list[Draft] = []
+    seen_payloads: set[str] = set()
+    clarification: RouterDecision | None = None
+    for (index, _), decision in zip(distinct, decisions):
+        if decision is None:
+            continue
+        if decision.need_clarification:
+            clarification = clarification or decision
+            continue
+        decided = _fill_predicted_fields(_drafts_from_decision(decision), text)
+        for draft in _apply_draft_defaults(decided, draft_defaults):
+            fingerprint = _draft_fingerprint(draft)
+            if fingerprint in seen_payloads:
+                metrics.incr("orchestrator.image_duplicates", kind="draft")
+                continue
+            seen_payloads.add(fingerprint)
+            draft.source_image_index = index
+            draft.card["source_image_index"] = index
+            drafts.append(draft)
+
+    if not drafts:
+        if clarification is not None:
+            return _result_from_decision(clarification, text, type_hint, None, draft_defaults)
+        return None
+
+    failed = sum(1 for d in decisions if d is None)
+    reply = f"我从 {len(distinct)} 张图片中整理出 {len(drafts)} 条草稿。"
+    if failed:
+        reply += f"有 {failed} 张图片没能识别，可以重新拍一下。"
+    return {
+        "need_clarification": False,
+        "reply_to_user": reply,
+        "drafts": drafts,
+        "cards": [d.card for d in drafts],
+    }
+
+
+def _reply_streamer(on_event: DraftEventSink) -> Callable[[str], None]:
+    def stream(delta: str) -> None:
+        on_event("reply_delta", {"text": delta})
+
+    return stream
+
+
+def _draft_previewer(on_event: DraftEventSink) -> Callable[[ToolCall], None]:
+    index = 0
+
+    def preview(call: ToolCall) -> None:
+        nonlocal index
+        if call.name in _DISABLED_CHAT_TOOLS:
+            return
+        try:
+            payload = _normalize_time_fields(dict(call.arguments), call.name)
+        except ToolError:
+            # Left for the full decision to resolve (or drop).
+            return
+        card = _pick_card([], index, f"preview-{index}", call.name, payload)
+        on_event("draft", {"index": index, "tool_name": call.name, "payload": payload, "card": card})
+        index += 1
+
+    return preview
+
+
+def _draft_fingerprint(draft: Draft) -> str:
+    payload = {k: v for k, v in draft.payload.items() if k != "idempotency_key"}
+    return draft.tool_name + ":" + json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _has_budget(seconds: float) -> bool:
+    remaining = remaining_budget()
+    return remaining is None or remaining >= seconds
+
+
+def _fallback_result(
+    text: str,
+    type_hint: str | None,
+    image_base64s: list[str] | None,
+    draft_defaults: dict[str, Any] | None,
+) -> dict[str, Any]:
+    drafts = _fallback_drafts(
+        text,
+        type_hint=type_hint,
+        image_base64s=image_base64s,
+        draft_defaults=draft_defaults,
+    )
+    if not drafts:
+        return {
+            "need_clarification": True,
+            "clarify_question": _clarify_for_type_hint(type_hint),
+            "drafts": [],
+        }
+    return {
+        "need_clarification": False,
+        "reply_to_user": None,
+        "drafts": drafts,
+        "cards": [d.card for d in drafts],
+    }
+
+
+def _call_tool(
+    tool_name: str,
+    payload: dict[str, Any],
+    commit_id: str | None = None,
+    conn: DBConnection | None = None,
+) -> dict[str, Any]:
+    return get_tool(tool_name).run(payload, commit_id=commit_id, conn=conn)
 
 
 def _apply_draft_defaults(
@@ -562,11 +1225,48 @@ def _apply_draft_defaults(
                 payload=payload,
                 confidence=draft.confidence,
                 card=_pick_card([], 0, draft.draft_id, draft.tool_name, payload),
+                source_image_index=draft.source_image_index,
+            )
+        )
+    return updated
+
+
+def _predicted_fields(tool_name: str, text: str | None) -> dict[str, Any]:
+    if tool_name not in PREDICTED_FIELDS:
+        return {}
+    return {field: p.value for field, p in get_draft_predictor().predict(tool_name, text).items()}
+
+
+def _fill_predicted_fields(drafts: list[Draft], text: str) -> list[Draft]:
+    """Fill category / account_id the LLM left out from the user's history."""
+    updated: list[Draft] = []
+    for draft in drafts:
+        missing = [f for f in PREDICTED_FIELDS.get(draft.tool_name, ()) if draft.payload.get(f) in (None, "")]
+        predicted = _predicted_fields(draft.tool_name, _prediction_text(text, draft.payload)) if missing else {}
+        fill = {f: predicted[f] for f in missing if f in predicted}
+        if not fill:
+            updated.append(draft)
+            continue
+        payload = {**draft.payload, **fill}
+        updated.append(
+            Draft(
+                draft_id=draft.draft_id,
+                tool_name=draft.tool_name,
+                payload=payload,
+                confidence=draft.confidence,
+                card=_pick_card([], 0, draft.draft_id, draft.tool_name, payload),
+                source_image_index=draft.source_image_index,
             )
         )
     return updated
 
 
+def _prediction_text(input_text: str | None, payload: dict[str, Any]) -> str | None:
+    """The words a category guess is based on: the user's input plus the draft note."""
+    parts = [p for p in (input_text, payload.get("note")) if isinstance(p, str) and p.strip()]
+    return " ".join(parts) or None
+
+
 def _merge_draft_defaults(
     tool_name: str,
     payload: dict[str, Any],
@@ -596,20 +1296,50 @@ def _merge_draft_defaults(
     return updated
 
 
-def _undo_tool(tool_name: str, result: dict[str, Any]) -> dict[str, Any]:
-    if tool_name in {"create_expense", "create_income", "create_lifelog", "create_meal", "create_mood", "create_transfer"}:
-        event_id = result.get("event_id")
-        if isinstance(event_id, int):
-            return {"event": soft_delete_event(event_id)}
-        return {"event": None}
-    if tool_name == "create_task":
-        task_id = result.get("task_id")
-        if isinstance(task_id, int):
-            return {"task": soft_delete_task(task_id)}
-        return {"task": None}
-    if tool_name == "task_action":
-        return _undo_task_action(result)
-    return {"unknown": tool_name}
+def _undo_tools(
+    commits: list[tuple[str, dict[str, Any]]], conn: DBConnection
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """Soft delete what (tool_name, result) commits created, one UPDATE per table.
+
+    Returns (undone, skipped); skipped lists records that were already
+    deleted or no longer exist.
+    """
+    tools = get_tool_registry()
+    records = [tools[tool_name].record if tool_name in tools else None for tool_name, _ in commits]
+    event_ids = [
+        result["event_id"]
+        for record, (_, result) in zip(records, commits)
+        if record == "event" and isinstance(result.get("event_id"), int)
+    ]
+    task_ids = [
+        result["task_id"]
+        for record, (_, result) in zip(records, commits)
+        if record == "task" and isinstance(result.get("task_id"), int)
+    ]
+    events = EventService(EventRepository(conn)).set_deleted_many(event_ids, 1)
+    tasks = TaskService(TaskRepository(conn)).set_deleted_many(task_ids, 1)
+
+    undone: list[dict[str, Any]] = []
+    skipped: list[dict[str, Any]] = []
+    for record, (tool_name, result) in zip(records, commits):
+        if record == "event":
+            event_id = result.get("event_id")
+            if isinstance(event_id, int) and event_id not in events:
+                skipped.append({"tool_name": tool_name, "event_id": event_id})
+                continue
+            undone.append({"event": events[event_id] if isinstance(event_id, int) else None})
+        elif record == "task":
+            task_id = result.get("task_id")
+            if isinstance(task_id, int) and task_id not in tasks:
+                skipped.append({"tool_name": tool_name, "task_id": task_id})
+                continue
+            undone.append({"task": tasks[task_id] if isinstance(task_id, int) else None})
+        elif tool_name == "task_action":
+            # Restores a per-task snapshot, so these cannot be merged.
+            undone.append(_undo_task_action(result, conn))
+        else:
+            undone.append({"unknown": tool_name})
+    return undone, skipped
 
 
 def _get_task_snapshot(task_id: int) -> dict[str, Any]:
@@ -660,6 +1390,37 @@ def _normalize_time_fields(payload: dict[str, Any], tool_name: str) -> dict[str,
     return payload
 
 
+def _draft_item(d: Draft) -> dict[str, Any]:
+    item: dict[str, Any] = {
+        "draft_id": d.draft_id,
+        "tool_name": d.tool_name,
+        "payload": d.payload,
+        "confidence": d.confidence,
+        "status": "draft",
+    }
+    if d.source_image_index is not None:
+        item["source_image_index"] = d.source_image_index
+    return item
+
+
+def _patch_draft(
+    draft_id: str, row: dict[str, Any], patch: dict[str, Any]
+) -> tuple[dict[str, Any], dict[str, Any], dict[str, Any]]:
+    """(old payload, patched payload, card) for an edit of a draft row."""
+    tool_name = row["tool_name"]
+    payload = json_loads(row["payload_json"]) if row["payload_json"] else {}
+    if tool_name == "create_task":
+        updated = _apply_task_patch(payload, patch)
+        return payload, updated, _task_card_from_payload(draft_id, updated)
+    updated = dict(payload)
+    for k, v in patch.items():
+        if v is None and k in updated:
+            del updated[k]
+        elif v is not None:
+            updated[k] = v
+    return payload, updated, _pick_card([], 0, draft_id, tool_name, updated)
+
+
 def _apply_task_patch(payload: dict[str, Any], patch: dict[str, Any]) -> dict[str, Any]:
     if not isinstance(patch, dict):
         raise ToolError("invalid_param", "patch must be object")
@@ -741,37 +1502,35 @@ def _task_card_from_payload(draft_id: str, payload: dict[str, Any]) -> dict[str,
     }
 
 
-def _undo_task_action(result: dict[str, Any]) -> dict[str, Any]:
+def _undo_task_action(result: dict[str, Any], conn: DBConnection) -> dict[str, Any]:
     prev = result.get("prev") or {}
     task_id = prev.get("task_id")
     if not isinstance(task_id, int):
         return {"task": None}
 
+    repo = TaskRepository(conn)
     op = result.get("op")
     if op == "delete":
-        return {"task": undo_task(task_id)}
-
-    with get_connection() as conn:
-        ensure_tables(conn)
-        repo = TaskRepository(conn)
-        fields = {
-            "status": prev.get("status"),
-            "priority": prev.get("priority"),
-            "due_at": prev.get("due_at"),
-            "remind_at": prev.get("remind_at"),
-            "project": prev.get("project"),
-            "note": prev.get("note"),
-            "tags_json": prev.get("tags_json"),
-            "completed_at": prev.get("completed_at"),
-            "is_deleted": prev.get("is_deleted"),
-            "updated_at": now_iso8601(),
-        }
-        repo.update_fields(task_id, fields)
-        row = repo.get_by_id(task_id)
-        if row is None:
-            return {"task": None}
-        service = TaskService(repo)
-        return {"task": service._row_to_task(row)}
+        return {"task": TaskService(repo).set_deleted(task_id, 0)}
+
+    fields = {
+        "status": prev.get("status"),
+        "priority": prev.get("priority"),
+        "due_at": prev.get("due_at"),
+        "remind_at": prev.get("remind_at"),
+        "project": prev.get("project"),
+        "note": prev.get("note"),
+        "tags_json": prev.get("tags_json"),
+        "completed_at": prev.get("completed_at"),
+        "is_deleted": prev.get("is_deleted"),
+        "updated_at": now_iso8601(),
+    }
+    repo.update_fields(task_id, fields)
+    row = repo.get_by_id(task_id)
+    if row is None:
+        return {"task": None}
+    service = TaskService(repo)
+    return {"task": service._row_to_task(row)}
 
 
 def _resolve_postpone_times(
@@ -868,6 +1627,26 @@ def _clarify_for_type_hint(type_hint: str | None) -> str:
     return "你想记录什么？"
 
 
+def _content_hash(
+    text: str,
+    image_base64s: list[str] | None,
+    type_hint: str | None,
+    draft_defaults: dict[str, Any] | None,
+) -> str:
+    digest = hashlib.sha256()
+    digest.update(
+        json.dumps(
+            {"text": text, "type_hint": type_hint, "draft_defaults": draft_defaults},
+            sort_keys=True,
+            ensure_ascii=False,
+        ).encode("utf-8")
+    )
+    for image in image_base64s or []:
+        digest.update(b"\0")
+        digest.update(image.encode("ascii", "ignore"))
+    return digest.hexdigest()
+
+
 def get_orchestrator_service() -> OrchestratorService:
     conn = get_connection()
     ensure_tables(conn)
@@ -152,6 +152,17 @@ class TaskService:
             raise ToolError("not_found", "task not found", {"task_id": task_id})
         return self._row_to_task(row)
 
+    def set_deleted_many(self, task_ids: list[int], is_deleted: int) -> dict[int, dict[str, Any]]:
+        """set_deleted for many tasks with one statement, keyed by task id.
+
+        Ids that do not exist or already have that is_deleted value are left
+        out; the caller decides whether that is an error.
+        """
+        if not task_ids:
+            return {}
+        rows = self._repo.update_is_deleted_many(task_ids, is_deleted, now_iso8601())
+        return {int(row["id"]): self._row_to_task(row) for row in rows}
+
 
 def _parse_iso8601(value: str) -> datetime:
     if value.endswith("Z"):
@@ -1,6 +1,6 @@
 ﻿from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import os
 from pathlib import Path
 from typing import Optional
@@ -24,6 +24,58 @@ def _load_toml_file(path: Path) -> dict:
     return tomllib.loads(path.read_text(encoding="utf-8-sig"))
 
 
+@dataclass
+class CircuitBreakerSettings:
+    failure_rate: float = 0.5
+    slow_call_ms: int = 10000
+    window: int = 20
+    min_calls: int = 5
+    open_seconds: float = 30.0
+
+
+@dataclass
+class HTTPPoolSettings:
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry_seconds: float = 60.0
+    http2: bool = True
+
+
+@dataclass
+class LLMSchedulerSettings:
+    max_concurrency: int = 8
+    # Token bucket; rate_per_second <= 0 disables rate limiting.
+    rate_per_second: float = 10.0
+    burst: int = 20
+    queue_timeout_seconds: float = 15.0
+    max_retries: int = 3
+    backoff_base_ms: int = 500
+    backoff_max_ms: int = 8000
+
+
+@dataclass
+class ModelPolicySettings:
+    enabled: bool = True
+    # Text-only inputs up to fast_max_chars may use fast_model when they are
+    # hinted, short, or the deterministic parser is already confident.
+    fast_max_chars: int = 80
+    short_chars: int = 24
+    fast_path_min_confidence: float = 0.6
+    # A fast-model answer below this confidence is re-routed on the main model.
+    escalate_below_confidence: float = 0.6
+
+
+@dataclass
+class ExampleSettings:
+    enabled: bool = True
+    # Few-shot examples per route call, and the token budget they share.
+    k: int = 3
+    token_budget: int = 600
+    min_similarity: float = 0.2
+    max_examples: int = 500
+    refresh_seconds: float = 300.0
+
+
 @dataclass
 class LLMSettings:
     base_url: str
@@ -31,6 +83,62 @@ class LLMSettings:
     model: str
     fast_model: str
     timeout_seconds: int = 30
+    structured_output: bool = True
+    name: str = "primary"
+    priority: int = 0
+    # Alternate endpoints from [[llm.providers]], used for hedging and failover.
+    alternates: list[LLMSettings] = field(default_factory=list)
+    hedge: bool = False
+    hedge_min_delay_ms: int = 300
+    breaker: CircuitBreakerSettings = field(default_factory=CircuitBreakerSettings)
+    http: HTTPPoolSettings = field(default_factory=HTTPPoolSettings)
+    scheduler: LLMSchedulerSettings = field(default_factory=LLMSchedulerSettings)
+    routing: ModelPolicySettings = field(default_factory=ModelPolicySettings)
+    examples: ExampleSettings = field(default_factory=ExampleSettings)
+
+
+@dataclass
+class ImageSettings:
+    max_edge: int = 1568
+    jpeg_quality: int = 80
+    cache_size: int = 64
+    # Requests with at least this many images route each image separately
+    # (0 disables), running up to fan_out_parallel router calls at once.
+    fan_out_min_images: int = 2
+    fan_out_parallel: int = 3
+
+
+@dataclass
+class AudioSettings:
+    chunk_seconds: int = 30
+    max_parallel: int = 4
+    cache_size: int = 32
+
+
+@dataclass
+class PredictorSettings:
+    enabled: bool = True
+    # A prediction needs this much accumulated evidence and this share of
+    # the vote among the user's past choices.
+    min_weight: float = 2.0
+    min_share: float = 0.6
+    # An edit_draft correction counts this many times as much as a plain commit.
+    correction_weight: float = 3.0
+    refresh_seconds: float = 600.0
+
+
+@dataclass
+class AccountCacheSettings:
+    # How long account rows are served from memory; 0 disables the cache.
+    ttl_seconds: float = 60.0
+
+
+@dataclass
+class DraftStoreSettings:
+    enabled: bool = True
+    # Recently saved or edited drafts kept in memory (least recently used go first).
+    max_entries: int = 2048
+    ttl_seconds: float = 900.0
 
 
 @dataclass
@@ -42,48 +150,217 @@ class DBSettings:
 class ServerSettings:
     cors_allow_origins: list[str]
     bearer_token: Optional[str] = None
+    # Wall-clock budget for one /chat draft request, transcription included.
+    request_budget_seconds: float = 20.0
 
 
 def _split_csv(value: str) -> list[str]:
     return [item.strip() for item in value.split(",") if item.strip()]
 
 
+def _parse_bool(value: object, default: bool) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip():
+        return value.strip().lower() in {"1", "true", "yes", "on"}
+    return default
+
+
 def load_llm_settings(config_path: Optional[Path] = None) -> Optional[LLMSettings]:
     env_base_url = os.environ.get("APP_LLM_BASE_URL", "").strip()
     env_api_key = os.environ.get("APP_LLM_API_KEY", "").strip()
     env_model = os.environ.get("APP_LLM_MODEL", "").strip()
     env_fast_model = os.environ.get("APP_LLM_FAST_MODEL", "").strip()
     env_timeout = os.environ.get("APP_LLM_TIMEOUT_SECONDS", "").strip()
+    env_structured = os.environ.get("APP_LLM_STRUCTURED_OUTPUT", "").strip()
+    env_hedge = os.environ.get("APP_LLM_HEDGE", "").strip()
+
+    path = config_path or DEFAULT_CONFIG_PATH
+    data = _load_toml_file(path) if path.exists() else {}
+    llm = data.get("llm")
+    if not isinstance(llm, dict):
+        llm = {}
+
     if env_base_url and env_api_key and env_model:
         timeout_seconds = int(env_timeout) if env_timeout else 30
-        return LLMSettings(
+        settings = LLMSettings(
             base_url=env_base_url,
             api_key=env_api_key,
             model=env_model,
             fast_model=env_fast_model or env_model,
             timeout_seconds=timeout_seconds,
+            structured_output=_parse_bool(env_structured, True),
         )
+    else:
+        settings = _llm_endpoint_from_dict(llm, name="primary", priority=0)
+        if settings is None:
+            return None
+        if env_structured:
+            settings.structured_output = _parse_bool(env_structured, True)
 
-    path = config_path or DEFAULT_CONFIG_PATH
-    if not path.exists():
-        return None
-    data = _load_toml_file(path)
-    llm = data.get("llm")
-    if not isinstance(llm, dict):
-        return None
-    base_url = llm.get("base_url")
-    api_key = llm.get("api_key")
-    model = llm.get("model")
+    raw_providers = llm.get("providers", [])
+    if isinstance(raw_providers, list):
+        for idx, item in enumerate(raw_providers):
+            if not isinstance(item, dict):
+                continue
+            alternate = _llm_endpoint_from_dict(
+                item,
+                name=f"alt{idx + 1}",
+                priority=idx + 1,
+            )
+            if alternate is not None:
+                settings.alternates.append(alternate)
+        settings.alternates.sort(key=lambda s: s.priority)
+    settings.hedge = _parse_bool(env_hedge or llm.get("hedge"), False)
+    settings.hedge_min_delay_ms = int(llm.get("hedge_min_delay_ms", 300))
+    breaker = llm.get("breaker")
+    if isinstance(breaker, dict):
+        settings.breaker = CircuitBreakerSettings(
+            failure_rate=float(breaker.get("failure_rate", 0.5)),
+            slow_call_ms=int(breaker.get("slow_call_ms", 10000)),
+            window=int(breaker.get("window", 20)),
+            min_calls=int(breaker.get("min_calls", 5)),
+            open_seconds=float(breaker.get("open_seconds", 30.0)),
+        )
+    http = llm.get("http")
+    if isinstance(http, dict):
+        settings.http = HTTPPoolSettings(
+            max_connections=int(http.get("max_connections", 20)),
+            max_keepalive_connections=int(http.get("max_keepalive_connections", 10)),
+            keepalive_expiry_seconds=float(http.get("keepalive_expiry_seconds", 60.0)),
+            http2=_parse_bool(http.get("http2"), True),
+        )
+    scheduler = llm.get("scheduler")
+    if isinstance(scheduler, dict):
+        settings.scheduler = LLMSchedulerSettings(
+            max_concurrency=int(scheduler.get("max_concurrency", 8)),
+            rate_per_second=float(scheduler.get("rate_per_second", 10.0)),
+            burst=int(scheduler.get("burst", 20)),
+            queue_timeout_seconds=float(scheduler.get("queue_timeout_seconds", 15.0)),
+            max_retries=int(scheduler.get("max_retries", 3)),
+            backoff_base_ms=int(scheduler.get("backoff_base_ms", 500)),
+            backoff_max_ms=int(scheduler.get("backoff_max_ms", 8000)),
+        )
+    routing = llm.get("routing")
+    if isinstance(routing, dict):
+        settings.routing = ModelPolicySettings(
+            enabled=_parse_bool(routing.get("enabled"), True),
+            fast_max_chars=int(routing.get("fast_max_chars", 80)),
+            short_chars=int(routing.get("short_chars", 24)),
+            fast_path_min_confidence=float(routing.get("fast_path_min_confidence", 0.6)),
+            escalate_below_confidence=float(routing.get("escalate_below_confidence", 0.6)),
+        )
+    examples = llm.get("examples")
+    if isinstance(examples, dict):
+        settings.examples = ExampleSettings(
+            enabled=_parse_bool(examples.get("enabled"), True),
+            k=int(examples.get("k", 3)),
+            token_budget=int(examples.get("token_budget", 600)),
+            min_similarity=float(examples.get("min_similarity", 0.2)),
+            max_examples=int(examples.get("max_examples", 500)),
+            refresh_seconds=float(examples.get("refresh_seconds", 300.0)),
+        )
+    return settings
+
+
+def _llm_endpoint_from_dict(raw: dict, *, name: str, priority: int) -> Optional[LLMSettings]:
+    base_url = raw.get("base_url")
+    api_key = raw.get("api_key")
+    model = raw.get("model")
     if not base_url or not api_key or not model:
         return None
-    fast_model = llm.get("fast_model", model)
-    timeout_seconds = int(llm.get("timeout_seconds", 30))
     return LLMSettings(
         base_url=str(base_url),
         api_key=str(api_key),
         model=str(model),
-        fast_model=str(fast_model),
-        timeout_seconds=timeout_seconds,
+        fast_model=str(raw.get("fast_model", model)),
+        timeout_seconds=int(raw.get("timeout_seconds", 30)),
+        structured_output=_parse_bool(raw.get("structured_output"), True),
+        name=str(raw.get("name") or name),
+        priority=int(raw.get("priority", priority)),
+    )
+
+
+def load_image_settings(config_path: Optional[Path] = None) -> ImageSettings:
+    env_max_edge = os.environ.get("APP_IMAGE_MAX_EDGE", "").strip()
+    env_quality = os.environ.get("APP_IMAGE_JPEG_QUALITY", "").strip()
+
+    path = config_path or DEFAULT_CONFIG_PATH
+    data = _load_toml_file(path) if path.exists() else {}
+    images = data.get("images")
+    if not isinstance(images, dict):
+        images = {}
+
+    return ImageSettings(
+        max_edge=int(env_max_edge or images.get("max_edge", 1568)),
+        jpeg_quality=int(env_quality or images.get("jpeg_quality", 80)),
+        cache_size=int(images.get("cache_size", 64)),
+        fan_out_min_images=int(images.get("fan_out_min_images", 2)),
+        fan_out_parallel=int(images.get("fan_out_parallel", 3)),
+    )
+
+
+def load_audio_settings(config_path: Optional[Path] = None) -> AudioSettings:
+    env_chunk = os.environ.get("APP_AUDIO_CHUNK_SECONDS", "").strip()
+
+    path = config_path or DEFAULT_CONFIG_PATH
+    data = _load_toml_file(path) if path.exists() else {}
+    audio = data.get("audio")
+    if not isinstance(audio, dict):
+        audio = {}
+
+    return AudioSettings(
+        chunk_seconds=int(env_chunk or audio.get("chunk_seconds", 30)),
+        max_parallel=int(audio.get("max_parallel", 4)),
+        cache_size=int(audio.get("cache_size", 32)),
+    )
+
+
+def load_predictor_settings(config_path: Optional[Path] = None) -> PredictorSettings:
+    env_enabled = os.environ.get("APP_PREDICTOR_ENABLED", "").strip()
+
+    path = config_path or DEFAULT_CONFIG_PATH
+    data = _load_toml_file(path) if path.exists() else {}
+    predictor = data.get("predictor")
+    if not isinstance(predictor, dict):
+        predictor = {}
+
+    return PredictorSettings(
+        enabled=_parse_bool(env_enabled or predictor.get("enabled"), True),
+        min_weight=float(predictor.get("min_weight", 2.0)),
+        min_share=float(predictor.get("min_share", 0.6)),
+        correction_weight=float(predictor.get("correction_weight", 3.0)),
+        refresh_seconds=float(predictor.get("refresh_seconds", 600.0)),
+    )
+
+
+def load_account_cache_settings(config_path: Optional[Path] = None) -> AccountCacheSettings:
+    env_ttl = os.environ.get("APP_ACCOUNT_CACHE_TTL_SECONDS", "").strip()
+
+    path = config_path or DEFAULT_CONFIG_PATH
+    data = _load_toml_file(path) if path.exists() else {}
+    accounts = data.get("accounts")
+    if not isinstance(accounts, dict):
+        accounts = {}
+
+    return AccountCacheSettings(
+        ttl_seconds=float(env_ttl or accounts.get("cache_ttl_seconds", 60.0)),
+    )
+
+
+def load_draft_store_settings(config_path: Optional[Path] = None) -> DraftStoreSettings:
+    env_enabled = os.environ.get("APP_DRAFT_STORE_ENABLED", "").strip()
+
+    path = config_path or DEFAULT_CONFIG_PATH
+    data = _load_toml_file(path) if path.exists() else {}
+    drafts = data.get("drafts")
+    if not isinstance(drafts, dict):
+        drafts = {}
+
+    return DraftStoreSettings(
+        enabled=_parse_bool(env_enabled or drafts.get("enabled"), True),
+        max_entries=int(drafts.get("max_entries", 2048)),
+        ttl_seconds=float(drafts.get("ttl_seconds", 900.0)),
     )
 
 
@@ -108,11 +385,13 @@ def load_db_settings(config_path: Optional[Path] = None) -> Optional[DBSettings]
 def load_server_settings(config_path: Optional[Path] = None) -> ServerSettings:
     env_origins = os.environ.get("APP_CORS_ALLOW_ORIGINS", "").strip()
     env_token = os.environ.get("APP_API_TOKEN", "").strip()
+    env_budget = os.environ.get("APP_REQUEST_BUDGET_SECONDS", "").strip()
     path = config_path or DEFAULT_CONFIG_PATH
     if not path.exists():
         return ServerSettings(
             cors_allow_origins=_split_csv(env_origins),
             bearer_token=env_token or None,
+            request_budget_seconds=float(env_budget or 20.0),
         )
 
     data = _load_toml_file(path)
@@ -120,6 +399,7 @@ def load_server_settings(config_path: Optional[Path] = None) -> ServerSettings:
     auth = data.get("auth")
     origins: list[str] = []
     bearer_token: Optional[str] = None
+    request_budget_seconds = 20.0
 
     if isinstance(server, dict):
         raw_origins = server.get("cors_allow_origins", [])
@@ -127,6 +407,7 @@ def load_server_settings(config_path: Optional[Path] = None) -> ServerSettings:
             origins = [str(item).strip() for item in raw_origins if str(item).strip()]
         elif isinstance(raw_origins, str):
             origins = _split_csv(raw_origins)
+        request_budget_seconds = float(server.get("request_budget_seconds", request_budget_seconds))
 
     if isinstance(auth, dict):
         token = auth.get("bearer_token")
@@ -136,4 +417,5 @@ def load_server_settings(config_path: Optional[Path] = None) -> ServerSettings:
     return ServerSettings(
         cors_allow_origins=_split_csv(env_origins) if env_origins else origins,
         bearer_token=env_token or bearer_token,
+        request_budget_seconds=float(env_budget) if env_budget else request_budget_seconds,
     )
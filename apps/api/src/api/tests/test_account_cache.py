@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import api.services.accounts_service as accounts_service
+from api.db.connection import DBConnection
+from api.services.account_cache import AccountCache
+from api.services.accounts_service import AccountsService
+from api.settings import AccountCacheSettings
+
+
+class _PsycopgConn:
+    def __init__(self) -> None:
+        self.commits = 0
+
+    def commit(self) -> None:
+        self.commits += 1
+
+    def rollback(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class _AccountsRepo:
+    def __init__(self, conn: DBConnection) -> None:
+        self._conn = conn
+        self.rows = {7: {"id": 7, "name": "招行", "kind": "asset", "is_active": 1, "balance_base": 100.0}}
+
+    def get_account(self, account_id):
+        return dict(self.rows[account_id])
+
+    def get_accounts(self, account_ids):
+        return [dict(self.rows[account_id]) for account_id in account_ids if account_id in self.rows]
+
+    def update_account_balance(self, *, account_id, balance_base, balance_base_at, updated_at):
+        self.rows[account_id]["balance_base"] = balance_base
+
+
+def _cached_balance(cache: AccountCache, account_id: int) -> float:
+    # No repo and no connection: only answers from the cache.
+    return cache._entries[account_id][0]["balance_base"]
+
+
+def test_set_balance_drops_the_cached_account_only_after_commit(monkeypatch):
+    cache = AccountCache(AccountCacheSettings())
+    monkeypatch.setattr(accounts_service, "get_account_cache", lambda: cache)
+    conn = DBConnection(_PsycopgConn())
+    repo = _AccountsRepo(conn)
+
+    AccountsService(repo).set_balance(account_id=7, balance_base=250.0, balance_base_at="2026-01-01T00:00:00+08:00")
+    assert _cached_balance(cache, 7) == 100.0
+
+    conn.commit()
+    assert 7 not in cache._entries
+    assert cache.get(7, repo)["balance_base"] == 250.0
+
+
+def test_rolled_back_set_balance_leaves_the_cache_alone(monkeypatch):
+    cache = AccountCache(AccountCacheSettings())
+    monkeypatch.setattr(accounts_service, "get_account_cache", lambda: cache)
+    conn = DBConnection(_PsycopgConn())
+    repo = _AccountsRepo(conn)
+
+    AccountsService(repo).set_balance(account_id=7, balance_base=250.0)
+    conn.rollback()
+    conn.commit()
+
+    assert _cached_balance(cache, 7) == 100.0
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from api.services.orchestrator_service import Draft, OrchestratorService
+
+
+class _LogsRepo:
+    """Records insert_logs calls in place of OrchestratorRepository."""
+
+    def __init__(self) -> None:
+        self.inserts: list[list[dict]] = []
+
+    def insert_logs(self, rows, commit=True):
+        self.inserts.append(list(rows))
+
+
+def _draft(draft_id: str, amount: float) -> Draft:
+    return Draft(draft_id=draft_id, tool_name="create_expense", payload={"amount": amount}, confidence=0.9, card={})
+
+
+def test_batch_saves_every_draft_in_one_insert_with_its_own_text(monkeypatch):
+    repo = _LogsRepo()
+    service = OrchestratorService(repo)
+    results = [
+        {"drafts": [_draft("d-1", 12.5), _draft("d-2", 3.0)]},
+        {"drafts": [], "need_clarification": True, "clarify_question": "多少钱？"},
+        {"drafts": [_draft("d-3", 30.0)]},
+    ]
+    monkeypatch.setattr(service, "create_batch_drafts", lambda items, draft_defaults=None: results)
+
+    out = service.handle_batch_request(None, [("午饭 12.5 咖啡 3", None), ("买了东西", None), ("打车 30", None)])
+
+    assert len(repo.inserts) == 1
+    assert [(row["draft_id"], row["input_text"]) for row in repo.inserts[0]] == [
+        ("d-1", "午饭 12.5 咖啡 3"),
+        ("d-2", "午饭 12.5 咖啡 3"),
+        ("d-3", "打车 30"),
+    ]
+    assert [[d["draft_id"] for d in item["drafts"]] for item in out["items"]] == [["d-1", "d-2"], [], ["d-3"]]
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from api.db.connection import ToolError
+from api.router.provider import CircuitBreaker, LLMConfig, MultiProvider, OpenAICompatibleProvider
+from api.settings import CircuitBreakerSettings
+
+
+def _half_open_provider() -> tuple[OpenAICompatibleProvider, CircuitBreaker]:
+    breaker = CircuitBreaker("breaker-test", CircuitBreakerSettings(min_calls=1, open_seconds=0.01))
+    breaker.record(False, 1.0)
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.02)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    config = LLMConfig(base_url="http://127.0.0.1:9", api_key="x", model="m", fast_model="m", name="breaker-test")
+    return OpenAICompatibleProvider(config, breaker=breaker), breaker
+
+
+def _deadline() -> str:
+    raise ToolError("deadline_exceeded", "request deadline exceeded", {"stage": "llm"})
+
+
+def _vendor_error() -> str:
+    raise ToolError("llm_error", "LLM request failed")
+
+
+def test_probe_cut_short_by_the_deadline_lets_the_next_call_probe():
+    provider, breaker = _half_open_provider()
+
+    with pytest.raises(ToolError, match="deadline"):
+        provider._guarded(_deadline)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert provider._guarded(lambda: "ok") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_the_breaker():
+    provider, breaker = _half_open_provider()
+
+    with pytest.raises(ToolError):
+        provider._guarded(_vendor_error)
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def _queue_timeout() -> str:
+    raise ToolError("llm_queue_timeout", "LLM queue timeout", {"provider": "breaker-test"})
+
+
+def test_local_queue_timeouts_do_not_open_the_breaker():
+    breaker = CircuitBreaker("breaker-queue-test", CircuitBreakerSettings(min_calls=1))
+    config = LLMConfig(base_url="http://127.0.0.1:9", api_key="x", model="m", fast_model="m", name="breaker-queue-test")
+    provider = OpenAICompatibleProvider(config, breaker=breaker)
+
+    for _ in range(3):
+        with pytest.raises(ToolError, match="queue"):
+            provider._guarded(_queue_timeout)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_queue_timeout_is_not_failed_over():
+    asked: list[str] = []
+
+    def call(provider) -> str:
+        asked.append(provider.name)
+        return _queue_timeout()
+
+    multi = MultiProvider([SimpleNamespace(name="first"), SimpleNamespace(name="second")])
+
+    with pytest.raises(ToolError) as excinfo:
+        multi._run(call, hedge=False)
+
+    assert excinfo.value.code == "llm_queue_timeout"
+    assert asked == ["first"]
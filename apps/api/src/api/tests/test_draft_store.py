@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import json
+
+import api.services.orchestrator_service as orchestrator_service
+from api.services.draft_store import DraftStore
+from api.services.orchestrator_service import Draft, OrchestratorService
+from api.settings import DraftStoreSettings
+
+
+class _Conn:
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+
+class _SharedRepo:
+    """Draft rows of orchestrator_logs, shared the way Postgres is shared by workers."""
+
+    def __init__(self, rows: dict[str, dict]) -> None:
+        self._rows = rows
+        self._conn = _Conn()
+
+    def insert_logs(self, rows, commit=True):
+        for row in rows:
+            if row["kind"] == "draft":
+                self._rows[row["draft_id"]] = dict(row)
+
+    def get_draft_by_id(self, draft_id):
+        row = self._rows.get(draft_id)
+        return dict(row) if row is not None else None
+
+    def get_drafts_by_ids(self, draft_ids):
+        return [dict(self._rows[draft_id]) for draft_id in draft_ids if draft_id in self._rows]
+
+    def update_draft_payload(self, draft_id, payload_json, expected_json=None):
+        row = self._rows.get(draft_id)
+        if row is None or (expected_json is not None and row["payload_json"] != expected_json):
+            return False
+        row["payload_json"] = payload_json
+        return True
+
+    def lock_drafts(self, draft_ids):
+        pass
+
+    def get_commits_by_draft_ids(self, draft_ids):
+        return {}
+
+
+class _Worker:
+    """One worker process: its own draft store over the shared table."""
+
+    def __init__(self, rows: dict[str, dict], monkeypatch) -> None:
+        self.store = DraftStore(DraftStoreSettings())
+        self.service = OrchestratorService(_SharedRepo(rows))
+        self._monkeypatch = monkeypatch
+
+    def __enter__(self) -> OrchestratorService:
+        self._monkeypatch.setattr(orchestrator_service, "get_draft_store", lambda: self.store)
+        return self.service
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+def _task_draft() -> Draft:
+    return Draft(draft_id="d-1", tool_name="create_task", payload={"title": "交电费"}, confidence=0.9, card={})
+
+
+def test_commit_on_another_worker_right_after_an_edit_uses_the_edit(monkeypatch):
+    rows: dict[str, dict] = {}
+    a, b = _Worker(rows, monkeypatch), _Worker(rows, monkeypatch)
+    called: list[dict] = []
+    monkeypatch.setattr(
+        orchestrator_service, "_call_tool", lambda tool_name, payload, **context: called.append(payload) or {"id": 1}
+    )
+    with a as service:
+        service.save_drafts("req-1", [_task_draft()])
+    with b as service:
+        service.edit_draft("d-1", {"title": "交水费"})
+
+    with a as service:
+        service.commit_drafts(["d-1"])
+
+    assert called == [{"title": "交水费"}]
+
+
+def test_edit_from_a_stale_cached_row_keeps_the_other_workers_edit(monkeypatch):
+    rows: dict[str, dict] = {}
+    a, b = _Worker(rows, monkeypatch), _Worker(rows, monkeypatch)
+    with a as service:
+        service.save_drafts("req-1", [_task_draft()])
+    with b as service:
+        service.edit_draft("d-1", {"note": "月底前"})
+
+    with a as service:
+        out = service.edit_draft("d-1", {"title": "交水费"})
+
+    stored = json.loads(rows["d-1"]["payload_json"])
+    assert stored["title"] == "交水费"
+    assert stored["note"] == "月底前"
+    assert out["drafts"][0]["payload"] == stored
+    assert json.loads(a.store.get("d-1")["payload_json"]) == stored
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import json
+
+from api.router.example_store import ExampleStore, render_examples
+from api.settings import ExampleSettings
+
+
+def _row(tool_name, payload, text, request_id="req-1"):
+    return {
+        "request_id": request_id,
+        "input_text": text,
+        "tool_name": tool_name,
+        "payload_json": json.dumps(payload),
+    }
+
+
+def test_rendered_examples_carry_no_real_account_ids():
+    store = ExampleStore(ExampleSettings(refresh_seconds=3600))
+    store.load(
+        [
+            _row("create_transfer", {"amount": 500, "from_account_id": 8841, "to_account_id": 9372}, "转账500到余额宝"),
+            _row("create_expense", {"amount": 32, "account_id": 9372, "category": "餐饮"}, "转账500到余额宝 午饭32"),
+        ]
+    )
+
+    rendered = render_examples(store.select("转账500到余额宝"))
+
+    assert rendered
+    assert "8841" not in rendered and "9372" not in rendered
+    transfer = store.select("转账500到余额宝")[0].rendered
+    calls = json.loads(transfer.split("tool_calls: ", 1)[1])
+    arguments = calls[0]["arguments"]
+    assert arguments["from_account_id"] != arguments["to_account_id"]
+    assert arguments["amount"] == 500
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from api.core import metrics
+from api.router.provider import MultiProvider
+
+
+def test_hedge_delay_follows_the_p90_of_the_stage_being_hedged():
+    primary = SimpleNamespace(name="hedge-test-primary", timeout_seconds=30)
+    multi = MultiProvider([primary, SimpleNamespace(name="hedge-test-alternate", timeout_seconds=30)], hedge=True)
+    for _ in range(20):
+        metrics.observe("llm.latency_ms", 400.0, provider=primary.name, stage="classify")
+        metrics.observe("llm.latency_ms", 6000.0, provider=primary.name, stage="route")
+
+    assert multi._hedge_delay(primary, "classify") == 0.4
+    assert multi._hedge_delay(primary, "route") == 6.0
+    # No samples for this stage yet: half the timeout.
+    assert multi._hedge_delay(primary, "chat") == 15.0
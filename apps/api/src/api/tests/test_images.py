@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from api.core.images import ImagePreprocessor
+from api.db.connection import ToolError
+from api.settings import ImageSettings
+
+
+def _png(width: int, height: int) -> str:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(out, format="PNG")
+    return base64.b64encode(out.getvalue()).decode("ascii")
+
+
+def test_decompression_bomb_is_rejected_as_invalid_param(monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 100)
+    preprocessor = ImagePreprocessor(ImageSettings())
+
+    with pytest.raises(ToolError) as excinfo:
+        preprocessor.prepare_one(_png(64, 64))
+
+    assert excinfo.value.code == "invalid_param"
+    # Images under the limit still go through.
+    assert preprocessor.prepare_one(_png(8, 8)).mime_type == "image/jpeg"
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+import api.services.orchestrator_service as orchestrator_service
+from api.db.connection import ToolError
+from api.services.orchestrator_service import OrchestratorService
+
+
+class _Conn:
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+
+class _ResponsesRepo:
+    """The orchestrator_responses and draft parts of OrchestratorRepository."""
+
+    def __init__(self, responses: dict[str, dict] | None = None, status: str = "ready") -> None:
+        self._conn = _Conn()
+        self._rows = {
+            request_id: {"request_id": request_id, "response_json": json.dumps(body), "status": status}
+            for request_id, body in (responses or {}).items()
+        }
+        self.drafts: dict[str, dict] = {}
+        self.commits: dict[str, dict] = {}
+        self.saved: list[dict] = []
+
+    def get_response(self, request_id: str):
+        return self._rows.get(request_id)
+
+    def reserve_response(self, *, request_id, response_json, created_at, ttl_seconds):
+        row = self._rows.get(request_id)
+        if row is not None and row["status"] != "failed":
+            return False
+        self._rows[request_id] = {"request_id": request_id, "response_json": response_json, "status": "pending"}
+        return True
+
+    def fail_response(self, request_id, response_json):
+        row = self._rows.get(request_id)
+        if row is not None and row["status"] == "pending":
+            row.update(status="failed", response_json=response_json)
+
+    def insert_logs(self, rows, commit=True):
+        self.saved.extend(rows)
+        for row in rows:
+            self.drafts[row["draft_id"]] = dict(row)
+
+    def lock_drafts(self, draft_ids):
+        pass
+
+    def get_drafts_by_ids(self, draft_ids):
+        return [dict(self.drafts[draft_id]) for draft_id in draft_ids if draft_id in self.drafts]
+
+    def get_commits_by_draft_ids(self, draft_ids):
+        return {draft_id: self.commits[draft_id] for draft_id in draft_ids if draft_id in self.commits}
+
+    def supersede_drafts(self, draft_ids, superseded_at):
+        for draft_id in draft_ids:
+            self.drafts[draft_id]["superseded_at"] = superseded_at
+
+
+STORED = {
+    "request_id": "req-1",
+    "drafts": [{"draft_id": "d-1", "tool_name": "create_expense", "payload": {"amount": 12.5}}],
+    "cards": [],
+    "reply_to_user": None,
+}
+
+
+@pytest.fixture(autouse=True)
+def _no_refinement(monkeypatch):
+    started: list[tuple] = []
+    monkeypatch.setattr(orchestrator_service, "submit_with_context", lambda executor, fn, *args: started.append(args))
+    return started
+
+
+def test_progressive_request_replays_stored_response_body():
+    service = OrchestratorService(_ResponsesRepo({"req-1": STORED}))
+
+    assert service.handle_progressive_request("req-1", "午饭 12.5") == STORED
+
+
+def test_ready_request_status_returns_response_body():
+    service = OrchestratorService(_ResponsesRepo({"req-1": STORED}))
+
+    assert service.get_request_status("req-1") == {"request_id": "req-1", "status": "ready", "response": STORED}
+
+
+def test_progressive_request_reserves_the_id_and_is_pending_for_any_worker(_no_refinement):
+    repo = _ResponsesRepo()
+    first = OrchestratorService(repo).handle_progressive_request("req-2", "午饭 12.5")
+
+    # A retry or poll served by another worker sees the same state.
+    other = OrchestratorService(repo)
+    assert other.get_request_status("req-2") == {"request_id": "req-2", "status": "pending"}
+    assert other.handle_progressive_request("req-2", "午饭 12.5") == first
+    assert len(_no_refinement) == 1
+    assert [row["draft_id"] for row in repo.saved] == [d["draft_id"] for d in first["drafts"]]
+
+
+def test_retry_that_loses_the_reservation_saves_nothing(_no_refinement):
+    repo = _ResponsesRepo()
+    repo.reserve_response = lambda **kwargs: False
+
+    out = OrchestratorService(repo).handle_progressive_request("req-3", "午饭 12.5")
+
+    assert out["status"] == "pending"
+    assert repo.saved == []
+    assert _no_refinement == []
+
+
+def test_failed_refinement_is_reported_by_status():
+    repo = _ResponsesRepo()
+    service = OrchestratorService(repo)
+    service.handle_progressive_request("req-4", "午饭 12.5")
+
+    service.fail_request("req-4", "llm_unavailable")
+
+    assert service.get_request_status("req-4") == {
+        "request_id": "req-4",
+        "status": "failed",
+        "error": {"code": "llm_unavailable"},
+    }
+
+
+def _provisional_and_refined(repo: _ResponsesRepo) -> tuple[str, list[dict]]:
+    provisional = OrchestratorService(repo).handle_progressive_request("req-5", "午饭 12.5")["drafts"][0]["draft_id"]
+    refined = [{"draft_id": "refined-1", "tool_name": "create_expense", "payload": {"amount": 12.5}, "status": "draft"}]
+    repo.drafts["refined-1"] = {"draft_id": "refined-1", "tool_name": "create_expense", "payload_json": "{}"}
+    return provisional, refined
+
+
+def test_refinement_retires_the_provisional_drafts():
+    repo = _ResponsesRepo()
+    provisional, refined = _provisional_and_refined(repo)
+    service = OrchestratorService(repo)
+
+    assert service._retire_superseded([provisional], refined) == refined
+
+    with pytest.raises(ToolError) as excinfo:
+        service.commit_drafts([provisional])
+    assert excinfo.value.code == "draft_superseded"
+
+
+def test_refinement_is_retired_when_a_provisional_draft_was_confirmed():
+    repo = _ResponsesRepo()
+    provisional, refined = _provisional_and_refined(repo)
+    repo.commits[provisional] = {"commit_id": "c-1", "undo_token": "u-1", "result_json": "{}"}
+
+    items = OrchestratorService(repo)._retire_superseded([provisional], refined)
+
+    assert [item["status"] for item in items] == ["superseded"]
+    assert repo.drafts["refined-1"]["superseded_at"]
+    assert not repo.drafts[provisional].get("superseded_at")
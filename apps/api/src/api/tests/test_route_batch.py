@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import api.router.route as route
+from api.db.connection import ToolError
+
+
+def _fake_generate(failing_index: int, code: str):
+    def generate(provider, prompt, payload, parse, **kwargs):
+        indexes = [item["index"] for item in json.loads(payload)]
+        if failing_index in indexes:
+            raise ToolError(code, "router call failed")
+        return SimpleNamespace(items=[SimpleNamespace(index=i, decision=f"decision-{i}") for i in indexes])
+
+    return generate
+
+
+def test_failed_chunk_only_drops_its_own_items(monkeypatch):
+    monkeypatch.setattr(route, "_generate_with_repair", _fake_generate(0, "llm_error"))
+
+    decisions = route.route_batch(
+        ["a", "b", "c", "d"], provider=SimpleNamespace(), chunk_size=2, fallback_codes={"llm_error"}
+    )
+
+    assert decisions == [None, None, "decision-2", "decision-3"]
+
+
+def test_chunk_errors_outside_fallback_codes_fail_the_batch(monkeypatch):
+    monkeypatch.setattr(route, "_generate_with_repair", _fake_generate(3, "internal_error"))
+
+    with pytest.raises(ToolError) as excinfo:
+        route.route_batch(["a", "b", "c", "d"], provider=SimpleNamespace(), chunk_size=2, fallback_codes={"llm_error"})
+
+    assert excinfo.value.code == "internal_error"
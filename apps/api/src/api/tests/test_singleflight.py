@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from api.core.deadline import deadline_scope
+from api.core.singleflight import SingleFlight
+from api.db.connection import ToolError
+
+
+def test_duplicate_gives_up_when_its_own_budget_runs_out():
+    flight: SingleFlight[str] = SingleFlight("singleflight-test")
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: flight.do("k", lambda: release.wait(5) and "done"))
+    leader.start()
+    time.sleep(0.05)
+    try:
+        started = time.monotonic()
+        with deadline_scope(0.2), pytest.raises(ToolError) as excinfo:
+            flight.do("k", lambda: "not run")
+        assert excinfo.value.code == "deadline_exceeded"
+        assert time.monotonic() - started < 1.0
+    finally:
+        release.set()
+        leader.join()
+
+    # The finished result is still shared with later callers in the window.
+    assert flight.do("k", lambda: "not run") == "done"
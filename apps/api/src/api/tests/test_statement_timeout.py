@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from api.core.deadline import deadline_scope
+from api.db.connection import DBConnection
+
+
+class _PsycopgConn:
+    """Records the statement_timeout set_config calls DBConnection makes."""
+
+    def __init__(self) -> None:
+        self.timeouts: list[int] = []
+
+    def execute(self, sql, params=()):
+        if "statement_timeout" in sql:
+            self.timeouts.append(int(params[0]))
+
+    def cursor(self):
+        return _PsycopgCursor()
+
+    def rollback(self) -> None:
+        pass
+
+
+class _PsycopgCursor:
+    def execute(self, sql, params=()):
+        pass
+
+
+def test_repository_cursors_get_the_request_timeout():
+    raw = _PsycopgConn()
+    conn = DBConnection(raw)
+
+    with deadline_scope(10.0):
+        conn.cursor().execute("SELECT 1")
+
+    assert len(raw.timeouts) == 1
+    assert 9000 <= raw.timeouts[0] <= 10000
+
+
+def test_timeout_is_set_again_after_a_rollback():
+    raw = _PsycopgConn()
+    conn = DBConnection(raw)
+
+    with deadline_scope(10.0):
+        conn.execute("SELECT 1")
+        conn.execute("SELECT 1")
+        conn.rollback()
+        conn.cursor().execute("SELECT 1")
+
+    assert len(raw.timeouts) == 2
+
+
+def test_no_timeout_outside_a_request_budget():
+    raw = _PsycopgConn()
+
+    DBConnection(raw).cursor().execute("SELECT 1")
+
+    assert raw.timeouts == []
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from api.core.constants_loader import get_constants
+from api.db.connection import ToolError
+from api.tools.registry import TOOL_SCHEMAS_DIR, get_tool
+
+
+@pytest.mark.parametrize(
+    ("tool_name", "arguments", "message"),
+    [
+        ("create_expense", {"amount": 0}, "amount must be > 0"),
+        ("create_expense", {"amount": True}, "amount must be number"),
+        ("create_expense", {"amount": 5, "category": "rocket"}, "category must be one of"),
+        ("create_expense", {"amount": 5, "confidence": ""}, "confidence must be number"),
+        ("create_expense", {"amount": 5, "account_id": -1}, "account_id must be > 0"),
+        ("create_transfer", {"amount": 5, "from_account_id": "1", "to_account_id": 2}, "from_account_id must be integer"),
+        ("create_meal", {"meal_type": "lunch", "items": []}, "items must have at least 1 items"),
+        ("create_task", {"title": "x", "note": 3}, "note must be null or string"),
+    ],
+)
+def test_registry_rejects_arguments_before_the_handler_runs(tool_name, arguments, message):
+    spec = get_tool(tool_name)
+
+    with pytest.raises(ToolError) as excinfo:
+        spec.run(arguments)
+
+    assert excinfo.value.code == "invalid_param"
+    assert message in excinfo.value.message
+
+
+def test_registry_rejects_unknown_and_missing_parameters():
+    with pytest.raises(ToolError, match="unexpected parameters"):
+        get_tool("create_task").validate({"title": "x", "owner": "me"})
+    with pytest.raises(ToolError, match="title is required"):
+        get_tool("create_task").validate({"title": None})
+
+
+def test_empty_string_defers_to_the_default_of_string_parameters():
+    get_tool("create_expense").validate({"amount": 5, "category": "", "currency": "", "source": ""})
+
+
+def _schema_enums():
+    for path in sorted(TOOL_SCHEMAS_DIR.glob("*.schema.json")):
+        properties = json.loads(path.read_text(encoding="utf-8-sig")).get("properties", {})
+        for name, prop in properties.items():
+            prop = prop.get("items", prop) if prop.get("type") == "array" else prop
+            if "enum" in prop:
+                yield path.name.split(".")[0], name, prop
+
+
+def test_schema_enums_match_constants_json():
+    consts = get_constants()
+    expected = {
+        ("create_expense", "category"): (consts.expense.categories, consts.expense.default_category),
+        ("create_income", "category"): (consts.income.categories, consts.income.default_category),
+        ("create_meal", "meal_type"): (consts.meal.types, None),
+        ("create_task", "priority"): (consts.task.priority, consts.task.default_priority),
+        ("update_task", "priority"): (consts.task.priority, None),
+        ("update_task", "status"): (consts.task.status, None),
+        ("search_tasks", "status"): (consts.task.status, None),
+    }
+
+    seen = set()
+    for tool_name, param, prop in _schema_enums():
+        seen.add((tool_name, param))
+        if param == "source":
+            values, default = consts.sources, consts.defaults.source
+        elif (tool_name, param) == ("search_events", "types"):
+            # Transfers are not searchable, so this enum is a subset.
+            assert set(prop["enum"]) <= set(consts.event_types)
+            continue
+        else:
+            assert (tool_name, param) in expected, f"{tool_name}.{param} enum has no constants.json source"
+            values, default = expected[(tool_name, param)]
+        assert prop["enum"] == values, f"{tool_name}.{param}"
+        if "default" in prop:
+            assert prop["default"] == default, f"{tool_name}.{param} default"
+
+    assert set(expected) <= seen
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from api.db.connection import ToolError
+from api.services.orchestrator_service import OrchestratorService
+
+
+def _event_row(event_id: int) -> dict:
+    return {
+        "id": event_id,
+        "type": "expense",
+        "happened_at": "2026-03-01T12:00:00+08:00",
+        "tags_json": "[]",
+        "data_json": json.dumps({"amount": 10}),
+        "source": "chat_text",
+        "confidence": 0.8,
+        "commit_id": f"c-{event_id}",
+        "created_at": "2026-03-01T12:00:00+08:00",
+        "updated_at": "2026-03-01T12:00:00+08:00",
+        "is_deleted": 0,
+    }
+
+
+class _Result:
+    def __init__(self, rows: list[dict]) -> None:
+        self._rows = rows
+
+    def fetchall(self) -> list[dict]:
+        return self._rows
+
+
+class _Conn:
+    """Just enough of DBConnection for the bulk soft delete of events."""
+
+    def __init__(self, events: dict[int, dict]) -> None:
+        self.events = events
+        self.committed = False
+        self.rolled_back = False
+
+    def execute(self, sql: str, params=()):
+        assert sql.startswith("UPDATE events SET is_deleted")
+        is_deleted, updated_at, ids, _ = params
+        rows = []
+        for event_id in ids:
+            row = self.events.get(event_id)
+            if row is not None and row["is_deleted"] != is_deleted:
+                row.update(is_deleted=is_deleted, updated_at=updated_at)
+                rows.append(dict(row))
+        return _Result(rows)
+
+    def commit(self) -> None:
+        self.committed = True
+
+    def rollback(self) -> None:
+        self.rolled_back = True
+
+
+class _Repo:
+    def __init__(self, conn: _Conn, event_ids: list[int]) -> None:
+        self._conn = conn
+        self._commits = [
+            {"tool_name": "create_expense", "result_json": json.dumps({"event_id": event_id})}
+            for event_id in event_ids
+        ]
+
+    def get_commits_by_undo_token(self, undo_token: str) -> list[dict]:
+        return self._commits
+
+
+def test_undo_skips_records_already_deleted_or_missing():
+    conn = _Conn({1: _event_row(1), 2: {**_event_row(2), "is_deleted": 1}})
+    service = OrchestratorService(_Repo(conn, [1, 2, 3]))
+
+    result = service.undo("u-1")
+
+    assert [item["event"]["event_id"] for item in result["undone"]] == [1]
+    assert result["skipped"] == [
+        {"tool_name": "create_expense", "event_id": 2},
+        {"tool_name": "create_expense", "event_id": 3},
+    ]
+    assert conn.committed and conn.events[1]["is_deleted"] == 1
+
+
+def test_undo_fails_when_nothing_is_left_to_undo():
+    conn = _Conn({2: {**_event_row(2), "is_deleted": 1}})
+    service = OrchestratorService(_Repo(conn, [2, 3]))
+
+    with pytest.raises(ToolError) as excinfo:
+        service.undo("u-1")
+
+    assert excinfo.value.code == "not_found"
+    assert conn.rolled_back and not conn.committed
@@ -4,6 +4,7 @@ from typing import Any, Iterable, Optional
 
 from api.core.constants_loader import get_constants
 from api.db.connection import (
+    DBConnection,
     ToolError,
     ensure_iso8601,
     ensure_tables,
@@ -12,15 +13,14 @@ from api.db.connection import (
     normalize_tags,
     require_enum,
     require_non_empty_str,
-    require_number_in_range,
-    require_positive_number,
+    use_connection,
 )
 from api.repositories.events_repo import EventRepository
 from api.repositories.accounts_repo import AccountsRepository
 from api.services.accounts_service import AccountsService
 from api.services.events_service import EventService
 
-def create_expense(
+def _create_expense(
     *,
     amount: Any,
     currency: Optional[str] = None,
@@ -33,19 +33,14 @@ def create_expense(
     confidence: Optional[float] = None,
     idempotency_key: Optional[str] = None,
     commit_id: Optional[str] = None,
+    conn: Optional[DBConnection] = None,
 ) -> dict[str, Any]:
-    """Create an expense event."""
+    """Create an expense event from arguments already checked by the tool registry."""
     consts = get_constants()
-    amt = require_positive_number(amount, "amount")
-    cat = require_enum(
-        category or consts.expense.default_category,
-        "category",
-        consts.expense.categories,
-    )
-    if note is not None and not isinstance(note, str):
-        raise ToolError("invalid_param", "note must be string or null")
+    amt = float(amount)
+    cat = (category or consts.expense.default_category).strip()
     currency_value = currency or consts.defaults.currency
-    if not isinstance(currency_value, str) or not currency_value.strip():
+    if not currency_value.strip():
         raise ToolError("invalid_param", "currency must be non-empty string")
 
     data = {
@@ -56,18 +51,14 @@ def create_expense(
     }
     happened_at_iso = normalize_iso8601(happened_at)
     tags_list = normalize_tags(tags)
-    src = require_enum(source or consts.defaults.source, "source", consts.sources)
-    conf_value = confidence if confidence is not None else consts.defaults.confidence
-    conf = require_number_in_range(conf_value, "confidence", 0.0, 1.0)
+    src = (source or consts.defaults.source).strip()
+    conf = float(confidence if confidence is not None else consts.defaults.confidence)
 
-    with get_connection() as conn:
-        ensure_tables(conn)
+    with use_connection(conn) as db:
         if account_id is not None:
-            if not isinstance(account_id, int) or account_id <= 0:
-                raise ToolError("invalid_param", "account_id must be positive integer")
-            AccountsService(AccountsRepository(conn)).get_account(account_id)
+            AccountsService(AccountsRepository(db)).get_account(account_id)
             data["account_id"] = account_id
-        service = EventService(EventRepository(conn))
+        service = EventService(EventRepository(db))
         return service.create_event(
             event_type="expense",
             data=data,
@@ -80,7 +71,7 @@ def create_expense(
         )
 
 
-def create_income(
+def _create_income(
     *,
     amount: Any,
     currency: Optional[str] = None,
@@ -93,19 +84,14 @@ def create_income(
     confidence: Optional[float] = None,
     idempotency_key: Optional[str] = None,
     commit_id: Optional[str] = None,
+    conn: Optional[DBConnection] = None,
 ) -> dict[str, Any]:
-    """Create an income event."""
+    """Create an income event from arguments already checked by the tool registry."""
     consts = get_constants()
-    amt = require_positive_number(amount, "amount")
-    cat = require_enum(
-        category or consts.income.default_category,
-        "category",
-        consts.income.categories,
-    )
-    if note is not None and not isinstance(note, str):
-        raise ToolError("invalid_param", "note must be string or null")
+    amt = float(amount)
+    cat = (category or consts.income.default_category).strip()
     currency_value = currency or consts.defaults.currency
-    if not isinstance(currency_value, str) or not currency_value.strip():
+    if not currency_value.strip():
         raise ToolError("invalid_param", "currency must be non-empty string")
 
     data = {
@@ -116,18 +102,14 @@ def create_income(
     }
     happened_at_iso = normalize_iso8601(happened_at)
     tags_list = normalize_tags(tags)
-    src = require_enum(source or consts.defaults.source, "source", consts.sources)
-    conf_value = confidence if confidence is not None else consts.defaults.confidence
-    conf = require_number_in_range(conf_value, "confidence", 0.0, 1.0)
+    src = (source or consts.defaults.source).strip()
+    conf = float(confidence if confidence is not None else consts.defaults.confidence)
 
-    with get_connection() as conn:
-        ensure_tables(conn)
+    with use_connection(conn) as db:
         if account_id is not None:
-            if not isinstance(account_id, int) or account_id <= 0:
-                raise ToolError("invalid_param", "account_id must be positive integer")
-            AccountsService(AccountsRepository(conn)).get_account(account_id)
+            AccountsService(AccountsRepository(db)).get_account(account_id)
             data["account_id"] = account_id
-        service = EventService(EventRepository(conn))
+        service = EventService(EventRepository(db))
         return service.create_event(
             event_type="income",
             data=data,
@@ -140,7 +122,7 @@ def create_income(
         )
 
 
-def create_transfer(
+def _create_transfer(
     *,
     amount: Any,
     from_account_id: int,
@@ -153,31 +135,24 @@ def create_transfer(
     confidence: Optional[float] = None,
     idempotency_key: Optional[str] = None,
     commit_id: Optional[str] = None,
+    conn: Optional[DBConnection] = None,
 ) -> dict[str, Any]:
-    """Create a transfer event."""
+    """Create a transfer event from arguments already checked by the tool registry."""
     consts = get_constants()
-    amt = require_positive_number(amount, "amount")
-    if not isinstance(from_account_id, int) or from_account_id <= 0:
-        raise ToolError("invalid_param", "from_account_id must be positive integer")
-    if not isinstance(to_account_id, int) or to_account_id <= 0:
-        raise ToolError("invalid_param", "to_account_id must be positive integer")
+    amt = float(amount)
     if from_account_id == to_account_id:
         raise ToolError("invalid_param", "from_account_id and to_account_id must be different")
-    if note is not None and not isinstance(note, str):
-        raise ToolError("invalid_param", "note must be string or null")
     currency_value = currency or consts.defaults.currency
-    if not isinstance(currency_value, str) or not currency_value.strip():
+    if not currency_value.strip():
         raise ToolError("invalid_param", "currency must be non-empty string")
 
     happened_at_iso = normalize_iso8601(happened_at)
     tags_list = normalize_tags(tags)
-    src = require_enum(source or consts.defaults.source, "source", consts.sources)
-    conf_value = confidence if confidence is not None else consts.defaults.confidence
-    conf = require_number_in_range(conf_value, "confidence", 0.0, 1.0)
+    src = (source or consts.defaults.source).strip()
+    conf = float(confidence if confidence is not None else consts.defaults.confidence)
 
-    with get_connection() as conn:
-        ensure_tables(conn)
-        accounts = AccountsService(AccountsRepository(conn))
+    with use_connection(conn) as db:
+        accounts = AccountsService(AccountsRepository(db))
         from_account = accounts.get_account(from_account_id)
         to_account = accounts.get_account(to_account_id)
         data = {
@@ -189,7 +164,7 @@ def create_transfer(
             "to_account_name": to_account["name"],
             "note": note,
         }
-        service = EventService(EventRepository(conn))
+        service = EventService(EventRepository(db))
         return service.create_event(
             event_type="transfer",
             data=data,
@@ -202,7 +177,7 @@ def create_transfer(
         )
 
 
-def create_lifelog(
+def _create_lifelog(
     *,
     text: Any = None,
     images: Optional[Iterable[str]] = None,
@@ -212,8 +187,9 @@ def create_lifelog(
     confidence: Optional[float] = None,
     idempotency_key: Optional[str] = None,
     commit_id: Optional[str] = None,
+    conn: Optional[DBConnection] = None,
 ) -> dict[str, Any]:
-    """Create a lifelog event."""
+    """Create a lifelog event from arguments already checked by the tool registry."""
     consts = get_constants()
     text_value = None
     if text is not None:
@@ -221,10 +197,8 @@ def create_lifelog(
 
     images_list: list[str] = []
     if images is not None:
-        if isinstance(images, str) or not isinstance(images, Iterable):
-            raise ToolError("invalid_param", "images must be list of base64 strings")
         for item in images:
-            if not isinstance(item, str) or not item.strip():
+            if not item.strip():
                 raise ToolError("invalid_param", "images must be list of base64 strings")
             images_list.append(item.strip())
 
@@ -238,13 +212,11 @@ def create_lifelog(
         data["images"] = images_list
     happened_at_iso = normalize_iso8601(happened_at)
     tags_list = normalize_tags(tags)
-    src = require_enum(source or consts.defaults.source, "source", consts.sources)
-    conf_value = confidence if confidence is not None else consts.defaults.confidence
-    conf = require_number_in_range(conf_value, "confidence", 0.0, 1.0)
+    src = (source or consts.defaults.source).strip()
+    conf = float(confidence if confidence is not None else consts.defaults.confidence)
 
-    with get_connection() as conn:
-        ensure_tables(conn)
-        service = EventService(EventRepository(conn))
+    with use_connection(conn) as db:
+        service = EventService(EventRepository(db))
         return service.create_event(
             event_type="lifelog",
             data=data,
@@ -257,7 +229,7 @@ def create_lifelog(
         )
 
 
-def create_meal(
+def _create_meal(
     *,
     meal_type: str,
     items: Iterable[str],
@@ -267,25 +239,20 @@ def create_meal(
     confidence: Optional[float] = None,
     idempotency_key: Optional[str] = None,
     commit_id: Optional[str] = None,
+    conn: Optional[DBConnection] = None,
 ) -> dict[str, Any]:
-    """Create a meal event."""
+    """Create a meal event from arguments already checked by the tool registry."""
     consts = get_constants()
-    meal = require_enum(meal_type, "meal_type", consts.meal.types)
-    if isinstance(items, str) or not isinstance(items, Iterable):
-        raise ToolError("invalid_param", "items must be list of strings")
+    meal = meal_type.strip()
     items_list = [require_non_empty_str(i, "item") for i in items]
-    if len(items_list) == 0:
-        raise ToolError("invalid_param", "items must be non-empty list")
     data = {"meal_type": meal, "items": items_list}
     happened_at_iso = normalize_iso8601(happened_at)
     tags_list = normalize_tags(tags)
-    src = require_enum(source or consts.defaults.source, "source", consts.sources)
-    conf_value = confidence if confidence is not None else consts.defaults.confidence
-    conf = require_number_in_range(conf_value, "confidence", 0.0, 1.0)
+    src = (source or consts.defaults.source).strip()
+    conf = float(confidence if confidence is not None else consts.defaults.confidence)
 
-    with get_connection() as conn:
-        ensure_tables(conn)
-        service = EventService(EventRepository(conn))
+    with use_connection(conn) as db:
+        service = EventService(EventRepository(db))
         return service.create_event(
             event_type="meal",
             data=data,
@@ -298,10 +265,10 @@ def create_meal(
         )
 
 
-def create_mood(
+def _create_mood(
     *,
     mood: Any,
-    intensity: float = 0.5,
+    intensity: Optional[float] = None,
     topic: Optional[str] = None,
     note: Optional[str] = None,
     happened_at: Optional[str] = None,
@@ -310,15 +277,12 @@ def create_mood(
     confidence: Optional[float] = None,
     idempotency_key: Optional[str] = None,
     commit_id: Optional[str] = None,
+    conn: Optional[DBConnection] = None,
 ) -> dict[str, Any]:
-    """Create a mood event."""
+    """Create a mood event from arguments already checked by the tool registry."""
     consts = get_constants()
     mood_value = require_non_empty_str(mood, "mood")
-    inten = require_number_in_range(intensity, "intensity", 0.0, 1.0)
-    if topic is not None and not isinstance(topic, str):
-        raise ToolError("invalid_param", "topic must be string or null")
-    if note is not None and not isinstance(note, str):
-        raise ToolError("invalid_param", "note must be string or null")
+    inten = float(intensity if intensity is not None else 0.5)
     data = {
         "mood": mood_value,
         "intensity": inten,
@@ -327,13 +291,11 @@ def create_mood(
     }
     happened_at_iso = normalize_iso8601(happened_at)
     tags_list = normalize_tags(tags)
-    src = require_enum(source or consts.defaults.source, "source", consts.sources)
-    conf_value = confidence if confidence is not None else consts.defaults.confidence
-    conf = require_number_in_range(conf_value, "confidence", 0.0, 1.0)
+    src = (source or consts.defaults.source).strip()
+    conf = float(confidence if confidence is not None else consts.defaults.confidence)
 
-    with get_connection() as conn:
-        ensure_tables(conn)
-        service = EventService(EventRepository(conn))
+    with use_connection(conn) as db:
+        service = EventService(EventRepository(db))
         return service.create_event(
             event_type="mood",
             data=data,
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import json
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from api.db.connection import ToolError
+from api.tools.events import (
+    _create_expense,
+    _create_income,
+    _create_lifelog,
+    _create_meal,
+    _create_mood,
+    _create_transfer,
+)
+from api.tools.tasks import _create_task
+
+TOOL_SCHEMAS_DIR = Path(__file__).resolve().parents[5] / "packages" / "schemas" / "tools"
+
+# Tools a confirmed draft can run, with the table their records land in.
+# The handlers skip their own argument checks; reach them via get_tool().run.
+_HANDLERS: dict[str, tuple[Callable[..., dict[str, Any]], str]] = {
+    "create_expense": (_create_expense, "event"),
+    "create_income": (_create_income, "event"),
+    "create_transfer": (_create_transfer, "event"),
+    "create_lifelog": (_create_lifelog, "event"),
+    "create_meal": (_create_meal, "event"),
+    "create_mood": (_create_mood, "event"),
+    "create_task": (_create_task, "task"),
+}
+
+# Python types accepted for each JSON schema type. bool is an int subclass,
+# so it only passes where "boolean" is listed.
+_JSON_TYPES: dict[str, tuple[type, ...]] = {
+    "string": (str,),
+    "number": (int, float),
+    "integer": (int,),
+    "boolean": (bool,),
+    "array": (list, tuple),
+    "object": (dict,),
+    "null": (type(None),),
+}
+
+
+def _python_types(json_types: frozenset[str]) -> tuple[type, ...]:
+    return tuple({t for name in json_types for t in _JSON_TYPES[name]})
+
+
+def _type_ok(value: Any, types: tuple[type, ...], allows_bool: bool) -> bool:
+    return isinstance(value, types) and (allows_bool or type(value) is not bool)
+
+
+@dataclass(frozen=True)
+class ToolParam:
+    name: str
+    required: bool
+    types: frozenset[str]
+    python_types: tuple[type, ...]
+    enum: Optional[frozenset[str]] = None
+    # The schema's enum order, for error messages.
+    enum_order: tuple[str, ...] = ()
+    has_default: bool = False
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    exclusive_minimum: Optional[float] = None
+    min_items: Optional[int] = None
+    max_items: Optional[int] = None
+    item_types: Optional[frozenset[str]] = None
+    item_python_types: tuple[type, ...] = ()
+    # Precomputed so check() skips the rules a parameter does not have.
+    allows_bool: bool = False
+    has_bounds: bool = False
+    has_item_rules: bool = False
+
+    def check(self, value: Any) -> None:
+        name = self.name
+        if not _type_ok(value, self.python_types, self.allows_bool):
+            raise ToolError("invalid_param", f"{name} must be {' or '.join(sorted(self.types))}")
+        if self.enum is not None and isinstance(value, str) and value.strip() not in self.enum:
+            raise ToolError("invalid_param", f"{name} must be one of {list(self.enum_order)}")
+        if self.has_bounds and isinstance(value, (int, float)) and type(value) is not bool:
+            if self.exclusive_minimum is not None and value <= self.exclusive_minimum:
+                raise ToolError("invalid_param", f"{name} must be > {self.exclusive_minimum}")
+            if self.minimum is not None and value < self.minimum:
+                raise ToolError("invalid_param", f"{name} must be >= {self.minimum}")
+            if self.maximum is not None and value > self.maximum:
+                raise ToolError("invalid_param", f"{name} must be <= {self.maximum}")
+        if self.has_item_rules and isinstance(value, (list, tuple)):
+            if self.min_items is not None and len(value) < self.min_items:
+                raise ToolError("invalid_param", f"{name} must have at least {self.min_items} items")
+            if self.max_items is not None and len(value) > self.max_items:
+                raise ToolError("invalid_param", f"{name} must have at most {self.max_items} items")
+            if self.item_types is not None:
+                allows_bool = "boolean" in self.item_types
+                for item in value:
+                    if not _type_ok(item, self.item_python_types, allows_bool):
+                        raise ToolError("invalid_param", f"{name} items must be {' or '.join(sorted(self.item_types))}")
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """A draft tool: its handler, the table it writes and its argument schema."""
+
+    name: str
+    handler: Callable[..., dict[str, Any]]
+    record: str
+    params: tuple[ToolParam, ...]
+    param_names: frozenset[str]
+    # additionalProperties: false, so unknown parameters are rejected.
+    strict: bool
+    # Prompt form, e.g. create_task(title, due_at?, ...), in schema order.
+    signature: str
+
+    def validate(self, arguments: dict[str, Any]) -> None:
+        """Check arguments against the tool schema.
+
+        This is the tools' argument validation: unknown or missing
+        parameters, wrong JSON types, values outside an enum and
+        out-of-range numbers are rejected here, and the handlers only
+        normalize (times, tags, defaults) and check what a schema cannot
+        express. Optional parameters that are null, or empty strings where a
+        string parameter has a default, are left to the tool's defaulting.
+        """
+        if self.strict:
+            unknown = [key for key in arguments if key not in self.param_names]
+            if unknown:
+                raise ToolError("invalid_param", "unexpected parameters", {"tool_name": self.name, "params": unknown})
+        for param in self.params:
+            value = arguments.get(param.name)
+            if value is None:
+                if param.required:
+                    raise ToolError("invalid_param", f"{param.name} is required", {"tool_name": self.name})
+                continue
+            if value == "" and param.has_default and "string" in param.types:
+                continue
+            param.check(value)
+
+    def run(self, arguments: dict[str, Any], **context: Any) -> dict[str, Any]:
+        """Validate arguments and call the tool; context is commit_id / conn.
+
+        Handlers assume validated arguments, so call them through here.
+        """
+        self.validate(arguments)
+        return self.handler(**arguments, **context)
+
+
+def _compile_param(name: str, schema: dict[str, Any], required: bool) -> ToolParam:
+    raw_type = schema.get("type", list(_JSON_TYPES))
+    types = frozenset([raw_type] if isinstance(raw_type, str) else raw_type)
+    enum = schema.get("enum")
+    items = schema.get("items") if isinstance(schema.get("items"), dict) else None
+    item_type = items.get("type") if items else None
+    item_types = frozenset([item_type] if isinstance(item_type, str) else item_type) if item_type else None
+    bounds = (schema.get("minimum"), schema.get("maximum"), schema.get("exclusiveMinimum"))
+    item_rules = (schema.get("minItems"), schema.get("maxItems"), item_types)
+    return ToolParam(
+        name=name,
+        required=required,
+        types=types,
+        python_types=_python_types(types),
+        enum=frozenset(enum) if enum is not None else None,
+        enum_order=tuple(enum or ()),
+        has_default="default" in schema,
+        minimum=schema.get("minimum"),
+        maximum=schema.get("maximum"),
+        exclusive_minimum=schema.get("exclusiveMinimum"),
+        min_items=schema.get("minItems"),
+        max_items=schema.get("maxItems"),
+        item_types=item_types,
+        item_python_types=_python_types(item_types) if item_types else (),
+        allows_bool="boolean" in types,
+        has_bounds=any(b is not None for b in bounds),
+        has_item_rules=any(r is not None for r in item_rules),
+    )
+
+
+def _load_spec(name: str, handler: Callable[..., dict[str, Any]], record: str) -> ToolSpec:
+    path = TOOL_SCHEMAS_DIR / f"{name}.schema.json"
+    schema = json.loads(path.read_text(encoding="utf-8-sig"))
+    required = set(schema.get("required", []))
+    params = tuple(
+        _compile_param(param, prop, param in required) for param, prop in schema.get("properties", {}).items()
+    )
+    return ToolSpec(
+        name=name,
+        handler=handler,
+        record=record,
+        params=params,
+        param_names=frozenset(p.name for p in params),
+        strict=schema.get("additionalProperties") is False,
+        signature=f"{name}(" + ", ".join(p.name if p.required else f"{p.name}?" for p in params) + ")",
+    )
+
+
+_registry: Optional[dict[str, ToolSpec]] = None
+_registry_lock = threading.Lock()
+
+
+def get_tool_registry() -> dict[str, ToolSpec]:
+    """Draft tools by name, with schemas from packages/schemas/tools compiled once."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = {name: _load_spec(name, handler, record) for name, (handler, record) in _HANDLERS.items()}
+    return _registry
+
+
+def get_tool(tool_name: str) -> ToolSpec:
+    spec = get_tool_registry().get(tool_name)
+    if spec is None:
+        raise ToolError("invalid_tool", "unsupported tool", {"tool_name": tool_name})
+    return spec
+
+
+__all__ = ["TOOL_SCHEMAS_DIR", "ToolParam", "ToolSpec", "get_tool", "get_tool_registry"]
@@ -5,6 +5,7 @@ from typing import Any, Iterable, Optional
 
 from api.core.constants_loader import get_constants
 from api.db.connection import (
+    DBConnection,
     ToolError,
     ensure_iso8601,
     ensure_tables,
@@ -14,6 +15,7 @@ from api.db.connection import (
     now_iso8601,
     require_enum,
     require_non_empty_str,
+    use_connection,
 )
 from api.repositories.tasks_repo import TaskRepository
 from api.services.tasks_service import TaskService
@@ -27,7 +29,7 @@ def _parse_iso8601(value: str) -> datetime:
         raise ToolError("invalid_time", "ISO8601 time must include offset", {"value": value})
     return dt
 
-def create_task(
+def _create_task(
     *,
     title: Any,
     due_at: Optional[str] = None,
@@ -38,19 +40,12 @@ def create_task(
     note: Optional[str] = None,
     idempotency_key: Optional[str] = None,
     commit_id: Optional[str] = None,
+    conn: Optional[DBConnection] = None,
 ) -> dict[str, Any]:
-    """Create a task."""
+    """Create a task from arguments already checked by the tool registry."""
     consts = get_constants()
     title_value = require_non_empty_str(title, "title")
-    pr = require_enum(
-        priority or consts.task.default_priority,
-        "priority",
-        consts.task.priority,
-    )
-    if project is not None and not isinstance(project, str):
-        raise ToolError("invalid_param", "project must be string or null")
-    if note is not None and not isinstance(note, str):
-        raise ToolError("invalid_param", "note must be string or null")
+    pr = (priority or consts.task.default_priority).strip()
 
     due_at_iso = ensure_iso8601(due_at)
     remind_at_iso = ensure_iso8601(remind_at)
@@ -64,9 +59,8 @@ def create_task(
                 pass
     tags_list = normalize_tags(tags)
 
-    with get_connection() as conn:
-        ensure_tables(conn)
-        service = TaskService(TaskRepository(conn))
+    with use_connection(conn) as db:
+        service = TaskService(TaskRepository(db))
         return service.create_task(
             title=title_value,
             status=consts.task.default_status,
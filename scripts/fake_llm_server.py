@@ -0,0 +1,186 @@
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+ROUTER_DECISION = {
+    "intent": "expense",
+    "confidence": 0.9,
+    "need_clarification": False,
+    "clarify_question": None,
+    "reply_to_user": "好，这笔支出我先帮你整理成草稿。",
+    "tool_calls": [
+        {"name": "create_expense", "arguments": {"amount": 25, "category": "food", "note": "咖啡"}}
+    ],
+    "cards": [
+        {
+            "card_id": "card_1",
+            "type": "expense",
+            "status": "draft",
+            "title": "支出",
+            "subtitle": "25 CNY",
+            "data": {"amount": 25, "category": "food", "note": "咖啡"},
+            "actions": [],
+        }
+    ],
+}
+
+
+class Options:
+    delay_ms: int = 0
+    jitter_ms: int = 0
+    fail_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: str = "1"
+    name: str = "fake"
+    chunk_chars: int = 8
+    chunk_delay_ms: int = 30
+
+
+def _reply_for(payload: dict[str, Any]) -> str:
+    messages = payload.get("messages") or []
+    system = ""
+    if messages and isinstance(messages[0].get("content"), str):
+        system = messages[0]["content"]
+    if "structured intent router" in system and "Batch mode:" in system:
+        return json.dumps({"items": [{"index": i, "decision": ROUTER_DECISION} for i in _batch_indexes(messages)]})
+    if "structured intent router" in system:
+        return json.dumps(ROUTER_DECISION, ensure_ascii=False)
+    if "intent classifier" in system:
+        return "action"
+    return f"[{Options.name}] 你好！"
+
+
+def _batch_indexes(messages: list[dict[str, Any]]) -> list[int]:
+    content = messages[-1].get("content") if messages else None
+    if isinstance(content, list):
+        content = next((part.get("text") for part in content if part.get("type") == "text"), None)
+    try:
+        items = json.loads(content or "[]")
+    except json.JSONDecodeError:
+        return []
+    return [item.get("index", i) for i, item in enumerate(items) if isinstance(item, dict)]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/models"):
+            self._send(200, {"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+            return
+        self._send(404, {"error": {"message": "not found"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": "not found"}})
+            return
+        try:
+            payload = json.loads(raw.decode("utf-8"))
+        except json.JSONDecodeError:
+            self._send(400, {"error": {"message": "invalid json"}})
+            return
+
+        delay = Options.delay_ms + random.randint(0, max(Options.jitter_ms, 0))
+        time.sleep(delay / 1000.0)
+        if random.random() < Options.fail_rate:
+            self._send(500, {"error": {"message": "injected failure"}})
+            return
+        if random.random() < Options.rate_limit_rate:
+            self._send(429, {"error": {"message": "rate limited"}}, {"Retry-After": Options.retry_after})
+            return
+
+        content = _reply_for(payload)
+        if payload.get("stream"):
+            self._send_stream(payload.get("model"), content)
+            return
+        self._send(
+            200,
+            {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "model": payload.get("model"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            },
+        )
+
+    def log_message(self, format: str, *args: Any) -> None:
+        print(f"[{Options.name}] {self.address_string()} {format % args}")
+
+    def _send_stream(self, model: Any, content: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        step = max(Options.chunk_chars, 1)
+        for start in range(0, len(content), step):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[start : start + step]}, "finish_reason": None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            time.sleep(Options.chunk_delay_ms / 1000.0)
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send(self, status: int, body: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in for LLM testing")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--name", default="fake")
+    parser.add_argument("--delay-ms", type=int, default=0)
+    parser.add_argument("--jitter-ms", type=int, default=0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--retry-after", default="1", help="Retry-After header sent with 429s")
+    parser.add_argument("--chunk-chars", type=int, default=8, help="characters per streamed chunk")
+    parser.add_argument("--chunk-delay-ms", type=int, default=30, help="pause between streamed chunks")
+    args = parser.parse_args()
+
+    Options.name = args.name
+    Options.delay_ms = args.delay_ms
+    Options.jitter_ms = args.jitter_ms
+    Options.fail_rate = args.fail_rate
+    Options.rate_limit_rate = args.rate_limit_rate
+    Options.retry_after = args.retry_after
+    Options.chunk_chars = args.chunk_chars
+    Options.chunk_delay_ms = args.chunk_delay_ms
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    print(f"Fake LLM '{args.name}' listening on http://127.0.0.1:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
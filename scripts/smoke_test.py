@@ -5,9 +5,10 @@ from zoneinfo import ZoneInfo
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "apps", "api", "src"))
 
-from api.tools.events import create_expense, search_events
+from api.tools.events import search_events
 from api.tools.notifications import create_notification_for_task, list_notifications, mark_notification_read
-from api.tools.tasks import complete_task, create_task, list_tasks_overdue, list_tasks_today
+from api.tools.registry import get_tool
+from api.tools.tasks import complete_task, list_tasks_overdue, list_tasks_today
 
 
 def main() -> None:
@@ -15,8 +16,9 @@ def main() -> None:
 
     # create_expense idempotency
     idem_key = "expense-123"
-    e1 = create_expense(amount=12.5, category="food", idempotency_key=idem_key)
-    e2 = create_expense(amount=12.5, category="food", idempotency_key=idem_key)
+    expense = {"amount": 12.5, "category": "food", "idempotency_key": idem_key}
+    e1 = get_tool("create_expense").run(expense)
+    e2 = get_tool("create_expense").run(expense)
     assert e1["event_id"] == e2["event_id"], "idempotency failed"
 
     # search_events
@@ -25,7 +27,7 @@ def main() -> None:
 
     # create_task + complete_task
     due = (datetime.now(ZoneInfo("Asia/Shanghai")) + timedelta(hours=1)).isoformat()
-    t1 = create_task(title="Smoke Task", due_at=due)
+    t1 = get_tool("create_task").run({"title": "Smoke Task", "due_at": due})
     t1_done = complete_task(t1["task_id"])
     assert t1_done["status"] == "done", "complete_task failed"
 